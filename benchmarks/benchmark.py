@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+# Times VBA extraction, the diff stage and end-to-end git diff on synthetic workbooks and stores
+# the results as JSON (benchmarks/results/<date>-<commit>.json), e.g.
+#
+#   python benchmarks/benchmark.py --scenario small --scenario medium
+#   python benchmarks/benchmark.py --compare benchmarks/results/2026-01-01-abc1234.json
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+import statistics
+from io import BytesIO
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(os.path.dirname(BENCHMARKS_DIR), 'src')
+sys.path.insert(0, SRC_DIR)
+sys.path.insert(0, os.path.join(SRC_DIR, 'tests'))
+import diff
+import algorithms
+import synthetic
+
+RESULTS_VERSION = 1
+# (module count, lines per module, sheet payload in bytes)
+SCENARIOS = {
+    'small': (5, 200, 100 * 1024),
+    'medium': (20, 1000, 1024 * 1024),
+    'large': (50, 5000, 10 * 1024 * 1024),
+}
+DEFAULT_SCENARIOS = ('small', 'medium')
+# a metric this much slower than in the baseline is reported as regression
+REGRESSION_THRESHOLD = 1.1
+
+
+def measure(function, repeat):
+    # an untimed first run warms up imports and the file system cache
+    function()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return {'min': min(timings), 'median': statistics.median(timings)}
+
+
+def git(repository, *args, env=None):
+    return subprocess.run(['git'] + list(args), cwd=repository, env=env, check=True, stdout=subprocess.PIPE,
+                          stderr=subprocess.PIPE).stdout
+
+
+def create_repository(path, old_workbook, new_workbook, name):
+    # two commits of the same workbook, diffed by the git-xl-diff of this checkout
+    os.makedirs(path)
+    git(path, 'init', '-q')
+    git(path, 'config', 'user.name', 'git-xl benchmark')
+    git(path, 'config', 'user.email', 'benchmark@git-xl')
+    command = f'"{sys.executable}" "{os.path.join(SRC_DIR, "diff.py")}"'
+    git(path, 'config', 'diff.xl.command', command)
+    with open(os.path.join(path, '.gitattributes'), 'w') as f:
+        f.write('\n'.join('*.' + extension + ' diff=xl' for extension in synthetic.FORMATS) + '\n')
+    for workbook in (old_workbook, new_workbook):
+        shutil.copy(workbook, os.path.join(path, name))
+        git(path, 'add', '-A')
+        git(path, 'commit', '-q', '-m', os.path.basename(workbook))
+
+
+def run_scenario(scenario, workbook_format, repeat, work_dir):
+    module_count, line_count, payload_size = SCENARIOS[scenario]
+    old_modules = synthetic.make_modules(module_count, line_count)
+    new_modules = synthetic.change_modules(old_modules)
+    name = f'Book1.{workbook_format}'
+    old_workbook = os.path.join(work_dir, f'{scenario}-old.{workbook_format}')
+    new_workbook = os.path.join(work_dir, f'{scenario}-new.{workbook_format}')
+    synthetic.write_workbook(old_workbook, old_modules, payload_size)
+    synthetic.write_workbook(new_workbook, new_modules, payload_size, seed=1)
+
+    timings = {'extract': measure(lambda: diff.get_vba(new_workbook), repeat)}
+    old, new = diff.get_modules(old_workbook), diff.get_modules(new_workbook)
+    for algorithm in algorithms.ALGORITHMS:
+        timings['diff.' + algorithm] = measure(
+            lambda: diff.print_diff(name, diff.iter_diffs(name, new, old, 3, algorithm), BytesIO()), repeat)
+    timings['diff.procedure'] = measure(
+        lambda: diff.print_diff(name, diff.get_diffs(name, new, old, 3, granularity='procedure'), BytesIO()), repeat)
+
+    repository = os.path.join(work_dir, f'{scenario}-{workbook_format}')
+    create_repository(repository, old_workbook, new_workbook, name)
+    cache_dir = os.path.join(work_dir, f'{scenario}-{workbook_format}-cache')
+    env = dict(os.environ, GIT_XL_CACHE_DIR=cache_dir, GIT_XL_CACHE_SIZE='0',
+               GIT_XL_DAEMON_SOCKET=os.path.join(work_dir, 'no-daemon.sock'))
+    timings['git_diff'] = measure(lambda: git(repository, 'diff', 'HEAD~1', 'HEAD', env=env), repeat)
+    env['GIT_XL_CACHE_SIZE'] = str(1024 ** 3)
+    git(repository, 'diff', 'HEAD~1', 'HEAD', env=env)
+    timings['git_diff.cached'] = measure(lambda: git(repository, 'diff', 'HEAD~1', 'HEAD', env=env), repeat)
+
+    return {
+        'scenario': scenario,
+        'format': workbook_format,
+        'modules': len(old_modules),
+        'lines_per_module': line_count,
+        'payload_size': payload_size,
+        'workbook_size': os.path.getsize(new_workbook),
+        'timings': timings,
+    }
+
+
+def get_commit():
+    try:
+        return git(SRC_DIR, 'rev-parse', '--short', 'HEAD').decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def compare(results, baseline):
+    # prints the ratio of every metric found in both runs, > 1 means slower than the baseline
+    baseline_results = {(result['scenario'], result['format']): result for result in baseline['results']}
+    regressions = 0
+    print(f'compared to {baseline["commit"]} ({baseline["date"]}), median times:')
+    for result in results['results']:
+        previous = baseline_results.get((result['scenario'], result['format']))
+        if not previous:
+            continue
+        for metric, timing in result['timings'].items():
+            if metric not in previous['timings']:
+                continue
+            ratio = timing['median'] / previous['timings'][metric]['median']
+            flag = '  <-- regression' if ratio > REGRESSION_THRESHOLD else ''
+            regressions += bool(flag)
+            print(f'  {result["scenario"]:8} {result["format"]:5} {metric:18} '
+                  f'{previous["timings"][metric]["median"]:9.4f}s -> {timing["median"]:9.4f}s  x{ratio:.2f}{flag}')
+    return regressions
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description='Benchmark git-xl on synthetic workbooks.')
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS),
+                        help=f'workbook size to benchmark (default: {", ".join(DEFAULT_SCENARIOS)})')
+    parser.add_argument('--format', action='append', choices=synthetic.FORMATS,
+                        help='workbook format to benchmark (default: all)')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per measurement (default: 5)')
+    parser.add_argument('--output', help='results file (default: benchmarks/results/<date>-<commit>.json)')
+    parser.add_argument('--compare', metavar='BASELINE', help='results file to compare against')
+    options = parser.parse_args(args)
+
+    commit = get_commit()
+    results = {
+        'version': RESULTS_VERSION,
+        'commit': commit,
+        'date': time.strftime('%Y-%m-%d'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repeat': options.repeat,
+        'results': [],
+    }
+    work_dir = tempfile.mkdtemp(prefix='git-xl-benchmark-')
+    try:
+        for scenario in options.scenario or DEFAULT_SCENARIOS:
+            for workbook_format in options.format or synthetic.FORMATS:
+                result = run_scenario(scenario, workbook_format, options.repeat, work_dir)
+                results['results'].append(result)
+                print(f'{scenario:8} {workbook_format:5} ' + '  '.join(
+                    f'{metric}={timing["median"]:.4f}s' for metric, timing in result['timings'].items()))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    output = options.output or os.path.join(BENCHMARKS_DIR, 'results', f'{results["date"]}-{commit}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f'results written to {output}')
+
+    if options.compare:
+        with open(options.compare) as f:
+            return 1 if compare(results, json.load(f)) else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
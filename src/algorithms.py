@@ -0,0 +1,322 @@
+from bisect import bisect_left
+from difflib import SequenceMatcher
+
+
+ALGORITHMS = ('difflib', 'myers', 'histogram')
+DEFAULT_ALGORITHM = 'difflib'
+# lines occurring more often than this are no anchors for the histogram diff, like in git
+MAX_CHAIN_LENGTH = 64
+# lower bound of the edit cost after which Myers settles for an approximate split, like in git
+MIN_MAX_COST = 256
+
+
+def intern_lines(a, b):
+    # map every distinct line to a small int, so the algorithms compare ints instead of strings
+    table = {}
+    return [table.setdefault(line, len(table)) for line in a], [table.setdefault(line, len(table)) for line in b]
+
+
+def trim(a, a_lo, a_hi, b, b_lo, b_hi, matches):
+    # strip the common prefix and suffix of a region, recording both as matches
+    start = a_lo
+    while a_lo < a_hi and b_lo < b_hi and a[a_lo] == b[b_lo]:
+        a_lo += 1
+        b_lo += 1
+    if a_lo > start:
+        matches.append((start, b_lo - (a_lo - start), a_lo - start))
+    end = a_hi
+    while a_lo < a_hi and b_lo < b_hi and a[a_hi - 1] == b[b_hi - 1]:
+        a_hi -= 1
+        b_hi -= 1
+    if a_hi < end:
+        matches.append((a_hi, b_hi, end - a_hi))
+    return a_lo, a_hi, b_lo, b_hi
+
+
+def middle_snake(a, a_lo, a_hi, b, b_lo, b_hi):
+    # Myers' linear space variant: run the O(ND) search from both ends until the paths overlap,
+    # returns the overlapping snake (x, y, u, v) relative to the region and the edit distance;
+    # for very different regions the search is cut short and the furthest reaching point is
+    # used as split point instead (returned as empty snake), which keeps the run time bounded
+    n = a_hi - a_lo
+    m = b_hi - b_lo
+    delta = n - m
+    odd = delta & 1
+    max_d = (n + m + 1) // 2
+    max_cost = max(MIN_MAX_COST, int((n + m) ** 0.5))
+    offset = max_d + 1
+    forward = [0] * (2 * offset + 1)
+    backward = [0] * (2 * offset + 1)
+    for d in range(max_d + 1):
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and forward[offset + k - 1] < forward[offset + k + 1]):
+                x = forward[offset + k + 1]
+            else:
+                x = forward[offset + k - 1] + 1
+            y = x - k
+            start_x, start_y = x, y
+            while x < n and y < m and a[a_lo + x] == b[b_lo + y]:
+                x += 1
+                y += 1
+            forward[offset + k] = x
+            if odd and -(d - 1) <= delta - k <= d - 1 and x + backward[offset + delta - k] >= n:
+                return start_x, start_y, x, y, 2 * d - 1
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and backward[offset + k - 1] < backward[offset + k + 1]):
+                x = backward[offset + k + 1]
+            else:
+                x = backward[offset + k - 1] + 1
+            y = x - k
+            start_x, start_y = x, y
+            while x < n and y < m and a[a_hi - 1 - x] == b[b_hi - 1 - y]:
+                x += 1
+                y += 1
+            backward[offset + k] = x
+            if not odd and -d <= delta - k <= d and x + forward[offset + delta - k] >= n:
+                return n - x, m - y, n - start_x, m - start_y, 2 * d
+        if d >= max_cost:
+            return furthest_point(forward, backward, offset, d, n, m) + (2 * d,)
+    raise AssertionError('no middle snake')
+
+
+def furthest_point(forward, backward, offset, d, n, m):
+    best = (-1, 0, 0)
+    for k in range(-d, d + 1, 2):
+        x = min(forward[offset + k], n, m + k)
+        if 0 <= x - k and x + x - k > best[0]:
+            best = (x + x - k, x, x - k)
+        x = min(backward[offset + k], n, m + k)
+        if 0 <= x - k and x + x - k > best[0]:
+            best = (x + x - k, n - x, m - (x - k))
+    _, x, y = best
+    return x, y, x, y
+
+
+def myers_matches(a, a_lo, a_hi, b, b_lo, b_hi, matches):
+    a_lo, a_hi, b_lo, b_hi = trim(a, a_lo, a_hi, b, b_lo, b_hi, matches)
+    if a_lo == a_hi or b_lo == b_hi:
+        return
+    x, y, u, v, d = middle_snake(a, a_lo, a_hi, b, b_lo, b_hi)
+    if (x, y) == (u, v) and (x, y) in ((0, 0), (a_hi - a_lo, b_hi - b_lo)):
+        # an approximate split that would not make progress, leave the region unmatched
+        return
+    if d > 1:
+        myers_matches(a, a_lo, a_lo + x, b, b_lo, b_lo + y, matches)
+        if u > x:
+            matches.append((a_lo + x, b_lo + y, u - x))
+        myers_matches(a, a_lo + u, a_hi, b, b_lo + v, b_hi, matches)
+    else:
+        # a single insertion or deletion: the shorter side is matched in full
+        i, j = a_lo, b_lo
+        while i < a_hi and j < b_hi:
+            if a[i] == b[j]:
+                matches.append((i, j, 1))
+                i += 1
+                j += 1
+            elif a_hi - a_lo > b_hi - b_lo:
+                i += 1
+            else:
+                j += 1
+
+
+def histogram_matches(a, a_lo, a_hi, b, b_lo, b_hi, matches):
+    # git's histogram diff: anchor each region on the longest common run around the line that
+    # occurs least often, then continue left and right of it (with an explicit stack, a long
+    # chain of anchors would exceed the recursion limit)
+    regions = [(a_lo, a_hi, b_lo, b_hi)]
+    while regions:
+        a_lo, a_hi, b_lo, b_hi = trim(a, regions[-1][0], regions[-1][1], b, regions[-1][2], regions[-1][3],
+                                      matches)
+        regions.pop()
+        if a_lo == a_hi or b_lo == b_hi:
+            continue
+
+        occurrences = {}
+        for i in range(a_lo, a_hi):
+            occurrences.setdefault(a[i], []).append(i)
+
+        # lines occurring exactly once on both sides are all used as anchors at once (the patience
+        # step), otherwise a region with many of them would be split one anchor at a time
+        anchors = unique_anchors(occurrences, b, b_lo, b_hi)
+        if anchors:
+            previous_i, previous_j = a_lo, b_lo
+            for i, j in anchors:
+                matches.append((i, j, 1))
+                regions.append((previous_i, i, previous_j, j))
+                previous_i, previous_j = i + 1, j + 1
+            regions.append((previous_i, a_hi, previous_j, b_hi))
+            continue
+
+        best = None
+        too_common = False
+        j = b_lo
+        while j < b_hi:
+            positions = occurrences.get(b[j])
+            if not positions:
+                j += 1
+                continue
+            if len(positions) > MAX_CHAIN_LENGTH:
+                too_common = True
+                j += 1
+                continue
+            if best and len(positions) > best[0]:
+                j += 1
+                continue
+            next_j = j + 1
+            for i in positions:
+                start_i, start_j = i, j
+                while start_i > a_lo and start_j > b_lo and a[start_i - 1] == b[start_j - 1]:
+                    start_i -= 1
+                    start_j -= 1
+                end_i, end_j = i + 1, j + 1
+                while end_i < a_hi and end_j < b_hi and a[end_i] == b[end_j]:
+                    end_i += 1
+                    end_j += 1
+                if best is None or (len(positions), start_i - end_i) < best[:2]:
+                    best = (len(positions), start_i - end_i, start_i, start_j, end_i - start_i)
+                next_j = max(next_j, end_j)
+            # lines within the run just found can not yield a longer run
+            j = next_j
+
+        if best is None:
+            if too_common:
+                myers_matches(a, a_lo, a_hi, b, b_lo, b_hi, matches)
+            continue
+        _, _, i, j, size = best
+        matches.append((i, j, size))
+        regions.append((a_lo, i, b_lo, j))
+        regions.append((i + size, a_hi, j + size, b_hi))
+
+
+def myers_filtered_matches(a, b, matches):
+    # lines that only occur on one side can never match: run Myers on the remaining lines only
+    # (like git, this keeps rewrites of whole modules fast) and map the matches back
+    common = set(a).intersection(b)
+    a_index = [i for i, line in enumerate(a) if line in common]
+    b_index = [j for j, line in enumerate(b) if line in common]
+    filtered = []
+    myers_matches([a[i] for i in a_index], 0, len(a_index), [b[j] for j in b_index], 0, len(b_index), filtered)
+    for i, j, size in filtered:
+        for offset in range(size):
+            matches.append((a_index[i + offset], b_index[j + offset], 1))
+
+
+def unique_anchors(occurrences, b, b_lo, b_hi):
+    counts = {}
+    for j in range(b_lo, b_hi):
+        counts[b[j]] = counts.get(b[j], 0) + 1
+    candidates = [(occurrences[b[j]][0], j) for j in range(b_lo, b_hi)
+                  if counts[b[j]] == 1 and len(occurrences.get(b[j], ())) == 1]
+    # longest increasing subsequence (by position in a) of the candidates in b order
+    return [candidates[index] for index in increasing_subsequence([i for i, _ in candidates])]
+
+
+def increasing_subsequence(values):
+    # indices of a longest strictly increasing subsequence of values, in O(n log n)
+    tails = []
+    tail_index = []
+    previous = [None] * len(values)
+    for index, value in enumerate(values):
+        position = bisect_left(tails, value)
+        if position == len(tails):
+            tails.append(value)
+            tail_index.append(index)
+        else:
+            tails[position] = value
+            tail_index[position] = index
+        previous[index] = tail_index[position - 1] if position else None
+    indices = []
+    index = tail_index[-1] if tail_index else None
+    while index is not None:
+        indices.append(index)
+        index = previous[index]
+    indices.reverse()
+    return indices
+
+
+def get_matching_blocks(a, b, algorithm):
+    a, b = intern_lines(a, b)
+    matches = []
+    if algorithm == 'myers':
+        myers_filtered_matches(a, b, matches)
+    else:
+        histogram_matches(a, 0, len(a), b, 0, len(b), matches)
+    # merge adjacent runs, like SequenceMatcher.get_matching_blocks()
+    blocks = []
+    for i, j, size in sorted(matches):
+        if blocks and blocks[-1][0] + blocks[-1][2] == i and blocks[-1][1] + blocks[-1][2] == j:
+            blocks[-1] = (blocks[-1][0], blocks[-1][1], blocks[-1][2] + size)
+        else:
+            blocks.append((i, j, size))
+    blocks.append((len(a), len(b), 0))
+    return blocks
+
+
+def get_opcodes(a, b, algorithm=DEFAULT_ALGORITHM):
+    if algorithm == 'difflib':
+        return SequenceMatcher(None, a, b).get_opcodes()
+    # same derivation as SequenceMatcher.get_opcodes()
+    i = j = 0
+    opcodes = []
+    for block_i, block_j, size in get_matching_blocks(a, b, algorithm):
+        tag = ''
+        if i < block_i and j < block_j:
+            tag = 'replace'
+        elif i < block_i:
+            tag = 'delete'
+        elif j < block_j:
+            tag = 'insert'
+        if tag:
+            opcodes.append((tag, i, block_i, j, block_j))
+        i, j = block_i + size, block_j + size
+        if size:
+            opcodes.append(('equal', block_i, i, block_j, j))
+    return opcodes
+
+
+def group_opcodes(opcodes, n):
+    # same grouping as SequenceMatcher.get_grouped_opcodes()
+    codes = list(opcodes) or [('equal', 0, 1, 0, 1)]
+    if codes[0][0] == 'equal':
+        tag, i1, i2, j1, j2 = codes[0]
+        codes[0] = tag, max(i1, i2 - n), i2, max(j1, j2 - n), j2
+    if codes[-1][0] == 'equal':
+        tag, i1, i2, j1, j2 = codes[-1]
+        codes[-1] = tag, i1, min(i2, i1 + n), j1, min(j2, j1 + n)
+    group = []
+    for tag, i1, i2, j1, j2 in codes:
+        if tag == 'equal' and i2 - i1 > n + n:
+            group.append((tag, i1, min(i2, i1 + n), j1, min(j2, j1 + n)))
+            yield group
+            group = []
+            i1, j1 = max(i1, i2 - n), max(j1, j2 - n)
+        group.append((tag, i1, i2, j1, j2))
+    if group and not (len(group) == 1 and group[0][0] == 'equal'):
+        yield group
+
+
+def format_range(start, stop):
+    beginning = start + 1
+    length = stop - start
+    if length == 1:
+        return str(beginning)
+    if not length:
+        beginning -= 1
+    return f'{beginning},{length}'
+
+
+def unified_diff(a, b, n=3, algorithm=DEFAULT_ALGORITHM):
+    # the hunks of difflib.unified_diff(a, b, n=n, lineterm=''), without the file headers
+    for group in group_opcodes(get_opcodes(a, b, algorithm), n):
+        yield f'@@ -{format_range(group[0][1], group[-1][2])} +{format_range(group[0][3], group[-1][4])} @@'
+        for tag, i1, i2, j1, j2 in group:
+            if tag == 'equal':
+                for line in a[i1:i2]:
+                    yield ' ' + line
+                continue
+            if tag in ('replace', 'delete'):
+                for line in a[i1:i2]:
+                    yield '-' + line
+            if tag in ('replace', 'insert'):
+                for line in b[j1:j2]:
+                    yield '+' + line
@@ -0,0 +1,51 @@
+import os
+from collections import namedtuple
+
+import diff
+import algorithms
+
+# one changed module: status is 'added', 'deleted' or 'modified', lines the unified diff lines
+# ('+'/'-' prefixed source for added and deleted modules, hunks starting with @@ otherwise)
+ModuleDiff = namedtuple('ModuleDiff', ['name', 'status', 'lines'])
+
+
+class ModuleSet(dict):
+    # the VBA modules of one workbook, module name -> diff.Module in the order of the project
+
+    def __init__(self, modules=(), name=None):
+        super().__init__(modules)
+        self.name = name
+
+    def sources(self):
+        return {name: module.source for name, module in self.items()}
+
+
+def extract(source, name=None):
+    # source is a path, a bytes-like object (bytes, bytearray, memoryview, mmap) or a seekable
+    # binary file object; nothing is written to disk and no process is started, so extract
+    # can be called from several threads at once
+    if isinstance(source, (str, os.PathLike)):
+        path = os.fspath(source)
+        return ModuleSet(diff.get_modules(path), name or os.path.basename(path))
+    name = name or getattr(source, 'name', None) or 'workbook'
+    return ModuleSet(diff.get_modules(str(name), source), name)
+
+
+def iter_module_diffs(a, b, numlines, algorithm):
+    for module_b, module_a in diff.iter_changes(b, a):
+        if module_a is None:
+            yield ModuleDiff(module_b.name, 'added', ('+' + line for line in module_b.iter_lines()))
+        elif module_b is None:
+            yield ModuleDiff(module_a.name, 'deleted', ('-' + line for line in module_a.iter_lines()))
+        else:
+            yield ModuleDiff(module_b.name, 'modified', diff.iter_module_diff(module_a, module_b, numlines, algorithm))
+
+
+def compare(a, b, numlines=3, algorithm=algorithms.DEFAULT_ALGORITHM):
+    # returns an iterator of a ModuleDiff per module that differs from workbook a to workbook b,
+    # both given as ModuleSet or anything extract accepts; the diff lines are computed lazily
+    if algorithm not in algorithms.ALGORITHMS:
+        raise ValueError(f'unknown diff algorithm "{algorithm}", expected one of: {", ".join(algorithms.ALGORITHMS)}')
+    a = a if isinstance(a, ModuleSet) else extract(a)
+    b = b if isinstance(b, ModuleSet) else extract(b)
+    return iter_module_diffs(a, b, numlines, algorithm)
@@ -0,0 +1,266 @@
+import os
+import shutil
+import tempfile
+from itertools import chain
+from contextlib import contextmanager
+
+import diff
+import tracing
+import plumbing
+from cache import Cache, is_object_id
+
+
+def parse_args(args):
+    # [--diff-algorithm=<name>] [--diff-granularity=<name>] [--format=<name>] [--sheets=<bool>] [-U<n>]
+    # [-L <procedure>] [<git revisions and options>] [-- <paths>]
+    options = {}
+    revisions = []
+    paths = []
+    args = list(args)
+    if '--' in args:
+        paths = args[args.index('--') + 1:]
+        args = args[:args.index('--')]
+    args = iter(args)
+    for arg in args:
+        name, _, value = arg[2:].partition('=')
+        if arg.startswith('--') and name in diff.OPTION_CONFIG:
+            options[name] = value
+        elif arg.startswith('-U') or arg.startswith('--unified='):
+            options['unified'] = int(arg[2:] if arg.startswith('-U') else arg[len('--unified='):])
+        elif arg.startswith('-L'):
+            options['procedure'] = arg[2:] or next(args, '')
+        else:
+            revisions.append(arg)
+    return options, revisions, paths
+
+
+def get_diff_options(options):
+    diff.check_options(options)
+    algorithm = diff.get_algorithm(options)
+    granularity = diff.get_granularity(options)
+    output_format = diff.get_format(options)
+    return algorithm, options.get('unified', 3), granularity, output_format
+
+
+def get_writer(output_format, out=None):
+    # one RecordWriter for the whole run, so that json is a single array
+    return None if output_format == diff.DEFAULT_FORMAT else diff.RecordWriter(out, output_format)
+
+
+def write_diff(writer, path, diffs, workbook_a_modules, workbook_b_modules, out=None, workbooks=None, **fields):
+    # workbooks is the (new, old) pair of files to diff the sheets of as well, None for a missing side
+    if workbooks:
+        import sheets
+    if writer is None:
+        if workbooks:
+            diffs = chain(diffs, sheets.iter_diffs(path, *workbooks))
+        diff.print_diff(path, diffs, out)
+    else:
+        diff.write_records(writer, path, diffs, workbook_a_modules, workbook_b_modules, **fields)
+        if workbooks:
+            sheets.write_records(writer, path, *workbooks, **fields)
+
+
+def get_workbook_path(cat_file, temp_dir, mode, object_id, path):
+    # a side of a change as a file, for the diff of its sheets: blobs are written to temp_dir
+    # (cached ones as well, the cache only holds the modules), the working tree is read in place
+    if mode == plumbing.NULL_MODE:
+        return None
+    if not is_object_id(object_id):
+        return path
+    blob_path = os.path.join(temp_dir, object_id)
+    if not os.path.exists(blob_path):
+        cat_file.write(object_id, blob_path)
+    return blob_path
+
+
+def is_regular_file(change):
+    return change.old_mode[:3] in ('000', '100') and change.new_mode[:3] in ('000', '100')
+
+
+def get_changes(revisions, paths, cwd):
+    # regular files git would hand to the xl differ
+    changes = [change for change in plumbing.diff_raw(revisions, paths, cwd=cwd) if is_regular_file(change)]
+    attributes = plumbing.check_attr('diff', [change.path for change in changes], cwd=cwd)
+    return [change for change in changes if attributes.get(change.path) == 'xl']
+
+
+def get_history(revisions, paths, cwd):
+    # [(header, changes)] of the commits that changed workbooks, newest first
+    commits = plumbing.log_raw(revisions, paths, cwd=cwd)
+    attributes = plumbing.check_attr('diff', sorted({change.path for _, changes in commits for change in changes
+                                                     if is_regular_file(change)}), cwd=cwd)
+    history = []
+    for header, changes in commits:
+        changes = [change for change in changes if is_regular_file(change) and attributes.get(change.path) == 'xl']
+        if changes:
+            history.append((header, changes))
+    return history
+
+
+def name_blobs(changes):
+    # traced workbooks are listed by path rather than by blob id
+    for change in changes:
+        tracing.set_name(change.old_id, change.path)
+        tracing.set_name(change.new_id, change.path)
+
+
+@contextmanager
+def process_pool(executor=None):
+    # one pool for a whole walk rather than one per commit; its workers are spawned, forked ones
+    # started on demand while git cat-file --batch runs would inherit its stdin and keep it from
+    # exiting. An executor that is passed in is used as it is, and must not fork either
+    if executor is not None:
+        yield executor
+        return
+    import multiprocessing
+    executor = diff.ProcessPoolExecutor(mp_context=multiprocessing.get_context('spawn'))
+    try:
+        yield executor
+    finally:
+        executor.shutdown()
+
+
+def extract_all(cat_file, sources, cache, executor=None):
+    # sources maps keys to blob ids or, for files of the working tree, to their paths; every
+    # blob that is not cached is fetched and the large workbooks are extracted in the process pool
+    temp_dir = tempfile.mkdtemp(prefix='git-xl-')
+    try:
+        workbooks = []
+        for source in sources.values():
+            if not is_object_id(source):
+                workbooks.append((source, None))
+                continue
+            workbooks.append((os.path.join(temp_dir, source), source))
+
+        def fetch(path, object_id):
+            # decided by the cache lookup of get_vba_all, so an entry pruned by another process
+            # in the meantime is a miss like any other
+            if is_object_id(object_id) and not os.path.exists(path):
+                cat_file.write(object_id, path)
+        return dict(zip(sources, diff.get_vba_all(workbooks, cache, executor, fetch=fetch)))
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def diff_range(args, out=None, cache=None, executor=None, cwd=None):
+    options, revisions, paths = parse_args(args)
+    algorithm, numlines, granularity, output_format = get_diff_options(options)
+    sheets_enabled = diff.get_sheets(options)
+    top_level = plumbing.get_top_level(cwd)
+    changes = get_changes(revisions, paths, top_level)
+    writer = get_writer(output_format, out)
+    if not changes:
+        if writer is not None:
+            writer.close()
+        return
+
+    name_blobs(changes)
+    sources = {}
+    for change in changes:
+        for mode, object_id in ((change.old_mode, change.old_id), (change.new_mode, change.new_id)):
+            if mode == plumbing.NULL_MODE:
+                continue
+            if is_object_id(object_id):
+                sources[object_id] = object_id
+            else:
+                # the working tree side
+                sources[change.path] = os.path.join(top_level, change.path)
+
+    def get_modules(mode, object_id, path):
+        if mode == plumbing.NULL_MODE:
+            return {}
+        return modules[object_id if is_object_id(object_id) else path]
+
+    temp_dir = tempfile.mkdtemp(prefix='git-xl-')
+    try:
+        with process_pool(executor) as executor, plumbing.CatFile(cwd=top_level) as cat_file:
+            modules = extract_all(cat_file, sources, cache or Cache(), executor)
+            for change in changes:
+                # same output git-xl-diff prints when git runs it for this file
+                workbook_a_modules = get_modules(change.new_mode, change.new_id, change.path)
+                workbook_b_modules = get_modules(change.old_mode, change.old_id, change.path)
+                workbooks = None
+                if sheets_enabled:
+                    path = os.path.join(top_level, change.path)
+                    workbooks = (get_workbook_path(cat_file, temp_dir, change.new_mode, change.new_id, path),
+                                 get_workbook_path(cat_file, temp_dir, change.old_mode, change.old_id, path))
+                write_diff(writer, change.path, diff.get_diffs(change.path, workbook_a_modules, workbook_b_modules,
+                                                               numlines, algorithm, granularity),
+                           workbook_a_modules, workbook_b_modules, out, workbooks)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    if writer is not None:
+        writer.close()
+
+
+def print_header(header, out=None, first=True):
+    writer = diff.DiffWriter(out)
+    if not first:
+        # git log separates commits by an empty line
+        writer.write('')
+    lines = header.split('\n')
+    writer.write(lines[0], diff.COMMIT_COLOR)
+    for line in lines[1:]:
+        writer.write(line, diff.RESET)
+    writer.write('')
+    writer.flush()
+
+
+def log_range(args, out=None, cache=None, executor=None, cwd=None):
+    # git log -p for workbooks: history is walked once, newest first, and the old side of a
+    # workbook stays in memory to be the new side of the next older commit that changes it, so
+    # each blob is extracted once instead of twice
+    options, revisions, paths = parse_args(args)
+    algorithm, numlines, granularity, output_format = get_diff_options(options)
+    sheets_enabled = diff.get_sheets(options)
+    writer = get_writer(output_format, out)
+    if 'procedure' in options:
+        import index
+        return index.log_procedure(options['procedure'], revisions, paths, numlines, algorithm, out, cache,
+                                   executor, cwd, writer)
+    top_level = plumbing.get_top_level(cwd)
+    history = get_history(revisions, paths, top_level)
+    cache = cache or Cache()
+    # path -> (blob id, modules) of the old side of the last commit that changed the workbook
+    previous = {}
+    temp_dir = tempfile.mkdtemp(prefix='git-xl-')
+    try:
+        with process_pool(executor) as executor, plumbing.CatFile(cwd=top_level) as cat_file:
+            for i, (header, changes) in enumerate(history):
+                name_blobs(changes)
+                sources = {}
+                for change in changes:
+                    if (change.new_mode != plumbing.NULL_MODE and
+                            previous.get(change.path, (None,))[0] != change.new_id):
+                        sources[change.new_id] = change.new_id
+                    if change.old_mode != plumbing.NULL_MODE:
+                        sources[change.old_id] = change.old_id
+                modules = extract_all(cat_file, sources, cache, executor)
+
+                if writer is None:
+                    print_header(header, out, first=i == 0)
+                for change in changes:
+                    workbook_a_modules = {}
+                    if change.new_mode != plumbing.NULL_MODE:
+                        workbook_a_modules = modules[change.new_id] if change.new_id in modules else \
+                            previous[change.path][1]
+                    workbook_b_modules = modules[change.old_id] if change.old_mode != plumbing.NULL_MODE else {}
+                    workbooks = None
+                    if sheets_enabled:
+                        workbooks = (get_workbook_path(cat_file, temp_dir, change.new_mode, change.new_id, None),
+                                     get_workbook_path(cat_file, temp_dir, change.old_mode, change.old_id, None))
+                    write_diff(writer, change.path, diff.get_diffs(change.path, workbook_a_modules,
+                                                                   workbook_b_modules, numlines, algorithm,
+                                                                   granularity),
+                               workbook_a_modules, workbook_b_modules, out, workbooks, commit=header.split()[1])
+                    previous[change.path] = (change.old_id, workbook_b_modules)
+                # only the old sides are needed again, as the new sides of older commits
+                kept = {object_id for object_id, _ in previous.values()}
+                for name in os.listdir(temp_dir):
+                    if name not in kept:
+                        os.remove(os.path.join(temp_dir, name))
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    if writer is not None:
+        writer.close()
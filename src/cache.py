@@ -0,0 +1,175 @@
+import os
+import re
+import sys
+import json
+
+
+# bump whenever the layout of a cache entry changes so stale entries are never read
+CACHE_VERSION = 3
+DEFAULT_MAX_SIZE = 256 * 1024 * 1024
+SIZE_UNITS = {'': 1, 'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3}
+OBJECT_ID = re.compile(r'^(?:[0-9a-f]{40}|[0-9a-f]{64})$')
+# the total size of the entries, kept next to them so that a put does not have to walk all entries
+SIZE_FILE = 'size'
+# once full, the cache is pruned to this share of its size, so the next puts don't prune again
+PRUNE_TARGET = 0.9
+
+
+def get_cache_dir():
+    path = os.environ.get('GIT_XL_CACHE_DIR')
+    if path:
+        return path
+    if sys.platform == 'win32':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser(os.path.join('~', 'AppData', 'Local'))
+    elif sys.platform == 'darwin':
+        base = os.path.expanduser(os.path.join('~', 'Library', 'Caches'))
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser(os.path.join('~', '.cache'))
+    return os.path.join(base, 'git-xl')
+
+
+def parse_size(value):
+    match = re.match(r'^\s*(\d+)\s*([kmg]?)b?\s*$', value.lower())
+    if not match:
+        raise ValueError(f'invalid cache size "{value}"')
+    return int(match.group(1)) * SIZE_UNITS[match.group(2)]
+
+
+def get_max_size():
+    value = os.environ.get('GIT_XL_CACHE_SIZE')
+    return parse_size(value) if value else DEFAULT_MAX_SIZE
+
+
+def is_object_id(value):
+    # git passes an all-zero id when it does not know the blob (e.g. a dirty working tree file)
+    return bool(value) and bool(OBJECT_ID.match(value)) and value.strip('0') != ''
+
+
+def blob_sha(path):
+    # same id git would assign to the file, so hashed files share entries with git-provided ids
+    import hashlib
+    sha = hashlib.sha1()
+    sha.update(b'blob %d\0' % os.path.getsize(path))
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+class Cache:
+
+    def __init__(self, path=None, max_size=None):
+        self.path = os.path.join(path or get_cache_dir(), f'v{CACHE_VERSION}')
+        self.max_size = get_max_size() if max_size is None else max_size
+
+    @property
+    def enabled(self):
+        return self.max_size > 0
+
+    def entry_path(self, key):
+        return os.path.join(self.path, key[:2], key[2:] + '.json')
+
+    def contains(self, key):
+        return self.enabled and os.path.exists(self.entry_path(key))
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        path = self.entry_path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                modules = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # refresh the modification time, it is what the LRU eviction orders by
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return modules
+
+    def put(self, key, modules):
+        if not self.enabled:
+            return
+        path = self.entry_path(key)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(modules, f)
+                size = f.tell()
+            # atomic, so concurrent diffs never observe a half-written entry
+            os.replace(tmp_path, path)
+        except OSError:
+            self.delete_file(tmp_path)
+            return
+        # the entries are only walked when the size is unknown or over the limit
+        total = self.add_size(size)
+        if total is None or total > self.max_size:
+            self.prune(max_size=int(self.max_size * PRUNE_TARGET))
+
+    def add_size(self, size):
+        # not exact when processes write at the same time (or an entry is written twice), which
+        # only moves the next prune; a prune counts again
+        try:
+            with open(os.path.join(self.path, SIZE_FILE), 'r') as f:
+                total = int(f.read()) + size
+        except (OSError, ValueError):
+            return None
+        self.write_size(total)
+        return total
+
+    def write_size(self, total):
+        path = os.path.join(self.path, SIZE_FILE)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                f.write(str(total))
+            os.replace(tmp_path, path)
+        except OSError:
+            self.delete_file(tmp_path)
+
+    def entries(self):
+        entries = []
+        if not os.path.isdir(self.path):
+            return entries
+        for fan_out in os.scandir(self.path):
+            if not fan_out.is_dir():
+                continue
+            for entry in os.scandir(fan_out.path):
+                if not entry.name.endswith('.json'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((fan_out.name + entry.name[:-5], entry.path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def size(self):
+        return sum(size for _, _, size, _ in self.entries())
+
+    def prune(self, max_size=None):
+        max_size = self.max_size if max_size is None else max_size
+        entries = self.entries()
+        total = sum(size for _, _, size, _ in entries)
+        removed = 0
+        # evict least recently used entries first
+        for _, path, size, _ in sorted(entries, key=lambda entry: entry[3]):
+            if total <= max_size:
+                break
+            self.delete_file(path)
+            total -= size
+            removed += 1
+        if os.path.isdir(self.path):
+            self.write_size(total)
+        return removed
+
+    def clear(self):
+        return self.prune(max_size=0)
+
+    def delete_file(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -0,0 +1,190 @@
+import os
+import re
+import shutil
+import tempfile
+from collections import namedtuple
+
+import diff
+import batch
+import plumbing
+import procedures
+from cache import Cache
+
+# rules run when neither --rules nor diff.xl.checks chooses others
+DEFAULT_RULES = ('option-explicit', 'stop')
+# first line of the hook script, so that git xl hook uninstall only removes its own hook
+HOOK_MARKER = '# installed by git xl hook install'
+HOOK_NAME = 'pre-commit'
+
+OPTION_EXPLICIT = re.compile(r'^\s*Option\s+Explicit\b', re.IGNORECASE)
+
+# line is 1-based
+Problem = namedtuple('Problem', ['workbook', 'module', 'line', 'rule', 'message'])
+
+
+def line_rule(pattern, message):
+    # a rule that reports every line matching the regular expression
+    pattern = re.compile(pattern, re.IGNORECASE)
+
+    def check(lines):
+        return [(number, message) for number, line in enumerate(lines, 1) if pattern.search(line)]
+    return check
+
+
+def check_option_explicit(lines):
+    # Option Explicit belongs to the declarations, before the first procedure; modules without
+    # code (e.g. empty sheet modules) need none
+    for line in lines:
+        if OPTION_EXPLICIT.match(line):
+            return []
+        if procedures.PROCEDURE_START.match(line):
+            break
+    if not any(line.strip() for line in lines):
+        return []
+    return [(1, 'Option Explicit is missing')]
+
+
+# a rule takes the lines of a module and returns [(line, message)]; rules are added here or,
+# as regular expressions, with git config diff.xl.rule.<name> <pattern>
+RULES = {
+    'option-explicit': check_option_explicit,
+    'stop': line_rule(r'^\s*Stop\s*(?:$|:|\')', 'Stop statement'),
+    'debug-print': line_rule(r'^\s*Debug\.Print\b', 'Debug.Print statement'),
+    'debug-assert': line_rule(r'^\s*Debug\.Assert\b', 'Debug.Assert statement'),
+}
+
+
+def get_rules(names=None):
+    # {name: rule} of the rules to run: the given names (a comma separated list), diff.xl.checks
+    # or the default ones, plus the patterns of diff.xl.rule.<name>
+    config = diff.get_git_config()
+    rules = dict(RULES)
+    for key, pattern in config.items():
+        if key.startswith('diff.xl.rule.'):
+            name = key[len('diff.xl.rule.'):]
+            try:
+                rules[name] = line_rule(pattern, f'matches {name}')
+            except re.error as e:
+                raise ValueError(f'invalid pattern for rule "{name}": {e}')
+    custom = [name for name in rules if name not in RULES]
+    names = names or config.get('diff.xl.checks')
+    if names:
+        selected = [name.strip() for name in names.split(',') if name.strip()]
+    else:
+        selected = list(DEFAULT_RULES) + custom
+    unknown = [name for name in selected if name not in rules]
+    if unknown:
+        raise ValueError(f'unknown rule "{unknown[0]}", expected one of: {", ".join(rules)}')
+    return {name: rules[name] for name in selected}
+
+
+def check_modules(workbook_name, workbook_a_modules, workbook_b_modules, rules):
+    # rules only run over the modules that are new in a or changed since b
+    problems = []
+    for module_a, _ in diff.iter_changes(workbook_a_modules, workbook_b_modules):
+        if module_a is None:
+            continue
+        lines = module_a.lines()
+        for name, rule in rules.items():
+            for line, message in rule(lines):
+                problems.append(Problem(workbook_name, module_a.name, line, name, message))
+    return problems
+
+
+def check_staged(paths=(), rules=None, cache=None, executor=None, cwd=None):
+    # problems in the VBA of the staged workbooks, compared with HEAD: workbooks whose VBA project
+    # part is unchanged are skipped by its CRC-32, cached blobs are not even read, and the rest
+    # are extracted together (large ones in parallel)
+    rules = rules if rules is not None else get_rules()
+    top_level = plumbing.get_top_level(cwd)
+    changes = [change for change in batch.get_changes(['--cached'], paths, top_level)
+               if change.new_mode != plumbing.NULL_MODE]
+    if not changes:
+        return []
+    cache = cache or Cache()
+    temp_dir = tempfile.mkdtemp(prefix='git-xl-')
+    try:
+        with plumbing.CatFile(cwd=top_level) as cat_file:
+            def fetch(path, object_id):
+                if not os.path.exists(path):
+                    cat_file.write(object_id, path)
+
+            def get_workbook(object_id):
+                # (path, object id) for get_vba_all; the path is written up front when not cached,
+                # for the check of the VBA project part, and otherwise by get_vba_all once the
+                # cache misses, e.g. because another process pruned the entry in the meantime
+                path = os.path.join(temp_dir, object_id)
+                if not cache.contains(object_id):
+                    fetch(path, object_id)
+                return path, object_id
+
+            checked = []
+            workbooks = {}
+            for change in changes:
+                new = get_workbook(change.new_id)
+                old = get_workbook(change.old_id) if change.old_mode != plumbing.NULL_MODE else None
+                # blobs not written are cached, comparing their modules is as cheap
+                if (old and os.path.exists(new[0]) and os.path.exists(old[0]) and
+                        diff.is_vba_project_unchanged(new[0], old[0])):
+                    continue
+                checked.append((change, new, old))
+                workbooks[new] = None
+                if old:
+                    workbooks[old] = None
+            workbooks = list(workbooks)
+            modules = {}
+            if workbooks:
+                modules = dict(zip(workbooks, diff.get_vba_all(workbooks, cache, executor, fetch=fetch)))
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    problems = []
+    for change, new, old in checked:
+        problems += check_modules(change.path, modules[new], modules[old] if old else {}, rules)
+    return problems
+
+
+def format_problem(problem):
+    return f'{problem.workbook}/VBA/{problem.module}:{problem.line}: {problem.message} ({problem.rule})'
+
+
+def get_hook_path(cwd=None):
+    # honours core.hooksPath
+    path = plumbing.decode_path(plumbing.run_git(['rev-parse', '--git-path', 'hooks/' + HOOK_NAME],
+                                                 cwd=cwd).rstrip(b'\n'))
+    return os.path.join(cwd or os.getcwd(), path)
+
+
+def get_hook_script(command):
+    import shlex
+    return '\n'.join(['#!/bin/sh', HOOK_MARKER, 'exec ' + ' '.join(shlex.quote(arg) for arg in command) +
+                      ' check --staged', ''])
+
+
+def is_own_hook(path):
+    try:
+        with open(path, 'r') as f:
+            return HOOK_MARKER in f.read(1024)
+    except OSError:
+        return False
+
+
+def install_hook(command, force=False, cwd=None):
+    # writes the pre-commit hook that runs git xl check --staged, another hook is only replaced
+    # with force
+    path = get_hook_path(cwd)
+    if os.path.exists(path) and not force and not is_own_hook(path):
+        raise ValueError(f'{path} already exists, use --force to replace it')
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', newline='\n') as f:
+        f.write(get_hook_script(command))
+    os.chmod(path, 0o755)
+    return path
+
+
+def uninstall_hook(cwd=None):
+    path = get_hook_path(cwd)
+    if not is_own_hook(path):
+        return None
+    os.remove(path)
+    return path
@@ -1,9 +1,12 @@
 #!/usr/bin/env python
 import sys
 import os
-import fnmatch
-import subprocess
-import colorama
+import time
+
+import startup
+
+# installed before anything else is imported, so that the profile covers the whole start-up
+PROFILE = startup.enable(sys.argv) if __name__ == '__main__' else None
 
 
 VERSION = '0.0.0'
@@ -12,13 +15,34 @@ PYTHON_VERSION = f'{sys.version_info.major}.{sys.version_info.minor}.{sys.versio
 FILE_EXTENSIONS = ['xls', 'xlt', 'xla', 'xlam', 'xlsx', 'xlsm', 'xlsb', 'xltx', 'xltm']
 GIT_ATTRIBUTES_DIFFER = ['*.' + file_ext + ' diff=xl' for file_ext in FILE_EXTENSIONS]
 GIT_IGNORE = ['~$*.' + file_ext for file_ext in FILE_EXTENSIONS]
+# commands that are traced when GIT_XL_TRACE or diff.xl.trace is set
+TRACED_COMMANDS = ('textconv', 'diff', 'log', 'index', 'grep')
+# repositories set up at once by install --recursive, the work is spawning git and writing files
+MAX_INSTALL_WORKERS = 16
+
+
+def __getattr__(name):
+    # modules only some commands need are imported on first access, so that e.g. git xl version
+    # starts quickly; they stay reachable as attributes (cli.subprocess, cli.daemon)
+    if name in ('subprocess', 'daemon'):
+        import importlib
+        return importlib.import_module(name)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
 
 
 def is_frozen():
     return getattr(sys, 'frozen', False)
 
 
+def get_git_xl_command():
+    # command line that re-invokes this program, e.g. to start a detached daemon
+    if is_frozen():
+        return [sys.executable]
+    return [sys.executable, os.path.abspath(__file__)]
+
+
 def is_git_repository(path):
+    import subprocess
     cmd = subprocess.run(['git', 'rev-parse'], cwd=path, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
                          universal_newlines=True,encoding='utf-8')
     if not cmd.stderr.split('\n')[0]:
@@ -26,6 +50,44 @@ def is_git_repository(path):
     return False
 
 
+def find_repositories(path):
+    # working trees in and below path, found by their .git directory (or .git file, for worktrees
+    # and submodules) without spawning git; repositories are not searched for nested ones
+    repositories = []
+    for root, dirs, files in os.walk(path):
+        if '.git' in dirs or '.git' in files:
+            repositories.append(root)
+            dirs[:] = []
+        else:
+            dirs.sort()
+    return repositories
+
+
+def exit_on_broken_pipe():
+    # the pager or the reader stopped early (git xl log | head): exit quietly, as git does, and
+    # point stdout to devnull so that flushing it at exit does not fail once more
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, sys.stdout.fileno())
+    sys.exit(1)
+
+
+def run_installers(paths, action, max_workers=MAX_INSTALL_WORKERS):
+    # calls action(installer) for the local installer of every repository in a thread pool and
+    # returns [(path, result, error)] in the order of paths
+    from concurrent.futures import ThreadPoolExecutor
+
+    def run(path):
+        try:
+            return path, action(Installer(mode='local', path=path)), None
+        except (ValueError, OSError) as e:
+            return path, None, e
+
+    if not paths:
+        return []
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(paths))) as executor:
+        return list(executor.map(run, paths))
+
+
 class Installer:
 
     def __init__(self, mode='global', path=None):
@@ -46,10 +108,14 @@ class Installer:
             
             # Use full path to the diff executable
             self.GIT_XL_DIFF = os.path.join(executable_dir, diff_executable)
+            # textconv is served by this executable
+            self.GIT_XL_TEXTCONV = f'{sys.executable} textconv'
         else:
             executable_path = sys.executable.replace('\\', '/')
             differ_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'diff.py').replace('\\', '/')
+            cli_path = os.path.abspath(__file__).replace('\\', '/')
             self.GIT_XL_DIFF = f'{executable_path} {differ_path}'
+            self.GIT_XL_TEXTCONV = f'{executable_path} {cli_path} textconv'
 
         if mode == 'global' and path:
             raise ValueError('must not specify repository path when installing globally')
@@ -63,6 +129,11 @@ class Installer:
         self.mode = mode
         self.path = path
 
+        # the config of the scope git-xl installs into, read once on first use: {key: value} and
+        # the file it is stored in; installing and uninstalling only spawn git config for changes
+        self.config = None
+        self.config_path = None
+
         # global config dir (only set when running in `global` mode)
         self.git_global_config_dir = self.get_global_gitconfig_dir() if self.mode == 'global' else None
 
@@ -70,9 +141,16 @@ class Installer:
         self.git_attributes_path = self.get_git_attributes_path()
         self.git_ignore_path = self.get_git_ignore_path()
 
-    def install(self):
-        # 1. gitconfig: set-up diff.xl.command
-        self.execute(['diff.xl.command', self.GIT_XL_DIFF])
+    def install(self, textconv=False):
+        # 1. gitconfig: set-up diff.xl.command, or a textconv filter so that Git does the diffing
+        if textconv:
+            # an external diff command takes precedence over textconv
+            self.unset_config('diff.xl.command')
+            self.set_config('diff.xl.textconv', self.GIT_XL_TEXTCONV)
+            # Git caches the converted text in refs/notes/textconv/xl
+            self.set_config('diff.xl.cachetextconv', 'true')
+        else:
+            self.set_config('diff.xl.command', self.GIT_XL_DIFF)
 
         # 2. set-up gitattributes (define custom differ)
         self.update_git_file(path=self.git_attributes_path, keys=GIT_ATTRIBUTES_DIFFER, operation='SET')
@@ -83,15 +161,16 @@ class Installer:
         # 4. update gitconfig (only relevent when running in `global` mode)
         if self.mode == 'global':
             # set core.attributesfile
-            self.execute(['core.attributesfile', self.git_attributes_path])
+            self.set_config('core.attributesfile', self.git_attributes_path)
             # set core.excludesfile
-            self.execute(['core.excludesfile', self.git_ignore_path])
+            self.set_config('core.excludesfile', self.git_ignore_path)
 
     def uninstall(self):
-        # 1. gitconfig: remove diff.xl.command from gitconfig
-        keys = self.execute(['--list']).split('\n')
-        if [key for key in keys if key.startswith('diff.xl.command')]:
+        # 1. gitconfig: remove diff.xl.command and diff.xl.textconv from gitconfig
+        config = self.get_config()
+        if 'diff.xl.command' in config or 'diff.xl.textconv' in config:
             self.execute(['--remove-section', 'diff.xl'])
+            self.config = {key: value for key, value in config.items() if not key.startswith('diff.xl.')}
 
         # 2. gitattributes: remove keys
         gitattributes_keys = self.update_git_file(path=self.git_attributes_path, keys=GIT_ATTRIBUTES_DIFFER,
@@ -99,7 +178,7 @@ class Installer:
         # when in global mode and gitattributes is empty, update gitconfig and delete gitattributes
         if not gitattributes_keys:
             if self.mode == 'global':
-                self.execute(['--unset', 'core.attributesfile'])
+                self.unset_config('core.attributesfile')
             self.delete_git_file(self.git_attributes_path)
 
         # 3. gitignore: remove keys
@@ -107,7 +186,7 @@ class Installer:
         # when in global mode and gitignore is empty, update gitconfig and delete gitignore
         if not gitignore_keys:
             if self.mode == 'global':
-                self.execute(['--unset', 'core.excludesfile'])
+                self.unset_config('core.excludesfile')
             self.delete_git_file(self.git_ignore_path)
     
     def execute(self, args):
@@ -115,27 +194,70 @@ class Installer:
         if self.mode == 'global':
             command.append('--global')
         command += args
+        import subprocess
         return subprocess.run(command, cwd=self.path, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
                               universal_newlines=True,encoding='utf-8').stdout
 
-    def get_global_gitconfig_dir(self):
-        # put .gitattributes in same folder as global .gitconfig
-        # determine .gitconfig path
-        # this requires Git 2.8+ (March 2016)
-        f = self.execute(['--list', '--show-origin'])
-        p = self.execute(['--list'])
-
-        f = f.split('\n')[0]
-        p = p.split('\n')[0]
+    def read_config(self):
+        # all entries of the scope with a single git call: -z separates the origin, key and value
+        # of an entry by NUL and key and value by a newline, so values may contain anything
+        output = self.execute((['--local'] if self.mode == 'local' else []) + ['--list', '--show-origin', '-z'])
+        config = {}
+        config_path = None
+        fields = output.split('\0')
+        for origin, entry in zip(fields[::2], fields[1::2]):
+            key, _, value = entry.partition('\n')
+            # keys are case-insensitive, the last entry of a key wins as in git config --get
+            config[key.lower()] = value
+            if origin.startswith('file:'):
+                config_path = origin[len('file:'):]
+        return config, config_path
+
+    def get_config(self):
+        if self.config is None:
+            self.config, self.config_path = self.read_config()
+        return self.config
+
+    def set_config(self, key, value):
+        if self.get_config().get(key) != value:
+            self.execute([key, value])
+            self.config[key] = value
+
+    def unset_config(self, key):
+        if key in self.get_config():
+            self.execute(['--unset', key])
+            del self.config[key]
+
+    def verify(self):
+        # the parts of the installation that are missing, none when git-xl is set up
+        missing = []
+        config = self.get_config()
+        if 'diff.xl.command' not in config and 'diff.xl.textconv' not in config:
+            missing.append('diff.xl.command')
+        for path, keys in ((self.git_attributes_path, GIT_ATTRIBUTES_DIFFER), (self.git_ignore_path, GIT_IGNORE)):
+            content = set()
+            if os.path.exists(path):
+                with open(path, 'r') as f:
+                    content = set(f.read().split('\n'))
+            if not content.issuperset(keys):
+                missing.append(os.path.basename(path))
+        return missing
 
-        return f[:f.index(p)][5:][:-11]
+    def get_global_gitconfig_dir(self):
+        # put .gitattributes in same folder as global .gitconfig, which is where git config
+        # found the global entries (this requires Git 2.8+, March 2016); without a global config
+        # yet, git creates ~/.gitconfig
+        self.get_config()
+        if self.config_path:
+            return os.path.dirname(os.path.expanduser(self.config_path))
+        return os.path.expanduser('~')
 
     def get_git_attributes_path(self):
         if self.mode == 'local':
             return os.path.join(self.path, '.gitattributes')
 
         # check if core.attributesfile is configured
-        core_attributesfile = self.execute(['--get', 'core.attributesfile']).split('\n')[0]
+        core_attributesfile = self.get_config().get('core.attributesfile')
         if core_attributesfile:
             return os.path.expanduser(core_attributesfile)
 
@@ -147,7 +269,7 @@ class Installer:
             return os.path.join(self.path, '.gitignore')
 
         # check if core.excludesfile is configured
-        core_excludesfile = self.execute(['--get', 'core.excludesfile']).split('\n')[0]
+        core_excludesfile = self.get_config().get('core.excludesfile')
         if core_excludesfile:
             return os.path.expanduser(core_excludesfile)
 
@@ -161,6 +283,7 @@ class Installer:
                 content = [line for line in f.read().split('\n') if line]
         else:
             content = []
+        existing = content
 
         if operation == 'SET':
             # create union set: keys + existing content
@@ -169,7 +292,8 @@ class Installer:
             # remove keys from content
             content = [line for line in content if line and line not in keys]
 
-        if content:
+        # files that already have the keys (or none of them) are left as they are
+        if content and content != existing:
             with open(path, 'w') as f:
                 f.writelines('\n'.join(content))
 
@@ -197,7 +321,36 @@ Commands
 * git xl install:
     Install Git xl.
 * git xl uninstall:
-    Uninstall Git xl."""
+    Uninstall Git xl.
+* git xl verify:
+    Check that Git xl is installed.
+* git xl cache:
+    Inspect or prune the VBA extraction cache.
+* git xl daemon:
+    Run a background process that keeps diffs warm.
+* git xl textconv:
+    Print the VBA code of a workbook as plain text.
+* git xl export:
+    Write the VBA modules of workbooks to files, for code search.
+* git xl diff:
+    Diff the VBA code of all workbooks changed in a commit range.
+* git xl log:
+    Show the commit history with the VBA diffs of the changed workbooks.
+* git xl index:
+    Index the VBA modules and procedures of all workbook versions.
+* git xl grep:
+    Search the VBA code added in the commit history.
+* git xl stats:
+    Summarise the trace of past diffs and commands.
+* git xl check:
+    Check the VBA code of the staged workbooks.
+* git xl hook:
+    Install a pre-commit hook that runs git xl check.\n
+Options
+-------\n
+* --startup-profile:
+    Report the time spent importing modules, e.g. git xl --startup-profile version.
+    The diff command (git-xl-diff) accepts it as well."""
 
 HELP_ENV = 'git xl env\n\nDisplay the current Git XL environment.'
 
@@ -210,7 +363,17 @@ Without any options, git xl install will setup the Excel differ and
 .gitignore globally.\n
 * --local:
     Sets the .gitignore filters and the git-diff Excel drop-in replacement
-    in the local repository, instead of the global git config (~/.gitconfig)."""
+    in the local repository, instead of the global git config (~/.gitconfig).
+* --textconv:
+    Instead of the git-diff drop-in replacement, install a textconv filter
+    (git xl textconv) that converts workbooks into text and let Git do the
+    diffing. This makes all of Git's diff options (--stat, --word-diff,
+    --diff-algorithm, -S, ...) work on Excel files, and Git caches the
+    converted text in refs/notes/textconv/xl.
+* --recursive [<directory>]:
+    Install locally in every repository in and below <directory> (default:
+    the current directory), several repositories at a time, and report how
+    many were set up. Repositories are not searched for nested ones."""
 
 HELP_UNINSTALL = """git xl uninstall [options]\n
 Uninstalls Git XL:\n
@@ -219,7 +382,213 @@ Without any options, git xl uninstall will remove the git-diff drop-in
 replacement for Excel files and .gitignore globally.\n
 * --local:
     Removes the .gitignore filters and the git-diff Excel drop-in replacement
-    in the local repository, instead globally."""
+    in the local repository, instead globally.
+* --recursive [<directory>]:
+    Uninstall locally from every repository in and below <directory>
+    (default: the current directory)."""
+
+HELP_VERIFY = """git xl verify [--local] [--recursive [<directory>]]\n
+Check that the Excel differ is configured and that .gitattributes and
+.gitignore have the Git xl entries, and list what is missing.\n
+Options:\n
+Without any options, git xl verify checks the global installation.\n
+* --local:
+    Check the local repository instead.
+* --recursive [<directory>]:
+    Check every repository in and below <directory> (default: the current
+    directory) and report those without Git xl."""
+
+HELP_CACHE = """git xl cache [info | prune [--max-size=<size>] | clear]\n
+Extracted VBA modules are cached on disk, keyed by the Git blob id of the
+workbook, so unchanged workbooks are never parsed twice.\n
+Commands:\n
+* info:
+    Show the cache location, number of entries and size (default).
+* prune:
+    Evict least recently used entries until the cache fits into its size
+    limit, or into <size> (e.g. 100M) when --max-size is given.
+* clear:
+    Remove all cache entries.\n
+Environment:\n
+* GIT_XL_CACHE_DIR:
+    Cache location (defaults to the platform's user cache directory).
+* GIT_XL_CACHE_SIZE:
+    Size limit, e.g. 512M or 2G (default 256M). 0 disables the cache."""
+
+
+HELP_DAEMON = """git xl daemon [start | stop | status | run]\n
+The daemon is a long-lived background process that keeps oletools loaded and
+extracted workbooks in memory. While it is running, the Git diff driver hands
+every diff over to it through a Unix domain socket instead of starting up a
+new interpreter; when it is not running, diffs are computed in-process.\n
+Commands:\n
+* start:
+    Start the daemon in the background.
+* stop:
+    Stop a running daemon.
+* status:
+    Report whether the daemon is running (default).
+* run:
+    Run the daemon in the foreground.\n
+Environment:\n
+* GIT_XL_DAEMON_SOCKET:
+    Socket path (defaults to daemon.sock in the cache directory).
+* GIT_XL_DAEMON_IDLE_TIMEOUT:
+    Seconds without a diff after which the daemon exits (default 1800,
+    0 keeps it running)."""
+
+
+HELP_TEXTCONV = """git xl textconv <file>\n
+Print the VBA modules of an Excel workbook as plain text, sorted by module
+name. Each module starts with its Attribute VB_Name line, as in an exported
+module file. Used as Git textconv filter by git xl install --textconv."""
+
+HELP_EXPORT = """git xl export [--watch [--interval=<seconds>]] <workbook or directory>... <directory>\n
+Write every VBA module of the workbooks, and of the workbooks below the given
+directories, to a file <directory>/<workbook>/<module>.bas (.cls for class and
+document modules, .frm for forms), starting with its Attribute VB_Name line,
+for code search or an editor, e.g.\n
+    git xl export Book1.xlsm vba
+    git xl export --watch Reports vba\n
+A manifest in the directory (.git-xl-export.json) records the size,
+modification time and module digests of every workbook exported. Running it
+again only extracts the workbooks whose size or modification time changed and
+only writes the modules whose code changed; modules and workbooks that were
+deleted are removed.\n
+Options:\n
+* --watch:
+    Keep running and export the workbooks as they change, until interrupted.
+* --interval=<seconds>:
+    Time between two checks for changed workbooks with --watch (default: 2)."""
+
+HELP_DIFF = """git xl diff [<options>] [<revision range>] [-- <paths>]\n
+Print the VBA diff of every Excel workbook that changed in a commit range, in
+one process: the changed workbooks are listed with a single git diff --raw,
+read with a single git cat-file --batch and extracted in parallel. The output
+is the same as that of git diff with the Git xl diff driver, e.g.\n
+    git xl diff main..feature
+    git xl diff HEAD~3 -- Reports/\n
+Without a revision range, the working tree is compared to the index.\n
+Options:\n
+* --diff-algorithm=<name>:
+    difflib (default), myers or histogram.
+* --diff-granularity=<name>:
+    module (default) diffs whole modules, procedure only diffs the procedures
+    that changed and notes the ones that moved.
+* --format=<name>:
+    text (default), ndjson for a JSON record per changed module and line, or
+    json for a JSON array of those records.
+* --sheets=<bool>:
+    Diff the cells of the worksheets as well (default: diff.xl.sheets).
+* -U<n>, --unified=<n>:
+    Number of context lines (default: 3)."""
+
+HELP_LOG = """git xl log [<options>] [<revision range>] [[--] <paths>]\n
+Show the commits that changed Excel workbooks, each followed by the VBA diff of
+its workbooks, like git log -p with the Git xl diff driver but faster: history is
+walked once and every workbook version is extracted once, instead of once as the
+new and once more as the old side of two consecutive commits, e.g.\n
+    git xl log Book1.xlsb
+    git xl log -n 10 --since=1.year -- Reports/
+    git xl log -L Module1.Total\n
+Options not listed below are passed on to git log.\n
+Options:\n
+* -L <module>.<procedure>:
+    Only show the commits that changed the Sub, Function or Property, with the
+    diff of just that procedure. The module may be left out to follow the
+    procedure in any module. Answered from the index (see git xl index).
+* --diff-algorithm=<name>:
+    difflib (default), myers or histogram.
+* --diff-granularity=<name>:
+    module (default) diffs whole modules, procedure only diffs the procedures
+    that changed and notes the ones that moved.
+* --format=<name>:
+    text (default), ndjson for a JSON record per changed module and line, or
+    json for a JSON array of those records.
+* --sheets=<bool>:
+    Diff the cells of the worksheets as well (default: diff.xl.sheets).
+* -U<n>, --unified=<n>:
+    Number of context lines (default: 3)."""
+
+
+HELP_INDEX = """git xl index [--rebuild] [<revision range>] [[--] <paths>]\n
+Store the modules and procedures (name, line range, digest) of every workbook
+version in the history of the revisions (default: HEAD) in an index in the Git
+directory (.git/xl/index.sqlite). Versions already indexed are skipped, so
+running it again only extracts the workbooks of new commits. git xl grep and
+git xl log -L answer from the index and update it on the fly.\n
+Options:\n
+* --rebuild:
+    Drop the index and index all workbook versions again."""
+
+HELP_GREP = """git xl grep [-i] <pattern> [<revision range>] [[--] <paths>]\n
+Print the lines matching a regular expression that each commit added to the VBA
+code of a workbook, newest first, as <commit>:<workbook>/VBA/<module>:<line>:<text>,
+e.g.\n
+    git xl grep "Application.Run"
+    git xl grep -i msgbox main..feature -- Reports/\n
+Answered from the index (see git xl index), only workbook versions that are not
+indexed yet are extracted.\n
+Options:\n
+* -i, --ignore-case:
+    Match case-insensitively."""
+
+HELP_STATS = """git xl stats [--top=<n>] [--clear] [<trace file>]\n
+Summarise a trace file: time per command and phase (git, cache, read, parse,
+decompress, extract, diff, output), counters such as bytes read, modules and
+cache hits, and the workbooks that took longest to extract (default: 10).
+Commands are only traced while tracing is on:\n
+    GIT_XL_TRACE=1 git diff
+    git config diff.xl.trace /tmp/git-xl-trace.ndjson\n
+Every traced diff (once per workbook when run by git diff) and every traced
+git xl diff, log, index, grep and textconv command appends a JSON record to
+the trace file, one per line.\n
+Options:\n
+* --top=<n>:
+    Number of slowest workbooks to list.
+* --clear:
+    Delete the trace file.\n
+Environment:\n
+* GIT_XL_TRACE:
+    The trace file, or 1 for trace.ndjson in the cache directory. Overrides
+    the diff.xl.trace setting."""
+
+HELP_CHECK = """git xl check --staged [--rules=<names>] [[--] <paths>]\n
+Check the VBA code of the workbooks staged for the next commit and print a line
+per problem as <workbook>/VBA/<module>:<line>: <message> (<rule>). The exit
+status is 1 when problems were found, so that a pre-commit hook (see git xl
+hook) stops the commit.\n
+Only modules that are new or changed since HEAD are checked. Workbooks whose
+VBA project is unchanged are skipped without extracting them, and extracted
+workbooks are cached like diffs.\n
+Rules:\n
+* option-explicit:
+    The module has code but no Option Explicit (default).
+* stop:
+    A Stop statement (default).
+* debug-print, debug-assert:
+    A Debug.Print or Debug.Assert statement.\n
+Options:\n
+* --rules=<names>:
+    Comma separated rules to run instead of those of diff.xl.checks, or of
+    the default ones.\n
+Configuration:\n
+* diff.xl.checks:
+    Comma separated rules to run, e.g. option-explicit,stop,debug-print.
+* diff.xl.rule.<name>:
+    A regular expression, lines matching it are reported as rule <name>,
+    e.g. git config diff.xl.rule.no-msgbox "\\bMsgBox\\b". Runs by default."""
+
+HELP_HOOK = """git xl hook (install [--force] | uninstall)\n
+Install a pre-commit hook in the current repository that runs git xl check
+--staged, so that commits adding VBA code with problems are stopped (git commit
+--no-verify skips it).\n
+Commands:\n
+* install:
+    Write the hook. An existing pre-commit hook that was not installed by
+    git xl is only replaced with --force.
+* uninstall:
+    Remove the hook, if it was installed by git xl."""
 
 
 class CommandParser:
@@ -242,6 +611,12 @@ class CommandParser:
                 f"""Error: unknown command "{command}" for "git-xl"\nRun 'git-xl --help' for usage.""")
 
         # execute command
+        if command in TRACED_COMMANDS:
+            import diff
+            import tracing
+            options = dict(arg[2:].split('=', 1) for arg in args if arg.startswith('--trace='))
+            with tracing.session(diff.get_trace_path(options), command, args):
+                return getattr(self, command)(*args)
         getattr(self, command)(*args)
 
     def version(self, *args):
@@ -249,12 +624,14 @@ class CommandParser:
 
     def env(self):
         current_path = os.getcwd()
+        # a single git call for all three lines
+        is_repository = is_git_repository(current_path)
         p = GIT_XL_VERSION + '\n\n'
-        p += 'LocalWorkingDir=' + (current_path if is_git_repository(current_path) else '') + '\n'
+        p += 'LocalWorkingDir=' + (current_path if is_repository else '') + '\n'
         p += 'LocalGitIgnore=' + (
-            os.path.join(current_path, '.gitignore') if is_git_repository(current_path) else '') + '\n'
+            os.path.join(current_path, '.gitignore') if is_repository else '') + '\n'
         p += 'LocalGitAttributes=' + (
-            os.path.join(current_path, '.gitattributes') if is_git_repository(current_path) else '') + '\n'
+            os.path.join(current_path, '.gitattributes') if is_repository else '') + '\n'
         print(p)
 
     def help(self, *args):
@@ -269,28 +646,328 @@ class CommandParser:
             else:
                 print(getattr(module, help_text))
 
+    def parse_install_args(self, command, args, options):
+        # (mode, set of options given, directory of --recursive) of install, uninstall and verify,
+        # None after reporting an invalid option; --recursive takes an optional directory
+        mode = 'global'
+        given = set()
+        directory = None
+        for arg in args:
+            if arg == '--local' or arg == '--global' and '--global' in options:
+                mode = arg[2:]
+            elif arg in options or arg == '--recursive':
+                given.add(arg)
+            elif '--recursive' in given and directory is None and not arg.startswith('-'):
+                directory = arg
+            else:
+                print(f"""Invalid option "{arg}" for "git-xl {command}"\nRun 'git-xl --help' for usage.""")
+                return None
+        return mode, given, directory
+
     def install(self, *args):
-        if not args or args[0] == '--global':
+        parsed = self.parse_install_args('install', args, ('--global', '--textconv'))
+        if parsed is None:
+            return
+        mode, given, directory = parsed
+        textconv = '--textconv' in given
+        if '--recursive' in given:
+            return self.run_recursive(directory, lambda installer: installer.install(textconv=textconv), 'Installed')
+        if mode == 'global':
             installer = Installer(mode='global')
-        elif args[0] == '--local':
+        else:
             installer = Installer(mode='local', path=os.getcwd())
+        if textconv:
+            installer.install(textconv=True)
         else:
-            return print(
-                f"""Invalid option "{args[0]}" for "git-xl install"\nRun 'git-xl --help' for usage.""")
-        installer.install()
+            installer.install()
 
     def uninstall(self, *args):
-        if args:
-            if args[0] == '--local':
-                installer = Installer(mode='local', path=os.getcwd())
-            else:
-                return print(
-                    f"""Invalid option "{args[0]}" for "git-xl install"\nRun 'git-xl --help' for usage.""")
+        parsed = self.parse_install_args('uninstall', args, ())
+        if parsed is None:
+            return
+        mode, given, directory = parsed
+        if '--recursive' in given:
+            return self.run_recursive(directory, Installer.uninstall, 'Uninstalled')
+        if mode == 'local':
+            installer = Installer(mode='local', path=os.getcwd())
         else:
             installer = Installer(mode='global')
         installer.uninstall()
 
+    def verify(self, *args):
+        parsed = self.parse_install_args('verify', args, ())
+        if parsed is None:
+            return
+        mode, given, directory = parsed
+        if '--recursive' in given:
+            return self.run_recursive(directory, Installer.verify, 'Verified')
+        try:
+            installer = Installer(mode='local', path=os.getcwd()) if mode == 'local' else Installer(mode='global')
+        except ValueError as e:
+            return print(f'Error: {e}')
+        missing = installer.verify()
+        if missing:
+            print('Git xl is not installed, missing: ' + ', '.join(missing))
+        else:
+            print('Git xl is installed')
+
+    def run_recursive(self, directory, action, verb):
+        # install, uninstall or verify every repository in and below the directory, in parallel
+        directory = os.path.abspath(directory or os.getcwd())
+        if not os.path.isdir(directory):
+            return print(f'Error: {directory} is not a directory')
+        results = run_installers(find_repositories(directory), action)
+        failed = 0
+        incomplete = 0
+        for path, result, error in results:
+            if error is not None:
+                failed += 1
+                print(f'Error: {path}: {error}')
+            elif result:
+                # verify returns the missing parts
+                incomplete += 1
+                print(f'Not installed: {path} (missing {", ".join(result)})')
+        summary = f'{verb} {len(results) - failed - incomplete} of {len(results)} repositories under {directory}'
+        if failed:
+            summary += f', {failed} failed'
+        if incomplete:
+            summary += f', {incomplete} without Git xl'
+        print(summary)
+
+    def textconv(self, *args):
+        if len(args) != 1:
+            return print(f"""Usage: git xl textconv <file>\nRun 'git-xl help textconv' for usage.""")
+        import diff
+        diff.print_textconv(args[0])
+
+    def export(self, *args):
+        import export
+        watch = False
+        interval = export.DEFAULT_INTERVAL
+        paths = []
+        for arg in args:
+            if arg == '--watch':
+                watch = True
+            elif arg.startswith('--interval='):
+                try:
+                    interval = float(arg[len('--interval='):])
+                except ValueError:
+                    return print(f'Error: invalid number "{arg[len("--interval="):]}"')
+            elif arg.startswith('-'):
+                return print(
+                    f"""Invalid option "{arg}" for "git-xl export"\nRun 'git-xl help export' for usage.""")
+            else:
+                paths.append(arg)
+        if len(paths) < 2:
+            return print(f"""Usage: git xl export [--watch] <workbook or directory>... <directory>\nRun 'git-xl help export' for usage.""")
+        sources, directory = paths[:-1], paths[-1]
+        for source in sources:
+            if not os.path.exists(source):
+                return print(f'Error: no such workbook or directory "{source}"')
+        exporter = export.Exporter(directory)
+        try:
+            changes, count = exporter.sync(export.iter_workbooks(sources, FILE_EXTENSIONS))
+        except (ValueError, OSError) as e:
+            return print(f'Error: {e}')
+        for change in changes:
+            print(export.format_change(change))
+        written = sum(len(change.written or ()) for change in changes)
+        print(f'Exported {written} modules of {count} workbooks to {directory}')
+        if not watch:
+            return
+        print('Watching for changes, press Ctrl+C to stop')
+        try:
+            exporter.watch(sources, FILE_EXTENSIONS, lambda change: print(export.format_change(change), flush=True),
+                           interval)
+        except (ValueError, OSError) as e:
+            print(f'Error: {e}')
+        except KeyboardInterrupt:
+            pass
+
+    def diff(self, *args):
+        import batch
+        import plumbing
+        try:
+            batch.diff_range(args)
+        except (plumbing.GitError, ValueError) as e:
+            print(f'Error: {e}')
+        except BrokenPipeError:
+            exit_on_broken_pipe()
+
+    def log(self, *args):
+        import batch
+        import plumbing
+        try:
+            batch.log_range(args)
+        except (plumbing.GitError, ValueError) as e:
+            print(f'Error: {e}')
+        except BrokenPipeError:
+            exit_on_broken_pipe()
+
+    def index(self, *args):
+        import index
+        import plumbing
+        rebuild = '--rebuild' in args
+        try:
+            added, total = index.index_range([arg for arg in args if arg != '--rebuild'], rebuild=rebuild)
+        except (plumbing.GitError, ValueError) as e:
+            return print(f'Error: {e}')
+        print(f'Indexed {added} new workbook versions ({total} in total)')
+
+    def grep(self, *args):
+        import index
+        import plumbing
+        try:
+            index.grep_range(args)
+        except (plumbing.GitError, ValueError) as e:
+            print(f'Error: {e}')
+
+    def check(self, *args):
+        import checks
+        import plumbing
+        rules = None
+        staged = False
+        paths = []
+        for arg in args:
+            if arg == '--staged':
+                staged = True
+            elif arg.startswith('--rules='):
+                rules = arg[len('--rules='):]
+            elif arg == '--' or not arg.startswith('-'):
+                if arg != '--':
+                    paths.append(arg)
+            else:
+                return print(
+                    f"""Invalid option "{arg}" for "git-xl check"\nRun 'git-xl help check' for usage.""")
+        if not staged:
+            return print(f"""Usage: git xl check --staged [--rules=<names>] [[--] <paths>]\nRun 'git-xl help check' for usage.""")
+        try:
+            problems = checks.check_staged(paths, checks.get_rules(rules))
+        except (plumbing.GitError, ValueError) as e:
+            print(f'Error: {e}')
+            sys.exit(2)
+        for problem in problems:
+            print(checks.format_problem(problem))
+        if problems:
+            # a non-zero exit status makes git abort the commit
+            print(f'{len(problems)} problems found, commit with --no-verify to skip the check')
+            sys.exit(1)
+
+    def hook(self, *args):
+        import checks
+        import plumbing
+        command = args[0] if args else None
+        options = args[1:]
+        if command not in ('install', 'uninstall') or [arg for arg in options if arg != '--force'] or (
+                options and command == 'uninstall'):
+            return print(f"""Usage: git xl hook (install [--force] | uninstall)\nRun 'git-xl help hook' for usage.""")
+        try:
+            if command == 'install':
+                print(f'Installed {checks.install_hook(get_git_xl_command(), force="--force" in options)}')
+            else:
+                path = checks.uninstall_hook()
+                print(f'Removed {path}' if path else 'No git xl hook installed')
+        except (plumbing.GitError, ValueError, OSError) as e:
+            print(f'Error: {e}')
+
+    def stats(self, *args):
+        import diff
+        import tracing
+        top = tracing.DEFAULT_TOP
+        clear = False
+        path = None
+        for arg in args:
+            if arg.startswith('--top='):
+                try:
+                    top = int(arg[len('--top='):])
+                except ValueError:
+                    return print(f'Error: invalid number "{arg[len("--top="):]}"')
+            elif arg == '--clear':
+                clear = True
+            elif arg.startswith('-'):
+                return print(
+                    f"""Invalid option "{arg}" for "git-xl stats"\nRun 'git-xl help stats' for usage.""")
+            else:
+                path = os.path.abspath(arg)
+        path = path or diff.get_trace_path({}) or tracing.get_trace_path('1')
+        if not os.path.exists(path):
+            return print(f'No trace file at {path}, set GIT_XL_TRACE or diff.xl.trace to record one')
+        if clear:
+            os.remove(path)
+            return print(f'Removed {path}')
+        print('TraceFile=' + path + '\n')
+        print('\n'.join(tracing.format_stats(tracing.read_records(path), top)))
+
+    def cache(self, *args):
+        from cache import Cache, parse_size
+        command = args[0] if args else 'info'
+        cache = Cache()
+        if command == 'info':
+            entries = cache.entries()
+            p = 'CacheDir=' + cache.path + '\n'
+            p += 'Entries=' + str(len(entries)) + '\n'
+            p += 'Size=' + str(sum(size for _, _, size, _ in entries)) + '\n'
+            p += 'MaxSize=' + str(cache.max_size) + '\n'
+            print(p)
+        elif command == 'prune':
+            max_size = None
+            for arg in args[1:]:
+                if not arg.startswith('--max-size='):
+                    return print(
+                        f"""Invalid option "{arg}" for "git-xl cache prune"\nRun 'git-xl help cache' for usage.""")
+                try:
+                    max_size = parse_size(arg[len('--max-size='):])
+                except ValueError as e:
+                    return print(f'Error: {e}')
+            print(f'Removed {cache.prune(max_size=max_size)} cache entries')
+        elif command == 'clear':
+            print(f'Removed {cache.clear()} cache entries')
+        else:
+            return print(
+                f"""Invalid option "{command}" for "git-xl cache"\nRun 'git-xl help cache' for usage.""")
+
+    def daemon(self, *args):
+        import daemon
+        import subprocess
+        command = args[0] if args else 'status'
+        if not daemon.is_supported():
+            return print('Error: git xl daemon requires Unix domain sockets, which are not available on this platform')
+        if command == 'status':
+            if daemon.ping():
+                print(f'git xl daemon is running ({daemon.get_socket_path()})')
+            else:
+                print('git xl daemon is not running')
+        elif command == 'start':
+            if daemon.ping():
+                return print('git xl daemon is already running')
+            subprocess.Popen(get_git_xl_command() + ['daemon', 'run'], stdin=subprocess.DEVNULL,
+                             stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+            # wait for the daemon to accept connections
+            for _ in range(100):
+                if daemon.ping():
+                    return print(f'git xl daemon started ({daemon.get_socket_path()})')
+                time.sleep(0.1)
+            print('Error: git xl daemon did not start')
+        elif command == 'stop':
+            if daemon.stop():
+                print('git xl daemon stopped')
+            else:
+                print('git xl daemon is not running')
+        elif command == 'run':
+            try:
+                daemon.serve()
+            except RuntimeError as e:
+                print(f'Error: {e}')
+        else:
+            return print(
+                f"""Invalid option "{command}" for "git-xl daemon"\nRun 'git-xl help daemon' for usage.""")
+
 
 if __name__ == '__main__':
+    if is_frozen():
+        import multiprocessing
+        multiprocessing.freeze_support()
     command_parser = CommandParser(sys.argv[1:])
     command_parser.execute()
+    if PROFILE:
+        PROFILE.report()
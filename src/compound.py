@@ -0,0 +1,288 @@
+import struct
+from collections import namedtuple
+
+# MS-CFB compound files (OLE2), the container of xls workbooks and of the VBA project of every
+# workbook format
+
+MAGIC = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'
+HEADER_SIZE = 512
+SECTOR_SIZE = 512
+MINI_SECTOR_SIZE = 64
+MINI_STREAM_CUTOFF = 4096
+FAT_ENTRIES_PER_SECTOR = SECTOR_SIZE // 4
+HEADER_DIFAT_ENTRIES = 109
+DIRECTORY_ENTRY_SIZE = 128
+MAXREGSECT = 0xFFFFFFFA
+FREESECT = 0xFFFFFFFF
+ENDOFCHAIN = 0xFFFFFFFE
+FATSECT = 0xFFFFFFFD
+DIFSECT = 0xFFFFFFFC
+NOSTREAM = 0xFFFFFFFF
+STORAGE, STREAM, ROOT = 1, 2, 5
+
+Entry = namedtuple('Entry', ['name', 'type', 'left', 'right', 'child', 'start', 'size'])
+
+
+class FormatError(ValueError):
+    pass
+
+
+class CompoundFile:
+    # reads streams of a compound file held in a bytes-like object, e.g. a mmap of the file:
+    # chains are followed one FAT entry at a time, so only the header, the directory, the FAT
+    # sectors of the chains followed and the streams read are ever touched
+
+    def __init__(self, data):
+        if len(data) < HEADER_SIZE or data[:len(MAGIC)] != MAGIC:
+            raise FormatError('not a compound file')
+        self.data = data
+        sector_shift, mini_sector_shift = struct.unpack_from('<HH', data, 0x1E)
+        if sector_shift not in (9, 12) or mini_sector_shift != 6:
+            raise FormatError(f'unsupported sector size 2^{sector_shift}')
+        self.sector_size = 1 << sector_shift
+        (_, directory_start, _, self.mini_stream_cutoff, self.mini_fat_start, _, self.next_difat,
+         _) = struct.unpack_from('<8I', data, 0x2C)
+        self.fat_sectors = list(struct.unpack_from(f'<{HEADER_DIFAT_ENTRIES}I', data, 0x4C))
+        # a chain with more sectors than the file has loops
+        self.max_sectors = (len(data) + self.sector_size - 1) // self.sector_size
+        # start sector -> the sectors of the chain followed so far
+        self.chains = {}
+        directory = self.read_chain(directory_start)
+        self.entries = [self.parse_entry(directory, offset)
+                        for offset in range(0, len(directory) - DIRECTORY_ENTRY_SIZE + 1, DIRECTORY_ENTRY_SIZE)]
+        if not self.entries or self.entries[0].type != ROOT:
+            raise FormatError('no root entry')
+
+    def parse_entry(self, directory, offset):
+        (name, name_size, entry_type, _, left, right, child, _, _, _, _, start,
+         size) = struct.unpack_from('<64sHBBIII16sIQQIQ', directory, offset)
+        if self.sector_size == SECTOR_SIZE:
+            # version 3 files may have anything in the high half of the size
+            size &= 0xFFFFFFFF
+        name = name[:max(name_size - 2, 0)].decode('utf-16-le', 'replace')
+        return Entry(name, entry_type, left, right, child, start, size)
+
+    def get_sector(self, sector):
+        # the last sector may be cut short, the stream sizes tell whether that matters
+        offset = (sector + 1) * self.sector_size
+        if sector > MAXREGSECT or offset >= len(self.data):
+            raise FormatError(f'sector {sector} is out of range')
+        return self.data[offset:offset + self.sector_size]
+
+    def get_fat_sector(self, index):
+        # the DIFAT sectors beyond the header are only read once a chain reaches that far
+        while index >= len(self.fat_sectors):
+            if self.next_difat > MAXREGSECT or len(self.fat_sectors) > self.max_sectors:
+                raise FormatError('FAT is too short')
+            entries = struct.unpack(f'<{self.sector_size // 4}I', self.get_sector(self.next_difat))
+            self.fat_sectors.extend(entries[:-1])
+            self.next_difat = entries[-1]
+        return self.fat_sectors[index]
+
+    def next_sector(self, sector):
+        entries_per_sector = self.sector_size // 4
+        fat_sector = self.get_fat_sector(sector // entries_per_sector)
+        offset = (fat_sector + 1) * self.sector_size + sector % entries_per_sector * 4
+        if fat_sector > MAXREGSECT or offset + 4 > len(self.data):
+            raise FormatError(f'FAT sector {fat_sector} is out of range')
+        return struct.unpack_from('<I', self.data, offset)[0]
+
+    def get_chain_sector(self, start, index):
+        # the index-th sector of the chain starting at start
+        sectors = self.chains.setdefault(start, [start])
+        while len(sectors) <= index:
+            sector = self.next_sector(sectors[-1])
+            if sector > MAXREGSECT or len(sectors) >= self.max_sectors:
+                raise FormatError(f'chain starting at sector {start} is too short')
+            sectors.append(sector)
+        return sectors[index]
+
+    def read_chain(self, start, size=None):
+        chunks = []
+        sector = start
+        while sector != ENDOFCHAIN and (size is None or len(chunks) * self.sector_size < size):
+            if len(chunks) >= self.max_sectors:
+                raise FormatError(f'chain starting at sector {start} loops')
+            chunks.append(self.get_sector(sector))
+            sector = self.next_sector(sector)
+        data = b''.join(chunks)
+        if size is None:
+            return data
+        if len(data) < size:
+            raise FormatError(f'chain starting at sector {start} is too short')
+        return data[:size]
+
+    def read_mini_chain(self, start, size):
+        # mini sectors are located through the chains of the mini FAT and of the mini stream,
+        # which is the stream of the root entry
+        root = self.entries[0]
+        chunks = []
+        sector = start
+        while len(chunks) * MINI_SECTOR_SIZE < size:
+            offset = sector * MINI_SECTOR_SIZE
+            if sector > MAXREGSECT or offset + MINI_SECTOR_SIZE > root.size:
+                raise FormatError(f'mini sector {sector} is out of range')
+            data = self.get_sector(self.get_chain_sector(root.start, offset // self.sector_size))
+            chunks.append(data[offset % self.sector_size:offset % self.sector_size + MINI_SECTOR_SIZE])
+            entries_per_sector = self.sector_size // 4
+            fat_sector = self.get_chain_sector(self.mini_fat_start, sector // entries_per_sector)
+            sector = struct.unpack_from('<I', self.get_sector(fat_sector), sector % entries_per_sector * 4)[0]
+        data = b''.join(chunks)
+        if len(data) < size:
+            raise FormatError(f'mini chain starting at sector {start} is too short')
+        return data[:size]
+
+    def read_stream(self, entry):
+        if entry.size == 0:
+            return b''
+        if entry.size < self.mini_stream_cutoff:
+            return self.read_mini_chain(entry.start, entry.size)
+        return self.read_chain(entry.start, entry.size)
+
+    def get_children(self, entry):
+        # the children of a storage form a tree of siblings, walked without relying on its order
+        children = []
+        pending = [entry.child]
+        seen = set()
+        while pending:
+            entry_id = pending.pop()
+            if entry_id == NOSTREAM:
+                continue
+            if entry_id >= len(self.entries) or entry_id in seen:
+                raise FormatError(f'invalid directory entry {entry_id}')
+            seen.add(entry_id)
+            child = self.entries[entry_id]
+            children.append(child)
+            pending += [child.right, child.left]
+        return children
+
+    def find(self, path):
+        # the entry of a path like '_VBA_PROJECT_CUR/VBA', names compare case-insensitively
+        entry = self.entries[0]
+        for name in path.split('/'):
+            entry = next((child for child in self.get_children(entry) if child.name.upper() == name.upper()), None)
+            if entry is None:
+                return None
+        return entry
+
+    def read_storage(self, entry, prefix=''):
+        # {path: data} of every stream below a storage, paths relative to it
+        streams = {}
+        for child in self.get_children(entry):
+            if child.type == STREAM:
+                streams[prefix + child.name] = self.read_stream(child)
+            elif child.type == STORAGE:
+                streams.update(self.read_storage(child, prefix + child.name + '/'))
+        return streams
+
+
+def compound_file(streams):
+    # MS-CFB version 3: streams maps paths like 'VBA/dir' to their data
+    root = {'name': 'Root Entry', 'type': ROOT, 'children': {}}
+    for path, data in streams.items():
+        node = root
+        parts = path.split('/')
+        for part in parts[:-1]:
+            node = node['children'].setdefault(part, {'name': part, 'type': STORAGE, 'children': {}})
+        node['children'][parts[-1]] = {'name': parts[-1], 'type': STREAM, 'data': data}
+
+    entries = []
+
+    def add(node):
+        node['id'] = len(entries)
+        node['left'] = node['right'] = node['child'] = NOSTREAM
+        entries.append(node)
+        children = sorted(node.get('children', {}).values(), key=lambda child: (len(child['name']),
+                                                                                child['name'].upper()))
+        for child in children:
+            add(child)
+        node['child'] = balanced_tree(children)
+
+    def balanced_tree(children):
+        # siblings form a binary search tree, a balanced one is a valid red-black tree when all black
+        if not children:
+            return NOSTREAM
+        middle = len(children) // 2
+        children[middle]['left'] = balanced_tree(children[:middle])
+        children[middle]['right'] = balanced_tree(children[middle + 1:])
+        return children[middle]['id']
+
+    add(root)
+
+    fat = []
+    sectors = bytearray()
+
+    def allocate(data):
+        if not data:
+            return ENDOFCHAIN
+        start = len(fat)
+        count = (len(data) + SECTOR_SIZE - 1) // SECTOR_SIZE
+        fat.extend(range(start + 1, start + count))
+        fat.append(ENDOFCHAIN)
+        sectors.extend(data)
+        sectors.extend(b'\0' * (count * SECTOR_SIZE - len(data)))
+        return start
+
+    mini_stream = bytearray()
+    mini_fat = []
+    for entry in entries:
+        if entry['type'] != STREAM:
+            entry['start'], entry['size'] = 0, 0
+            continue
+        data = entry['data']
+        entry['size'] = len(data)
+        if not data:
+            entry['start'] = ENDOFCHAIN
+        elif len(data) < MINI_STREAM_CUTOFF:
+            entry['start'] = len(mini_fat)
+            count = (len(data) + MINI_SECTOR_SIZE - 1) // MINI_SECTOR_SIZE
+            mini_fat.extend(range(entry['start'] + 1, entry['start'] + count))
+            mini_fat.append(ENDOFCHAIN)
+            mini_stream.extend(data)
+            mini_stream.extend(b'\0' * (count * MINI_SECTOR_SIZE - len(data)))
+        else:
+            entry['start'] = allocate(data)
+    root['start'], root['size'] = allocate(bytes(mini_stream)), len(mini_stream)
+    mini_fat_data = struct.pack(f'<{len(mini_fat)}I', *mini_fat)
+    mini_fat_start = allocate(mini_fat_data)
+    mini_fat_count = (len(mini_fat_data) + SECTOR_SIZE - 1) // SECTOR_SIZE
+
+    directory = bytearray()
+    for entry in entries:
+        name = (entry['name'] + '\0').encode('utf-16-le')
+        directory += struct.pack('<64sHBBIII16sIQQIQ', name, len(name), entry['type'], 1, entry['left'],
+                                 entry['right'], entry['child'], b'\0' * 16, 0, 0, 0, entry['start'], entry['size'])
+    while len(directory) % SECTOR_SIZE:
+        directory += struct.pack('<64sHBBIII16sIQQIQ', b'', 0, 0, 0, NOSTREAM, NOSTREAM, NOSTREAM, b'\0' * 16,
+                                 0, 0, 0, 0, 0)
+    directory_start = allocate(bytes(directory))
+
+    # the FAT has to cover its own sectors and those of the DIFAT
+    fat_count = difat_count = 0
+    while True:
+        total = len(fat) + fat_count + difat_count
+        needed = (total + FAT_ENTRIES_PER_SECTOR - 1) // FAT_ENTRIES_PER_SECTOR
+        difat_needed = max(0, (needed - HEADER_DIFAT_ENTRIES + FAT_ENTRIES_PER_SECTOR - 2) //
+                           (FAT_ENTRIES_PER_SECTOR - 1))
+        if (needed, difat_needed) == (fat_count, difat_count):
+            break
+        fat_count, difat_count = needed, difat_needed
+    fat_sectors = list(range(len(fat), len(fat) + fat_count))
+    difat_sectors = list(range(len(fat) + fat_count, len(fat) + fat_count + difat_count))
+    fat += [FATSECT] * fat_count + [DIFSECT] * difat_count
+    fat += [FREESECT] * (fat_count * FAT_ENTRIES_PER_SECTOR - len(fat))
+    sectors += struct.pack(f'<{len(fat)}I', *fat)
+    remaining = fat_sectors[HEADER_DIFAT_ENTRIES:]
+    for i, sector in enumerate(difat_sectors):
+        ids = remaining[i * 127:(i + 1) * 127]
+        ids += [FREESECT] * (127 - len(ids))
+        sectors += struct.pack('<128I', *ids, difat_sectors[i + 1] if i + 1 < len(difat_sectors) else ENDOFCHAIN)
+
+    header_difat = fat_sectors[:HEADER_DIFAT_ENTRIES]
+    header_difat += [FREESECT] * (HEADER_DIFAT_ENTRIES - len(header_difat))
+    header = struct.pack('<8s16sHHHHH6sIIIIIIIII', b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1', b'\0' * 16, 0x3E, 3, 0xFFFE,
+                         9, 6, b'\0' * 6, 0, fat_count, directory_start, 0, MINI_STREAM_CUTOFF,
+                         mini_fat_start if mini_fat else ENDOFCHAIN, mini_fat_count,
+                         difat_sectors[0] if difat_sectors else ENDOFCHAIN, difat_count)
+    header += struct.pack(f'<{HEADER_DIFAT_ENTRIES}I', *header_difat)
+    return bytes(header + sectors)
@@ -0,0 +1,217 @@
+import os
+import sys
+import json
+import time
+import socket
+import threading
+import socketserver
+from collections import OrderedDict
+
+from cache import Cache, get_cache_dir
+
+
+# seconds without a request after which a daemon shuts itself down
+DEFAULT_IDLE_TIMEOUT = 30 * 60
+# extracted workbooks kept in memory on top of the on-disk cache
+MEMORY_CACHE_ENTRIES = 256
+BUFFER_SIZE = 64 * 1024
+
+
+def is_supported():
+    return hasattr(socket, 'AF_UNIX')
+
+
+def get_socket_path():
+    return os.environ.get('GIT_XL_DAEMON_SOCKET') or os.path.join(get_cache_dir(), 'daemon.sock')
+
+
+def get_idle_timeout():
+    value = os.environ.get('GIT_XL_DAEMON_IDLE_TIMEOUT')
+    return int(value) if value else DEFAULT_IDLE_TIMEOUT
+
+
+def count_options(args):
+    # leading --name=value options are passed on to the diff as they are
+    count = 0
+    while count < len(args) and args[count].startswith('--'):
+        count += 1
+    return count
+
+
+def resolve_args(args):
+    # the daemon runs in another working directory, so workbook paths are made absolute
+    args = list(args)
+    offset = count_options(args)
+    offset += 1 if len(args) - offset == 8 else 0
+    for i in (offset + 1, offset + 4):
+        if args[i] not in ('nul', '/dev/null'):
+            args[i] = os.path.abspath(args[i])
+    return args
+
+
+def request(message, out=None, timeout=None):
+    # sends a request and returns its status; the payload that follows the status line is
+    # streamed to out as it arrives
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.settimeout(timeout)
+        client.connect(get_socket_path())
+        client.sendall(json.dumps(message).encode('utf-8') + b'\n')
+        with client.makefile('rb') as f:
+            status = f.readline().decode('utf-8').rstrip('\n')
+            if status == 'OK' and out is not None:
+                for chunk in iter(lambda: f.read1(BUFFER_SIZE), b''):
+                    out.write(chunk)
+                out.flush()
+    finally:
+        client.close()
+    return status
+
+
+def run_client(args):
+    # returns False whenever the diff has to be computed in-process instead
+    if not is_supported() or not 7 <= len(args) - count_options(args) <= 8 or \
+            not os.path.exists(get_socket_path()):
+        return False
+    try:
+        status = request({'command': 'diff', 'args': resolve_args(args)}, out=sys.stdout.buffer)
+    except (OSError, ValueError):
+        return False
+    return status == 'OK'
+
+
+def ping():
+    if not is_supported() or not os.path.exists(get_socket_path()):
+        return False
+    try:
+        return request({'command': 'ping'}, timeout=2) == 'OK'
+    except OSError:
+        return False
+
+
+def stop():
+    if not ping():
+        return False
+    request({'command': 'stop'}, timeout=2)
+    return True
+
+
+class MemoryCache(Cache):
+
+    def __init__(self, max_entries=MEMORY_CACHE_ENTRIES):
+        super().__init__()
+        self.max_entries = max_entries
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                return self.memory[key]
+        modules = super().get(key)
+        if modules is not None:
+            self.remember(key, modules)
+        return modules
+
+    def put(self, key, modules):
+        self.remember(key, modules)
+        super().put(key, modules)
+
+    def remember(self, key, modules):
+        with self.lock:
+            self.memory[key] = modules
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.max_entries:
+                self.memory.popitem(last=False)
+
+
+class ResponseWriter:
+    # prefixes the streamed payload with the OK status line, so that a request failing before
+    # any output was produced can still be answered with an error (and be retried in-process)
+
+    def __init__(self, out):
+        self.out = out
+        self.started = False
+
+    def write(self, data):
+        if not self.started:
+            self.out.write(b'OK\n')
+            self.started = True
+        if data:
+            self.out.write(data)
+
+    def flush(self):
+        self.out.flush()
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        self.server.last_request = time.monotonic()
+        out = ResponseWriter(self.wfile)
+        try:
+            message = json.loads(self.rfile.readline().decode('utf-8'))
+            command = message['command']
+            if command == 'diff':
+                import diff
+                diff.main(message['args'], out=out, cache=self.server.cache, executor=self.server.executor)
+            elif command not in ('ping', 'stop'):
+                raise ValueError(f'unknown command "{command}"')
+        except Exception as e:
+            if out.started:
+                raise
+            self.wfile.write(f'ERROR {e}\n'.encode('utf-8'))
+            return
+        if command == 'stop':
+            threading.Thread(target=self.server.shutdown).start()
+        if not out.started:
+            out.write(b'')
+
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, idle_timeout):
+        super().__init__(path, RequestHandler)
+        import diff
+        from concurrent.futures import ProcessPoolExecutor
+        import multiprocessing
+        self.cache = MemoryCache()
+        # spawned workers are safe to start from the threaded server and stay warm between diffs
+        self.executor = ProcessPoolExecutor(mp_context=multiprocessing.get_context('spawn'))
+        self.idle_timeout = idle_timeout
+        self.last_request = time.monotonic()
+        # warm up the imports that every diff needs
+        import oletools.olevba3
+
+    def watch_idle(self):
+        while True:
+            time.sleep(min(self.idle_timeout, 5))
+            if time.monotonic() - self.last_request > self.idle_timeout:
+                self.shutdown()
+                return
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def serve(idle_timeout=None):
+    path = get_socket_path()
+    if ping():
+        raise RuntimeError('daemon is already running')
+    # remove a stale socket left behind by a daemon that did not shut down cleanly
+    if os.path.exists(path):
+        os.remove(path)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    server = Server(path, get_idle_timeout() if idle_timeout is None else idle_timeout)
+    try:
+        os.chmod(path, 0o600)
+        if server.idle_timeout > 0:
+            threading.Thread(target=server.watch_idle, daemon=True).start()
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(path):
+            os.remove(path)
@@ -1,81 +1,747 @@
+import io
+import re
 import sys
 import os
+import time
+import struct
+
+import startup
+
+# installed before anything else is imported, so that the profile covers the whole start-up
+PROFILE = startup.enable(sys.argv) if __name__ == '__main__' else None
+
+import subprocess
+from functools import lru_cache
+from array import array
+from itertools import chain, islice
 from difflib import unified_diff
 
-import colorama
-from oletools.olevba3 import VBA_Parser
-from colorama import Fore, Back, Style, init
+import daemon
+import tracing
+import algorithms
+from cache import Cache, blob_sha, is_object_id, parse_size
+
+VBA_PROJECT_PART = 'xl/vbaproject.bin'
+# the storage of xls workbooks that holds the VBA project, and their workbook stream (BIFF8, BIFF5)
+VBA_PROJECT_STORAGE = '_VBA_PROJECT_CUR'
+WORKBOOK_STREAMS = ('Workbook', 'Book')
+# module types by the extension olevba gives a module; document modules (ThisWorkbook, the
+# sheets) are classes as well
+MODULE_TYPES = {'bas': 'module', 'cls': 'class', 'frm': 'form'}
+# attribute lines other than VB_Name, which the VBA editor hides
+HIDDEN_ATTRIBUTE = re.compile(r'\nAttribute[^\n]*?VB_[^\n]*')
+NEWLINE = re.compile(r'\n')
+# workbooks smaller than this are always extracted in-process
+PARALLEL_THRESHOLD = 2 * 1024 * 1024
+WRITE_BUFFER_SIZE = 64 * 1024
+# module: diff whole modules, procedure: diff procedure by procedure and report moved ones
+GRANULARITIES = ('module', 'procedure')
+DEFAULT_GRANULARITY = 'module'
+# text: coloured unified diff, ndjson: a JSON record per module and line, json: an array of them
+FORMATS = ('text', 'json', 'ndjson')
+DEFAULT_FORMAT = 'text'
+# git config's spelling of true, for boolean options
+TRUE_VALUES = ('true', 'yes', 'on', '1')
+# options that can be set in the git config instead of on the command line; git reads
+# diff.xl.algorithm itself (and rejects difflib), so the algorithm has a key of its own
+OPTION_CONFIG = {'diff-algorithm': 'diff.xl.vbaAlgorithm', 'diff-granularity': 'diff.xl.granularity',
+                 'format': 'diff.xl.format', 'sheets': 'diff.xl.sheets', 'trace': 'diff.xl.trace'}
+# options that can be set in the environment as well, which takes precedence over the git config
+OPTION_ENV = {'trace': 'GIT_XL_TRACE'}
+HUNK_HEADER = re.compile(r'^@@ -(\d+)(,\d+)? \+(\d+)(,\d+)? @@')
+# colorama's Style.BRIGHT and Fore.RED/GREEN/CYAN, colorama itself is only needed on Windows
+BRIGHT = b'\x1b[1m'
+LINE_COLORS = {'-': b'\x1b[31m', '+': b'\x1b[32m', '@': b'\x1b[36m'}
+# git log's colours of the commit header
+COMMIT_COLOR = b'\x1b[33m'
+RESET = b'\x1b[m'
+
+
+def __getattr__(name):
+    # modules only some code paths need are imported on first access, e.g. diff.colorama
+    if name == 'colorama':
+        import colorama
+        return colorama
+    if name in ('Fore', 'Back', 'Style'):
+        import colorama
+        return getattr(colorama, name)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+def VBA_Parser(*args, **kwargs):
+    # oletools is imported on first use: it dominates start-up time, which matters for
+    # the daemon client and for workbooks without macros
+    from oletools.olevba3 import VBA_Parser
+    return VBA_Parser(*args, **kwargs)
+
+
+def ProcessPoolExecutor(*args, **kwargs):
+    # only needed when several large workbooks are extracted at once
+    from concurrent.futures import ProcessPoolExecutor
+    return ProcessPoolExecutor(*args, **kwargs)
+
+
+class BufferReader(io.RawIOBase):
+    # read-only file object over a bytes-like object, reads copy only the requested range
+    # instead of the whole workbook (as BytesIO does for anything but bytes)
+
+    def __init__(self, data):
+        self.view = memoryview(data).cast('B')
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += len(self.view)
+        if offset < 0:
+            raise ValueError('negative seek position')
+        self.position = offset
+        return offset
+
+    def tell(self):
+        return self.position
 
+    def readinto(self, buffer):
+        chunk = self.view[self.position:self.position + len(buffer)]
+        buffer[:len(chunk)] = chunk
+        self.position += len(chunk)
+        return len(chunk)
 
-def get_vba(workbook):
-    vba_parser = VBA_Parser(workbook)
-    vba_modules = vba_parser.extract_all_macros() if vba_parser.detect_vba_macros() else []
 
-    modules = {}
+def get_vba_project(workbook):
+    # OOXML workbooks (xlsm, xlsb, xlam, ...) keep all VBA in a single OLE part, read just that
+    # part from the central directory instead of letting VBA_Parser scan the whole container;
+    # workbook is a path or a seekable binary file object
+    import zipfile
+    try:
+        with zipfile.ZipFile(workbook) as archive:
+            for info in archive.infolist():
+                if info.filename.lower() == VBA_PROJECT_PART:
+                    return archive.read(info)
+    except (zipfile.BadZipFile, OSError):
+        # not a zip container (e.g. xls), VBA_Parser has to handle it
+        return None
+    # zip container without a VBA project, i.e. a workbook without macros
+    return b''
 
-    for _, _, _, content in vba_modules:
-        decoded_content = content
-        lines = []
-        if '\r\n' in decoded_content:
-            lines = decoded_content.split('\r\n')
+
+def get_vba_project_entry(workbook):
+    # (CRC-32, size) of the VBA project part, from the zip's central directory without reading
+    # the part; () for zip containers without macros, None for other workbooks
+    import zipfile
+    try:
+        with zipfile.ZipFile(workbook) as archive:
+            for info in archive.infolist():
+                if info.filename.lower() == VBA_PROJECT_PART:
+                    return info.CRC, info.file_size
+    except (zipfile.BadZipFile, OSError):
+        return None
+    return ()
+
+
+def is_vba_project_unchanged(workbook_a, workbook_b):
+    # most commits to OOXML workbooks only change sheets, their VBA project part is stored as is
+    if workbook_a is None or workbook_b is None:
+        return False
+    entry_a = get_vba_project_entry(workbook_a)
+    return entry_a is not None and entry_a == get_vba_project_entry(workbook_b)
+
+
+def get_ole_vba_project(data):
+    # xls workbooks keep all VBA in the _VBA_PROJECT_CUR storage of their compound file, copy
+    # just its streams into a compound file of their own (laid out like the vbaProject.bin part
+    # of OOXML workbooks) instead of letting VBA_Parser read and scan the whole workbook; data is
+    # a bytes-like object, e.g. a mmap of the workbook, so only the sectors of the VBA project
+    # are read and memory use follows the size of the macros, not of the workbook
+    import compound
+    try:
+        container = compound.CompoundFile(data)
+        storage = container.find(VBA_PROJECT_STORAGE)
+        if storage is not None:
+            return compound.compound_file(container.read_storage(storage))
+        if any(container.find(name) for name in WORKBOOK_STREAMS):
+            # a workbook without macros
+            return b''
+    except (compound.FormatError, struct.error):
+        pass
+    # not a compound file, or not a workbook: VBA_Parser has to handle it
+    return None
+
+
+def map_vba_project(path):
+    import mmap
+    try:
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return get_ole_vba_project(mapped)
+    except (OSError, ValueError):
+        # e.g. an empty file, which can't be mapped
+        return None
+
+
+def iter_vba_modules(workbook, data=None):
+    # (name, type, source) of every module; data, if given, is the content of the workbook as a
+    # bytes-like or seekable binary file object and workbook just its name
+    with tracing.phase('read'):
+        if data is None:
+            vba_project = get_vba_project(workbook)
+            if vba_project is None:
+                vba_project = map_vba_project(workbook)
+        elif hasattr(data, 'read'):
+            vba_project = get_vba_project(data)
+            if vba_project is None:
+                data.seek(0)
+                data = data.read()
+                vba_project = get_ole_vba_project(data)
+        else:
+            vba_project = get_vba_project(BufferReader(data))
+            if vba_project is None:
+                vba_project = get_ole_vba_project(memoryview(data).cast('B'))
+    if vba_project == b'':
+        return
+    with tracing.phase('parse'):
+        if vba_project is not None:
+            tracing.count('vba_project_bytes', len(vba_project))
+            vba_parser = VBA_Parser(workbook, data=vba_project)
+        elif data is None:
+            vba_parser = VBA_Parser(workbook)
         else:
-            lines = decoded_content.split('\n')
-        if lines:
-            name = lines[0].replace('Attribute VB_Name = ', '').strip('"')
-            content = [line for line in lines[1:] if not (
-                line.startswith('Attribute') and 'VB_' in line)]
-            non_empty_lines_of_code = len([c for c in content if c])
-            modules[name] = '\n'.join(content)
-    return modules
+            # olefile needs the whole container as bytes, which bytes(data) only copies for
+            # other buffer types
+            vba_parser = VBA_Parser(workbook, data=bytes(data))
+        has_macros = vba_parser.detect_vba_macros()
+    with tracing.phase('decompress'):
+        vba_modules = list(vba_parser.extract_all_macros()) if has_macros else []
 
+    for _, _, filename, content in vba_modules:
+        # the code is never split into lines, huge generated modules would take several times
+        # their size as line lists; the first line, Attribute VB_Name, is never hidden
+        end = content.find('\n')
+        first_line = content[:end].rstrip('\r') if end >= 0 else content
+        name = first_line.replace('Attribute VB_Name = ', '').strip('"')
+        source = HIDDEN_ATTRIBUTE.sub('', content.replace('\r\n', '\n') if '\r\n' in content else content)
+        module_type = MODULE_TYPES.get(filename.rpartition('.')[2].lower(), 'module')
+        yield name, module_type, source[len(first_line) + 1:]
+
+
+def get_vba(workbook, data=None):
+    return {name: source for name, _, source in iter_vba_modules(workbook, data)}
+
+
+def get_digest(source):
+    import hashlib
+    return hashlib.sha1(source.encode('utf-8', 'surrogatepass')).hexdigest()
+
+
+class Module:
+    # the source is the only copy of the module's code, lines are sliced out of it by their start
+    # offsets, which are only computed on first access, so that callers that only need the
+    # digest or the line count never split it
+    __slots__ = ('name', 'type', 'source', 'digest', 'line_count', 'offsets')
+
+    def __init__(self, name, source, digest=None, line_count=None, module_type=None):
+        self.name = name
+        # module, class or form, None when not known (e.g. for modules from the index)
+        self.type = module_type
+        self.source = source
+        # recorded once at extraction time (and cached), so unchanged modules are recognised
+        # without comparing or splitting their source
+        self.digest = digest or get_digest(source)
+        self.line_count = source.count('\n') + 1 if line_count is None else line_count
+        self.offsets = None
+
+    def get_offsets(self):
+        # start of every line and, last, the end of the source plus one
+        if self.offsets is None:
+            offsets = array('I', [0])
+            offsets.extend(match.end() for match in NEWLINE.finditer(self.source))
+            offsets.append(len(self.source) + 1)
+            self.offsets = offsets
+        return self.offsets
+
+    def line(self, number):
+        # number is 1-based
+        offsets = self.get_offsets()
+        return self.source[offsets[number - 1]:offsets[number] - 1]
+
+    def text(self, start, end):
+        # lines start to end (1-based, inclusive) without their last line break
+        offsets = self.get_offsets()
+        return self.source[offsets[start - 1]:offsets[min(end, len(offsets) - 1)] - 1]
+
+    def iter_lines(self):
+        offsets = self.get_offsets()
+        source = self.source
+        for i in range(len(offsets) - 1):
+            yield source[offsets[i]:offsets[i + 1] - 1]
+
+    def lines(self):
+        # for callers that need all lines at once, e.g. to diff them
+        return self.source.split('\n')
+
+    def to_record(self):
+        return [self.source, self.digest, self.line_count, self.type]
+
+    @classmethod
+    def from_record(cls, name, record):
+        return cls(name, *record)
+
+
+def get_modules(workbook, data=None):
+    return {name: Module(name, source, module_type=module_type)
+            for name, module_type, source in iter_vba_modules(workbook, data)}
+
+
+def get_parallel_threshold():
+    value = os.environ.get('GIT_XL_PARALLEL_THRESHOLD')
+    return parse_size(value) if value else PARALLEL_THRESHOLD
+
+
+def get_vba_all(workbooks, cache=None, executor=None, parallel_threshold=None, fetch=None):
+    # workbooks is a list of (path, object id) tuples, returns their modules in the same order;
+    # fetch(path, object id) writes a workbook that is not on disk yet, it is only called for
+    # the ones that turn out not to be cached
+    cache = cache or Cache()
+    results = [None] * len(workbooks)
+    keys = [None] * len(workbooks)
+    pending = []
+    for i, (workbook, object_id) in enumerate(workbooks):
+        if workbook is None:
+            results[i] = {}
+            continue
+        if cache.enabled:
+            with tracing.phase('cache'):
+                keys[i] = object_id if is_object_id(object_id) else blob_sha(workbook)
+                records = cache.get(keys[i])
+            if records is not None:
+                tracing.count('cache_hits')
+                results[i] = {name: Module.from_record(name, record) for name, record in records.items()}
+                continue
+            tracing.count('cache_misses')
+        pending.append(i)
+    if fetch:
+        for i in pending:
+            fetch(*workbooks[i])
+
+    # parsing is CPU bound, so large workbooks are extracted in worker processes while this
+    # process takes care of the first large one and all small ones (not worth a worker start-up)
+    threshold = get_parallel_threshold() if parallel_threshold is None else parallel_threshold
+    sizes = {i: os.path.getsize(workbooks[i][0]) for i in pending}
+    tracing.count('workbook_bytes', sum(sizes.values()))
+    large = [i for i in pending if sizes[i] >= threshold]
+    offloaded = large[1:] if len(large) > 1 else []
+    futures = {}
+    # a long-lived caller (the daemon) passes its own pool, otherwise one is started on demand
+    owned_executor = None
+    if offloaded and executor is None:
+        executor = owned_executor = ProcessPoolExecutor(max_workers=min(len(offloaded), os.cpu_count() or 1))
+    try:
+        submitted = time.perf_counter()
+        for i in offloaded:
+            futures[i] = executor.submit(get_modules, workbooks[i][0])
+        for i in pending:
+            # offloaded workbooks are timed until their result is in, the phases of their
+            # extraction are not traced
+            started = submitted if i in futures else time.perf_counter()
+            with tracing.phase('extract'):
+                results[i] = futures[i].result() if i in futures else get_modules(workbooks[i][0])
+            tracing.add_workbook(workbooks[i][0], workbooks[i][1], sizes[i], len(results[i]),
+                                 time.perf_counter() - started, offloaded=i in futures)
+    finally:
+        if owned_executor:
+            owned_executor.shutdown()
+
+    tracing.count('workbooks', len(pending))
+    tracing.count('modules', sum(len(results[i]) for i in pending))
+    with tracing.phase('cache'):
+        for i in pending:
+            if keys[i]:
+                cache.put(keys[i], {name: module.to_record() for name, module in results[i].items()})
+    return results
+
+
+def get_vba_cached(workbook, object_id=None, cache=None):
+    return get_vba_all([(workbook, object_id)], cache)[0]
+
+
+def iter_line_diff(lines_b, lines_a, numlines, algorithm=algorithms.DEFAULT_ALGORITHM):
+    if algorithm != algorithms.DEFAULT_ALGORITHM:
+        yield from algorithms.unified_diff(lines_b, lines_a, numlines, algorithm)
+        return
+    # skip the ---/+++ file headers, module headers are printed by the caller
+    yield from islice(unified_diff(lines_b, lines_a, n=numlines, lineterm=''), 2, None)
+
+
+def iter_module_diff(module_b, module_a, numlines, algorithm=algorithms.DEFAULT_ALGORITHM):
+    return iter_line_diff(module_b.lines(), module_a.lines(), numlines, algorithm)
+
+
+def offset_hunks(lines, offset_b, offset_a):
+    # hunk headers of a diff of part of a module, numbered like the lines of the whole module
+    for line in lines:
+        match = HUNK_HEADER.match(line)
+        if match:
+            start_b, count_b, start_a, count_a = match.groups()
+            line = (f'@@ -{int(start_b) + offset_b}{count_b or ""} +{int(start_a) + offset_a}{count_a or ""} @@' +
+                    line[match.end():])
+        yield line
+
+
+def iter_changes(workbook_a_modules, workbook_b_modules):
+    # yields (module a, module b) per added, changed or deleted module, None for a missing side
+    for module_a in workbook_a_modules.values():
+        module_b = workbook_b_modules.get(module_a.name)
+        if module_b is None or module_a.digest != module_b.digest:
+            yield module_a, module_b
+
+    for module_b in workbook_b_modules.values():
+        if module_b.name not in workbook_a_modules:
+            yield None, module_b
+
+
+def get_headers(workbook_name, module_a, module_b):
+    if module_b is None:
+        return '--- /dev/null', '+++ b/' + workbook_name + '/VBA/' + module_a.name
+    if module_a is None:
+        return '--- b/' + workbook_name + '/VBA/' + module_b.name, '+++ /dev/null'
+    return '--- a/' + workbook_name + '/VBA/' + module_a.name, '+++ b/' + workbook_name + '/VBA/' + module_a.name
+
+
+def iter_diffs(workbook_name, workbook_a_modules, workbook_b_modules, numlines,
+               algorithm=algorithms.DEFAULT_ALGORITHM):
+    # yields (header a, header b, lines) per changed module, lines are only computed while printing
+    for module_a, module_b in iter_changes(workbook_a_modules, workbook_b_modules):
+        header_a, header_b = get_headers(workbook_name, module_a, module_b)
+        if module_b is None:
+            yield header_a, header_b, ('+' + line for line in module_a.iter_lines())
+        elif module_a is None:
+            yield header_a, header_b, ('-' + line for line in module_b.iter_lines())
+        else:
+            yield header_a, header_b, iter_module_diff(module_b, module_a, numlines, algorithm)
 
-if __name__ == '__main__':
-    if not 8 <= len(sys.argv) <= 9:
-        print('Unexpected number of arguments')
-        sys.exit(0)
 
-    if len(sys.argv) == 8:
-        _, workbook_name, workbook_b, _, _, workbook_a, _ , _ = sys.argv
+def get_stdout():
+    return sys.stdout.buffer
+
+
+class DiffWriter:
+
+    def __init__(self, out=None, buffer_size=WRITE_BUFFER_SIZE):
+        self.out = out or get_stdout()
+        self.buffer_size = buffer_size
+        self.buffer = bytearray()
+
+    def write(self, line, color=b''):
+        # colour codes are added while encoding, lines are never copied to be coloured
+        self.buffer += color
+        self.buffer += line.encode('utf-8', 'replace')
+        self.buffer += b'\n'
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def header(self, line):
+        self.write(line, BRIGHT)
+
+    def diff_line(self, line):
+        self.write(line, LINE_COLORS.get(line[:1], b''))
+
+    def flush(self):
+        # hand every full buffer to the pager right away instead of at exit
+        with tracing.phase('output'):
+            tracing.count('output_bytes', len(self.buffer))
+            self.out.write(self.buffer)
+            self.out.flush()
+        self.buffer.clear()
+
+
+def print_diff(workbook_name, diffs, out=None):
+    writer = DiffWriter(out)
+    writer.header('diff --xl ' + 'a/' + workbook_name + ' b/' + workbook_name)
+    for header_a, header_b, lines in diffs:
+        writer.header(header_a)
+        writer.header(header_b)
+        for line in lines:
+            writer.diff_line(line)
+        writer.write('')
+    writer.flush()
+
+
+def get_module_name(header_a, header_b):
+    return (header_a if header_b == '+++ /dev/null' else header_b).rsplit('/VBA/', 1)[1]
+
+
+def get_status(header_a, header_b):
+    if header_a == '--- /dev/null':
+        return 'added'
+    return 'removed' if header_b == '+++ /dev/null' else 'modified'
+
+
+def get_side(module):
+    return None if module is None else {'digest': module.digest, 'line_count': module.line_count}
+
+
+def make_hunk(old_start, old_lines, new_start, new_lines):
+    return {'old_start': old_start, 'old_lines': old_lines, 'new_start': new_start, 'new_lines': new_lines,
+            'lines': []}
+
+
+def get_record(workbook_name, header_a, header_b, lines, workbook_a_modules, workbook_b_modules):
+    # a module diff for the json formats: hunks are numbered like the @@ headers of the text
+    # output, lines keep their ' ', '-' or '+' prefix and notes (such as moved procedures) are
+    # kept apart
+    name = get_module_name(header_a, header_b)
+    status = get_status(header_a, header_b)
+    notes = []
+    hunks = []
+    # added and deleted modules are printed whole, without a hunk header
+    whole = None
+    for line in lines:
+        match = HUNK_HEADER.match(line)
+        if match:
+            start_b, count_b, start_a, count_a = match.groups()
+            hunks.append(make_hunk(int(start_b), int(count_b[1:]) if count_b else 1, int(start_a),
+                                   int(count_a[1:]) if count_a else 1))
+        elif line.startswith('@@'):
+            notes.append(line.strip('@ '))
+        else:
+            if not hunks:
+                whole = make_hunk(0, 0, 0, 0)
+                hunks.append(whole)
+            hunks[-1]['lines'].append(line)
+    if whole is not None:
+        side = 'new' if status == 'added' else 'old'
+        whole.update({side + '_start': 1, side + '_lines': len(whole['lines'])})
+    return {'workbook': workbook_name, 'module': name, 'status': status,
+            'old': get_side(workbook_b_modules.get(name)), 'new': get_side(workbook_a_modules.get(name)),
+            'notes': notes, 'hunks': hunks}
+
+
+class RecordWriter:
+    # ndjson writes a record per line, json an array of all records of the run, with a record
+    # per line as well; either way a record is written as soon as its module is diffed
+
+    def __init__(self, out=None, output_format='ndjson'):
+        self.writer = DiffWriter(out)
+        self.array = output_format == 'json'
+        self.count = 0
+
+    def write(self, record):
+        import json
+        line = json.dumps(record, ensure_ascii=False)
+        if self.array:
+            line = (',' if self.count else '[') + line
+        self.writer.write(line)
+        self.count += 1
+
+    def close(self):
+        if self.array:
+            self.writer.write(']' if self.count else '[]')
+        self.writer.flush()
+
+
+def write_records(writer, workbook_name, diffs, workbook_a_modules, workbook_b_modules, **fields):
+    # fields, e.g. the commit, go before those of every record
+    for header_a, header_b, lines in diffs:
+        record = dict(fields)
+        record.update(get_record(workbook_name, header_a, header_b, lines, workbook_a_modules, workbook_b_modules))
+        writer.write(record)
+
+
+def get_module_text(module):
+    # starts with the Attribute VB_Name line, as in an exported module file
+    source = module.source
+    return f'Attribute VB_Name = "{module.name}"\n' + (
+        source if not source or source.endswith('\n') else source + '\n')
+
+
+def print_textconv(workbook, out=None):
+    # canonical text of all modules, in a stable order so that Git's diff of two conversions
+    # only shows actual code changes; written as UTF-8 bytes like the diffs, never in the
+    # console's encoding or with CRLF line ends, as git caches the conversion
+    out = out or get_stdout()
+    modules = get_vba_cached(os.path.abspath(workbook))
+    for name in sorted(modules, key=str.lower):
+        out.write(get_module_text(modules[name]).encode('utf-8', 'replace'))
+    out.flush()
+
+
+def is_null_path(path):
+    return path in ('nul', '/dev/null')
+
+
+def get_git_config():
+    # all diff.xl.* settings with a single git call, read at most once per process (and directory)
+    return read_git_config(os.getcwd())
+
+
+@lru_cache(maxsize=None)
+def read_git_config(cwd):
+    try:
+        output = subprocess.run(['git', 'config', '-z', '--get-regexp', r'^diff\.xl\.'], cwd=cwd,
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL).stdout
+    except OSError:
+        return {}
+    config = {}
+    for entry in output.decode('utf-8', 'replace').split('\0'):
+        if entry:
+            key, _, value = entry.partition('\n')
+            config[key.lower()] = value
+    return config
+
+
+def split_options(args):
+    # options like --diff-algorithm=histogram precede the arguments passed by git
+    options = {}
+    args = list(args)
+    while args and args[0].startswith('--'):
+        name, _, value = args.pop(0)[2:].partition('=')
+        options[name] = value
+    return options, args
+
+
+def resolve_options(args):
+    # every option is passed explicitly, unset ones as --name= for their default, so that a
+    # daemon (started in another repository, with another environment) diffs with the settings
+    # of the caller and never falls back to its own
+    options, _ = split_options(args)
+    resolved = []
+    for name in OPTION_CONFIG:
+        if name in options:
+            continue
+        value = get_option({}, name, '')
+        if name == 'trace':
+            value = tracing.get_trace_path(value) or ''
+        resolved.append(f'--{name}={value}')
+    return resolved + list(args)
+
+
+def get_option(options, name, default):
+    # an option that is given is final, an empty one stands for the default
+    if name in options:
+        return options[name] or default
+    # git reports keys in lower case
+    return (os.environ.get(OPTION_ENV.get(name, '')) or get_git_config().get(OPTION_CONFIG[name].lower()) or
+            default)
+
+
+def check_options(options):
+    # raises ValueError for a value that is not supported, naming where it can be set
+    for name, value, supported in (('diff-algorithm', get_algorithm(options), algorithms.ALGORITHMS),
+                                   ('diff-granularity', get_granularity(options), GRANULARITIES),
+                                   ('format', get_format(options), FORMATS)):
+        if value not in supported:
+            raise ValueError(f'unknown {name.replace("-", " ")} "{value}" (--{name} or {OPTION_CONFIG[name]}), '
+                             f'expected one of: {", ".join(supported)}')
+
+
+def get_algorithm(options):
+    return get_option(options, 'diff-algorithm', algorithms.DEFAULT_ALGORITHM)
+
+
+def get_granularity(options):
+    return get_option(options, 'diff-granularity', DEFAULT_GRANULARITY)
+
+
+def get_format(options):
+    return get_option(options, 'format', DEFAULT_FORMAT)
+
+
+def get_sheets(options):
+    # whether the cells of the worksheets are diffed as well
+    return get_option(options, 'sheets', 'false').lower() in TRUE_VALUES
+
+
+def get_trace_path(options):
+    return tracing.get_trace_path(get_option(options, 'trace', None))
+
+
+def get_diffs(workbook_name, workbook_a_modules, workbook_b_modules, numlines,
+              algorithm=algorithms.DEFAULT_ALGORITHM, granularity=DEFAULT_GRANULARITY):
+    if granularity == 'procedure':
+        import procedures
+        return procedures.iter_diffs(workbook_name, workbook_a_modules, workbook_b_modules, numlines, algorithm)
+    return iter_diffs(workbook_name, workbook_a_modules, workbook_b_modules, numlines, algorithm)
+
+
+def main(args, out=None, cache=None, executor=None):
+    # git's external diff protocol: path old-file old-hex old-mode new-file new-hex new-mode,
+    # optionally preceded by the number of context lines
+    options, args = split_options(args)
+    check_options(options)
+    algorithm = get_algorithm(options)
+    granularity = get_granularity(options)
+    output_format = get_format(options)
+    sheets_enabled = get_sheets(options)
+    if not 7 <= len(args) <= 8:
+        writer = DiffWriter(out)
+        writer.write('Unexpected number of arguments')
+        writer.flush()
+        return
+
+    if len(args) == 7:
+        workbook_name, workbook_b, workbook_b_sha, _, workbook_a, workbook_a_sha, _ = args
         numlines = 3
-    if len(sys.argv) == 9:
-        _, numlines, workbook_name, workbook_b, _, _, workbook_a, _, _ = sys.argv
+    if len(args) == 8:
+        numlines, workbook_name, workbook_b, workbook_b_sha, _, workbook_a, workbook_a_sha, _ = args
         numlines = int(numlines)
 
-    path_workbook_a = os.path.abspath(workbook_a) if workbook_a != 'nul' and workbook_a != '/dev/null' else None
-    path_workbook_b = os.path.abspath(workbook_b) if workbook_b != 'nul' and workbook_b != '/dev/null' else None
-
-    workbook_a_modules = get_vba(path_workbook_a)
-    workbook_b_modules = {} if workbook_b in ('nul', '/dev/null') else get_vba(path_workbook_b)
-
-    diffs = []
-    for module_a, vba_a in workbook_a_modules.items():
-        if module_a not in workbook_b_modules:
-            diffs.append({
-                'a': '--- /dev/null',
-                'b': '+++ b/' + workbook_name + '/VBA/' + module_a,
-                'diff': '\n'.join([Fore.GREEN + '+' + line for line in vba_a.split('\n')])
-            })
-        elif vba_a != workbook_b_modules[module_a]:
-            diffs.append({
-                'a': '--- a/' + workbook_name + '/VBA/' + module_a,
-                'b': '+++ b/' + workbook_name + '/VBA/' + module_a,
-                'diff': '\n'.join([(Fore.RED if line.startswith('-') else (Fore.GREEN if line.startswith('+') else (Fore.CYAN if line.startswith('@') else ''))) + line.strip('\n') for line in list(unified_diff(workbook_b_modules[module_a].split('\n'), vba_a.split('\n'), n=numlines))[2:]])
-            })
-
-    for module_b, vba_b in workbook_b_modules.items():
-        if module_b not in workbook_a_modules:
-            diffs.append({
-                'a': '--- b/' + workbook_name + '/VBA/' + module_b,
-                'b': '+++ /dev/null',
-                'diff': '\n'.join([Fore.RED + '-' + line for line in vba_b.split('\n')])
-            })
-
-
-    colorama.init(strip=False)
-
-    print(Style.BRIGHT + 'diff --xl ' + 'a/' + workbook_name + ' b/' + workbook_name)
-    for diff in diffs:
-        print(Style.BRIGHT + diff['a'])
-        print(Style.BRIGHT + diff['b'])
-        print(diff['diff'])
-        print('')
+    path_workbook_a = os.path.abspath(workbook_a) if not is_null_path(workbook_a) else None
+    path_workbook_b = os.path.abspath(workbook_b) if not is_null_path(workbook_b) else None
+
+    with tracing.session(get_trace_path(options), 'diff', args) as tracer:
+        if tracer:
+            tracer.record['workbook'] = workbook_name
+        with tracing.phase('read'):
+            vba_unchanged = is_vba_project_unchanged(path_workbook_a, path_workbook_b)
+        if vba_unchanged:
+            # nothing to extract, and without sheets to compare nothing to print either
+            tracing.count('vba_projects_skipped')
+            if not sheets_enabled and output_format == DEFAULT_FORMAT:
+                return
+            workbook_a_modules = workbook_b_modules = {}
+        else:
+            workbook_a_modules, workbook_b_modules = get_vba_all([(path_workbook_a, workbook_a_sha),
+                                                                  (path_workbook_b, workbook_b_sha)], cache, executor)
+
+        # diffs are computed while they are written, the output phase is traced on its own
+        with tracing.phase('diff'):
+            diffs = get_diffs(workbook_name, workbook_a_modules, workbook_b_modules, numlines, algorithm, granularity)
+            if sheets_enabled:
+                import sheets
+            if output_format == DEFAULT_FORMAT:
+                if sheets_enabled:
+                    diffs = chain(diffs, sheets.iter_diffs(workbook_name, path_workbook_a, path_workbook_b))
+                print_diff(workbook_name, diffs, out)
+                return
+            # git runs the diff driver once per workbook, so json gives an array per workbook
+            writer = RecordWriter(out, output_format)
+            write_records(writer, workbook_name, diffs, workbook_a_modules, workbook_b_modules)
+            if sheets_enabled:
+                sheets.write_records(writer, workbook_name, path_workbook_a, path_workbook_b)
+            writer.close()
+
+if __name__ == '__main__':
+    if getattr(sys, 'frozen', False):
+        import multiprocessing
+        multiprocessing.freeze_support()
+    if sys.platform == 'win32':
+        # diffs are written as bytes, so the console has to interpret the colour codes itself
+        import colorama
+        colorama.just_fix_windows_console()
+    args = resolve_options(sys.argv[1:])
+    try:
+        check_options(split_options(args)[0])
+    except ValueError as e:
+        # git stops with "external diff died" rather than showing the message as a diff
+        print(f'Error: {e}', file=sys.stderr)
+        sys.exit(1)
+    if not daemon.run_client(args):
+        main(args)
+    if PROFILE:
+        PROFILE.report()
@@ -0,0 +1,213 @@
+import os
+import re
+import json
+import time
+from collections import namedtuple
+
+import diff
+from cache import Cache
+
+# kept in the export directory, records what was exported from which workbook version
+MANIFEST_NAME = '.git-xl-export.json'
+# bump whenever the manifest format changes, an export of another version is written again
+MANIFEST_VERSION = 2
+# by module type, as the VBA editor exports them
+MODULE_EXTENSIONS = {'module': '.bas', 'class': '.cls', 'form': '.frm'}
+# a VBA identifier, module names come from the workbook and become file names
+MODULE_NAME = re.compile(r'^[^\W\d]\w*$')
+# seconds between two polls of --watch
+DEFAULT_INTERVAL = 2.0
+
+# written and removed are module names, error is the message of a workbook that can't be read
+Change = namedtuple('Change', ['workbook', 'written', 'removed', 'error'])
+
+
+def is_workbook(name, extensions):
+    # Excel's lock files (~$Book1.xlsm) are left out
+    return not name.startswith('~$') and os.path.splitext(name)[1].lower()[1:] in extensions
+
+
+def iter_workbooks(sources, extensions):
+    # (path, name in the export directory) of the given workbooks and of the workbooks below the
+    # given directories, named by their path relative to that directory
+    for source in sources:
+        if os.path.isdir(source):
+            for root, dirs, files in os.walk(source):
+                dirs[:] = sorted(name for name in dirs if name != '.git')
+                for name in sorted(files):
+                    if is_workbook(name, extensions):
+                        path = os.path.join(root, name)
+                        yield os.path.abspath(path), os.path.relpath(path, source).replace(os.sep, '/')
+        elif os.path.isfile(source):
+            yield os.path.abspath(source), os.path.basename(source)
+
+
+def write_file(path, text):
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(tmp_path, 'w', encoding='utf-8', errors='surrogatepass', newline='\n') as f:
+        f.write(text)
+    # atomic, so a code search never reads a half-written module
+    os.replace(tmp_path, path)
+
+
+def format_change(change):
+    if change.error:
+        return f'{change.workbook}: Error: {change.error}'
+    if change.written is None:
+        return f'{change.workbook}: removed, the workbook no longer exists'
+    parts = []
+    if change.written:
+        parts.append('wrote ' + ', '.join(change.written))
+    if change.removed:
+        parts.append('removed ' + ', '.join(change.removed))
+    return f'{change.workbook}: ' + ('; '.join(parts) or 'no changes to the VBA code')
+
+
+class Exporter:
+
+    def __init__(self, directory, cache=None):
+        self.directory = directory
+        self.manifest_path = os.path.join(directory, MANIFEST_NAME)
+        self.cache = cache or Cache()
+        # {name: {path, size, mtime_ns, modules: {module name: [digest, file name]}}}
+        self.workbooks = self.read_manifest()
+        # {name: (path, size, mtime_ns)} of workbooks that could not be read, tried again once changed
+        self.failed = {}
+
+    def read_manifest(self):
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(manifest, dict) or manifest.get('version') != MANIFEST_VERSION:
+            return {}
+        return manifest.get('workbooks', {})
+
+    def write_manifest(self):
+        write_file(self.manifest_path, json.dumps({'version': MANIFEST_VERSION, 'workbooks': self.workbooks},
+                                                  indent=1, sort_keys=True))
+
+    def module_path(self, name, file_name):
+        # file names come from the workbook or the manifest, neither may reach outside the directory
+        path = os.path.join(self.directory, *name.split('/'), file_name)
+        root = os.path.realpath(self.directory)
+        if os.path.commonpath([root, os.path.realpath(path)]) != root:
+            raise ValueError(f'{path} is outside of {self.directory}')
+        return path
+
+    def extract(self, paths):
+        # the modules of every workbook, or the exception it raised: workbooks are extracted
+        # together (large ones in parallel), one at a time only to find a broken one, e.g. one
+        # Excel is still writing
+        if not paths:
+            return []
+        try:
+            return diff.get_vba_all([(path, None) for path in paths], self.cache)
+        except Exception:
+            pass
+        results = []
+        for path in paths:
+            try:
+                results.append(diff.get_vba_cached(path, cache=self.cache))
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def sync(self, workbooks):
+        # exports the workbooks whose size or modification time differ from the manifest and
+        # writes only the modules whose digest changed; returns ([Change], number of workbooks)
+        stats = {}
+        paths = {}
+        for path, name in workbooks:
+            if paths.setdefault(name, path) != path:
+                raise ValueError(f'{paths[name]} and {path} would both be exported to {name}')
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entry = self.workbooks.get(name)
+            if entry and entry['path'] == path and entry['size'] == stat.st_size and \
+                    entry['mtime_ns'] == stat.st_mtime_ns:
+                continue
+            if self.failed.get(name) != (path, stat.st_size, stat.st_mtime_ns):
+                stats[name] = stat
+
+        changes = self.remove_missing()
+        names = list(stats)
+        for name, modules in zip(names, self.extract([paths[name] for name in names])):
+            if isinstance(modules, Exception):
+                # the manifest entry stays as it is, so that the workbook is exported once it changes
+                self.failed[name] = (paths[name], stats[name].st_size, stats[name].st_mtime_ns)
+                changes.append(Change(name, [], [], str(modules) or type(modules).__name__))
+                continue
+            try:
+                changes.append(self.export_workbook(name, paths[name], stats[name], modules))
+            except ValueError as e:
+                self.failed[name] = (paths[name], stats[name].st_size, stats[name].st_mtime_ns)
+                changes.append(Change(name, [], [], str(e)))
+                continue
+            self.failed.pop(name, None)
+        if [change for change in changes if not change.error]:
+            self.write_manifest()
+        return changes, len(paths)
+
+    def export_workbook(self, name, path, stat, modules):
+        for module_name in modules:
+            if not MODULE_NAME.match(module_name):
+                raise ValueError(f'invalid module name "{module_name}"')
+        old_modules = self.workbooks.get(name, {}).get('modules', {})
+        new_modules = {module.name: [module.digest, module.name + MODULE_EXTENSIONS.get(module.type, '.bas')]
+                       for module in modules.values()}
+        # old files go first, so that a module renamed to another case does not lose its new
+        # file on a case-insensitive file system
+        for module_name, (_, file_name) in old_modules.items():
+            if new_modules.get(module_name, [None, None])[1] != file_name:
+                self.remove_file(self.module_path(name, file_name))
+        written = []
+        for module in modules.values():
+            module_path = self.module_path(name, new_modules[module.name][1])
+            if old_modules.get(module.name) == new_modules[module.name] and os.path.exists(module_path):
+                continue
+            write_file(module_path, diff.get_module_text(module))
+            written.append(module.name)
+        self.workbooks[name] = {'path': path, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                                'modules': new_modules}
+        removed = [module_name for module_name in old_modules if module_name not in new_modules]
+        return Change(name, written, removed, None)
+
+    def remove_missing(self):
+        # the exported modules of workbooks that were deleted
+        changes = []
+        for name, entry in list(self.workbooks.items()):
+            if os.path.exists(entry['path']):
+                continue
+            for _, file_name in entry['modules'].values():
+                self.remove_file(self.module_path(name, file_name))
+            del self.workbooks[name]
+            changes.append(Change(name, None, list(entry['modules']), None))
+        return changes
+
+    def remove_file(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        # the workbook's directory and its parents, once empty
+        directory = os.path.dirname(path)
+        while os.path.abspath(directory) != os.path.abspath(self.directory):
+            try:
+                os.rmdir(directory)
+            except OSError:
+                break
+            directory = os.path.dirname(directory)
+
+    def watch(self, sources, extensions, report, interval=DEFAULT_INTERVAL):
+        # polls the workbooks' sizes and modification times, which takes a stat per workbook,
+        # and exports the ones that changed; runs until interrupted
+        while True:
+            time.sleep(interval)
+            changes, _ = self.sync(iter_workbooks(sources, extensions))
+            for change in changes:
+                report(change)
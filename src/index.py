@@ -0,0 +1,250 @@
+import os
+import re
+import sqlite3
+
+import diff
+import batch
+import plumbing
+import procedures
+from cache import Cache
+
+# bump whenever the schema changes, an index of another version is rebuilt
+INDEX_VERSION = 1
+INDEX_FILE = os.path.join('xl', 'index.sqlite')
+# workbooks fetched and extracted per batch while indexing, bounds the temporary disk space
+INDEX_BATCH_SIZE = 64
+
+# module sources are stored once per digest and their procedures with them, so the many
+# versions of a workbook share the modules they did not change
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (id TEXT PRIMARY KEY) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS modules (blob TEXT, position INTEGER, name TEXT, digest TEXT,
+                                    PRIMARY KEY (blob, position)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS sources (digest TEXT PRIMARY KEY, source TEXT, line_count INTEGER) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS procedures (module TEXT, position INTEGER, name TEXT, kind TEXT, start INTEGER,
+                                       end INTEGER, digest TEXT, PRIMARY KEY (module, position)) WITHOUT ROWID;
+"""
+
+
+def get_index_path(cwd=None):
+    return os.path.join(plumbing.get_git_dir(cwd), INDEX_FILE)
+
+
+class Index:
+    # the modules and procedures of every indexed workbook blob, in a SQLite database in the
+    # git directory
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        if self.connection.execute('PRAGMA user_version').fetchone()[0] != INDEX_VERSION:
+            self.clear()
+
+    def clear(self):
+        for table in ('blobs', 'modules', 'sources', 'procedures'):
+            self.connection.execute(f'DROP TABLE IF EXISTS {table}')
+        self.connection.executescript(SCHEMA)
+        self.connection.execute(f'PRAGMA user_version = {INDEX_VERSION}')
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM blobs').fetchone()[0]
+
+    def __contains__(self, blob_id):
+        return self.connection.execute('SELECT 1 FROM blobs WHERE id = ?', (blob_id,)).fetchone() is not None
+
+    def add(self, blob_id, modules):
+        # modules as returned by diff.get_vba_all, committed by the caller
+        execute = self.connection.execute
+        for position, module in enumerate(modules.values()):
+            execute('INSERT OR REPLACE INTO modules VALUES (?, ?, ?, ?)', (blob_id, position, module.name,
+                                                                          module.digest))
+            if execute('SELECT 1 FROM sources WHERE digest = ?', (module.digest,)).fetchone():
+                continue
+            execute('INSERT INTO sources VALUES (?, ?, ?)', (module.digest, module.source, module.line_count))
+            for i, procedure in enumerate(procedures.parse_procedures(module.lines())):
+                execute('INSERT INTO procedures VALUES (?, ?, ?, ?, ?, ?, ?)', (module.digest, i) + procedure)
+        execute('INSERT OR REPLACE INTO blobs VALUES (?)', (blob_id,))
+
+    def commit(self):
+        self.connection.commit()
+
+    def get_modules(self, blob_id):
+        # {name: diff.Module} of an indexed blob
+        rows = self.connection.execute('SELECT name, modules.digest, source, line_count FROM modules '
+                                       'JOIN sources ON sources.digest = modules.digest '
+                                       'WHERE blob = ? ORDER BY position', (blob_id,))
+        return {name: diff.Module(name, source, digest, line_count) for name, digest, source, line_count in rows}
+
+    def get_procedures(self, module_digest):
+        rows = self.connection.execute('SELECT name, kind, start, end, digest FROM procedures '
+                                       'WHERE module = ? ORDER BY position', (module_digest,))
+        return [procedures.Procedure(*row) for row in rows]
+
+
+def get_blob_ids(history):
+    return [object_id for _, changes in history for change in changes
+            for mode, object_id in ((change.new_mode, change.new_id), (change.old_mode, change.old_id))
+            if mode != plumbing.NULL_MODE]
+
+
+def update(index, blob_ids, cwd, cache=None, executor=None):
+    # indexes the blobs not indexed yet, returns how many were added
+    missing = list(dict.fromkeys(blob_id for blob_id in blob_ids if blob_id not in index))
+    if not missing:
+        return 0
+    cache = cache or Cache()
+    with batch.process_pool(executor) as executor, plumbing.CatFile(cwd=cwd) as cat_file:
+        for i in range(0, len(missing), INDEX_BATCH_SIZE):
+            sources = {blob_id: blob_id for blob_id in missing[i:i + INDEX_BATCH_SIZE]}
+            for blob_id, modules in batch.extract_all(cat_file, sources, cache, executor).items():
+                index.add(blob_id, modules)
+            index.commit()
+    return len(missing)
+
+
+def open_index(history, top_level, cache=None, executor=None):
+    index = Index(get_index_path(top_level))
+    update(index, get_blob_ids(history), top_level, cache, executor)
+    return index
+
+
+def get_side(index, mode, object_id):
+    return {} if mode == plumbing.NULL_MODE else index.get_modules(object_id)
+
+
+def index_range(args, rebuild=False, cache=None, executor=None, cwd=None):
+    # indexes every workbook version in the history of the revisions (default: HEAD), returns
+    # (added, total)
+    _, revisions, paths = batch.parse_args(args)
+    top_level = plumbing.get_top_level(cwd)
+    history = batch.get_history(revisions, paths, top_level)
+    with Index(get_index_path(top_level)) as index:
+        if rebuild:
+            index.clear()
+        added = update(index, get_blob_ids(history), top_level, cache, executor)
+        return added, len(index)
+
+
+def get_added_matches(pattern, module_a, module_b):
+    # lines of module a matching the pattern that module b does not have as often
+    remaining = {}
+    if module_b is not None:
+        for line in module_b.iter_lines():
+            if pattern.search(line):
+                remaining[line] = remaining.get(line, 0) + 1
+    for number, line in enumerate(module_a.iter_lines(), 1):
+        if pattern.search(line):
+            if remaining.get(line):
+                remaining[line] -= 1
+            else:
+                yield number, line
+
+
+def grep_range(args, out=None, cache=None, executor=None, cwd=None):
+    # git xl grep [-i] <pattern> [<revision range>] [[--] <paths>]: the matching lines each
+    # commit added to the VBA code, newest first
+    args = list(args)
+    flags = 0
+    while args and args[0] in ('-i', '--ignore-case'):
+        flags = re.IGNORECASE
+        args.pop(0)
+    if not args:
+        raise ValueError('no pattern given')
+    try:
+        pattern = re.compile(args[0], flags)
+    except re.error as e:
+        raise ValueError(f'invalid pattern "{args[0]}": {e}')
+    _, revisions, paths = batch.parse_args(args[1:])
+    top_level = plumbing.get_top_level(cwd)
+    history = batch.get_history(revisions, paths, top_level)
+    writer = diff.DiffWriter(out)
+    with open_index(history, top_level, cache, executor) as index:
+        for header, changes in history:
+            commit = header.split()[1]
+            for change in changes:
+                if change.new_mode == plumbing.NULL_MODE:
+                    continue
+                workbook_a_modules = index.get_modules(change.new_id)
+                workbook_b_modules = get_side(index, change.old_mode, change.old_id)
+                for module_a, module_b in diff.iter_changes(workbook_a_modules, workbook_b_modules):
+                    if module_a is None:
+                        continue
+                    for number, line in get_added_matches(pattern, module_a, module_b):
+                        writer.write(f'{commit[:7]}:{change.path}/VBA/{module_a.name}:{number}:{line}')
+    writer.flush()
+
+
+def parse_procedure_name(value):
+    # Module.Procedure, or just Procedure for a procedure of that name in any module
+    module, _, name = value.rpartition('.')
+    if not name:
+        raise ValueError(f'invalid procedure "{value}", expected <module>.<procedure>')
+    return module.lower(), name.lower()
+
+
+def get_procedure_modules(index, modules, module_name, procedure_name):
+    # {"Module.Procedure": (first line, diff.Module of the procedure)}, property procedures are
+    # told apart by their kind
+    found = {}
+    for module in modules.values():
+        if module_name and module.name.lower() != module_name:
+            continue
+        for procedure in index.get_procedures(module.digest):
+            if procedure.name.lower() != procedure_name:
+                continue
+            name = module.name + '.' + procedure.name
+            if procedure.kind.startswith('Property'):
+                name += f' ({procedure.kind})'
+            found[name] = (procedure.start, diff.Module(name, module.text(procedure.start, procedure.end),
+                                                        procedure.digest))
+    return found
+
+
+def log_procedure(procedure, revisions, paths, numlines, algorithm, out=None, cache=None, executor=None, cwd=None,
+                  writer=None):
+    # git xl log -L <module>.<procedure>: the commits that changed the procedure, each with the
+    # diff of just that procedure; with a diff.RecordWriter, as records instead
+    module_name, procedure_name = parse_procedure_name(procedure)
+    top_level = plumbing.get_top_level(cwd)
+    history = batch.get_history(revisions, paths, top_level)
+    first = True
+    with open_index(history, top_level, cache, executor) as index:
+        for header, changes in history:
+            diffs = []
+            for change in changes:
+                found_a = get_procedure_modules(index, get_side(index, change.new_mode, change.new_id), module_name,
+                                                procedure_name)
+                found_b = get_procedure_modules(index, get_side(index, change.old_mode, change.old_id), module_name,
+                                                procedure_name)
+                workbook_a_modules = {name: module for name, (_, module) in found_a.items()}
+                workbook_b_modules = {name: module for name, (_, module) in found_b.items()}
+                procedure_diffs = []
+                for header_a, header_b, lines in diff.iter_diffs(change.path, workbook_a_modules, workbook_b_modules,
+                                                                 numlines, algorithm):
+                    name = diff.get_module_name(header_a, header_b)
+                    offset_a = found_a[name][0] - 1 if name in found_a else 0
+                    offset_b = found_b[name][0] - 1 if name in found_b else 0
+                    procedure_diffs.append((header_a, header_b, diff.offset_hunks(lines, offset_b, offset_a)))
+                if procedure_diffs:
+                    diffs.append((change.path, procedure_diffs, workbook_a_modules, workbook_b_modules))
+            if not diffs:
+                continue
+            if writer is None:
+                batch.print_header(header, out, first)
+            first = False
+            for path, procedure_diffs, workbook_a_modules, workbook_b_modules in diffs:
+                batch.write_diff(writer, path, procedure_diffs, workbook_a_modules, workbook_b_modules, out,
+                                 commit=header.split()[1])
+    if writer is not None:
+        writer.close()
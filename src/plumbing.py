@@ -0,0 +1,138 @@
+import os
+import subprocess
+from io import BytesIO
+from collections import namedtuple
+
+import tracing
+
+NULL_MODE = '000000'
+COPY_BUFFER_SIZE = 1024 * 1024
+
+# one entry of git diff --raw; ids are all zeros for files of the working tree
+Change = namedtuple('Change', ['status', 'old_mode', 'new_mode', 'old_id', 'new_id', 'path'])
+
+
+class GitError(Exception):
+    pass
+
+
+def run_git(args, cwd=None, input=None):
+    try:
+        with tracing.phase('git'):
+            cmd = subprocess.run(['git'] + list(args), cwd=cwd, input=input, stdout=subprocess.PIPE,
+                                 stderr=subprocess.PIPE)
+    except OSError as e:
+        raise GitError(f'git could not be run: {e}')
+    if cmd.returncode:
+        raise GitError(cmd.stderr.decode('utf-8', 'replace').strip() or f'git {args[0]} failed')
+    return cmd.stdout
+
+
+def decode_path(path):
+    return path.decode('utf-8', 'surrogateescape')
+
+
+def encode_path(path):
+    return path.encode('utf-8', 'surrogateescape')
+
+
+def get_top_level(cwd=None):
+    return decode_path(run_git(['rev-parse', '--show-toplevel'], cwd=cwd).rstrip(b'\n'))
+
+
+def get_git_dir(cwd=None):
+    # shared by all worktrees of the repository
+    path = decode_path(run_git(['rev-parse', '--git-common-dir'], cwd=cwd).rstrip(b'\n'))
+    return os.path.join(cwd or os.getcwd(), path)
+
+
+def parse_raw(status, path):
+    old_mode, new_mode, old_id, new_id, status = status.decode('ascii').lstrip(':').split(' ')
+    return Change(status, old_mode, new_mode, old_id, new_id, decode_path(path))
+
+
+def diff_raw(args, paths=(), cwd=None):
+    # renames are reported as deletion plus addition, the way git invokes an external diff
+    output = run_git(['diff', '--raw', '-z', '--no-abbrev', '--no-renames'] + list(args) + ['--'] + list(paths),
+                     cwd=cwd)
+    fields = output.split(b'\0')
+    return [parse_raw(fields[i], fields[i + 1]) for i in range(0, len(fields) - 1, 2)]
+
+
+def log_raw(args, paths=(), cwd=None):
+    # returns [(header, changes)] per commit, newest first; the header is what git log prints
+    # for the commit, merges come without changes just like in git log -p
+    output = run_git(['log', '--raw', '-z', '--no-abbrev', '--no-renames', '--format=medium'] + list(args) +
+                     (['--'] + list(paths) if paths else []), cwd=cwd)
+    fields = output.split(b'\0')
+    commits = []
+    i = 0
+    while i < len(fields):
+        field = fields[i]
+        i += 1
+        if field.startswith(b'commit '):
+            # the first raw entry of a commit follows its header in the same field
+            header, _, status = field.partition(b'\n:')
+            commits.append((header.decode('utf-8', 'replace').rstrip('\n'), []))
+            field = b':' + status if status else b''
+        if field.startswith(b':'):
+            commits[-1][1].append(parse_raw(field, fields[i]))
+            i += 1
+    return commits
+
+
+def check_attr(attribute, paths, cwd=None):
+    # returns {path: value} of one attribute for all paths with a single git call
+    if not paths:
+        return {}
+    output = run_git(['check-attr', '-z', '--stdin', attribute], cwd=cwd,
+                     input=b''.join(encode_path(path) + b'\0' for path in paths))
+    fields = output.split(b'\0')
+    return {decode_path(fields[i]): decode_path(fields[i + 2]) for i in range(0, len(fields) - 2, 3)}
+
+
+class CatFile:
+    # a single git cat-file --batch process answers all object requests, instead of one git
+    # process per object
+
+    def __init__(self, cwd=None):
+        self.process = subprocess.Popen(['git', 'cat-file', '--batch'], cwd=cwd, stdin=subprocess.PIPE,
+                                        stdout=subprocess.PIPE)
+
+    def copy(self, object_id, out):
+        with tracing.phase('git'):
+            self.process.stdin.write(object_id.encode('ascii') + b'\n')
+            self.process.stdin.flush()
+            header = self.process.stdout.readline().split()
+            if len(header) != 3:
+                raise GitError(f'object {object_id} not found')
+            remaining = int(header[2])
+            tracing.count('blob_bytes', remaining)
+            while remaining:
+                chunk = self.process.stdout.read(min(remaining, COPY_BUFFER_SIZE))
+                if not chunk:
+                    raise GitError(f'object {object_id} is truncated')
+                out.write(chunk)
+                remaining -= len(chunk)
+            # the content is followed by a newline
+            self.process.stdout.read(1)
+
+    def read(self, object_id):
+        out = BytesIO()
+        self.copy(object_id, out)
+        return out.getvalue()
+
+    def write(self, object_id, path):
+        with open(path, 'wb') as f:
+            self.copy(object_id, f)
+
+    def close(self):
+        self.process.stdin.close()
+        self.process.stdout.close()
+        self.process.wait()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
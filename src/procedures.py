@@ -0,0 +1,176 @@
+import re
+from itertools import chain
+from collections import namedtuple
+
+import algorithms
+
+
+# the statement that opens a procedure, e.g. "Private Static Function Total(...) As Long" or
+# "Public Property Get Value()"
+PROCEDURE_START = re.compile(r'^\s*(?:(?:Public|Private|Friend)\s+)?(?:Static\s+)?'
+                             r'(Sub|Function|Property\s+(?:Get|Let|Set))\s+(\w+)', re.IGNORECASE)
+PROCEDURE_END = re.compile(r'^\s*End\s+(Sub|Function|Property)\b', re.IGNORECASE)
+
+# start and end are 1-based line numbers of the module source, end is inclusive; the digest is
+# over the lines of the procedure, so a procedure moved within its module keeps its digest
+Procedure = namedtuple('Procedure', ['name', 'kind', 'start', 'end', 'digest'])
+
+
+def get_kind(keyword):
+    return ' '.join(keyword.split()).title()
+
+
+def get_digest(lines):
+    import hashlib
+    return hashlib.sha1('\n'.join(lines).encode('utf-8', 'surrogatepass')).hexdigest()
+
+
+def parse_procedures(lines):
+    # lines of a module source, returns its procedures in source order; an unterminated
+    # procedure runs to the end of the module
+    procedures = []
+    start = None
+    for number, line in enumerate(lines, 1):
+        if start is None:
+            match = PROCEDURE_START.match(line)
+            if match:
+                start, kind, name = number, get_kind(match.group(1)), match.group(2)
+        elif PROCEDURE_END.match(line):
+            procedures.append(Procedure(name, kind, start, number, get_digest(lines[start - 1:number])))
+            start = None
+    if start is not None:
+        procedures.append(Procedure(name, kind, start, len(lines), get_digest(lines[start - 1:])))
+    return procedures
+
+
+def is_comment(line):
+    line = line.lstrip()
+    return line.startswith("'") or line[:4].lower() in ('rem', 'rem ')
+
+
+def split_module(module):
+    # (lines, declaration lines, [(procedure, first line, last line)]): a procedure includes the
+    # comment lines right above it and whatever follows it up to the next chunk (e.g. a comment
+    # separated from the next procedure by a blank line, or code after the last procedure), so
+    # that every non-blank line is in a chunk; only the blank lines between chunks are not
+    lines = module.lines()
+    found = parse_procedures(lines)
+    starts = []
+    for i, procedure in enumerate(found):
+        start = procedure.start
+        limit = found[i - 1].end + 1 if i else 1
+        while start > limit and is_comment(lines[start - 2]):
+            start -= 1
+        starts.append(start)
+    chunks = []
+    for i, procedure in enumerate(found):
+        end = starts[i + 1] - 1 if i + 1 < len(found) else len(lines)
+        while end > procedure.end and not lines[end - 1].strip():
+            end -= 1
+        chunks.append((procedure, starts[i], end))
+    declarations = lines[:starts[0] - 1] if chunks else lines
+    return lines, declarations, chunks
+
+
+def get_key(procedure):
+    # VBA identifiers are case-insensitive
+    return procedure.kind, procedure.name.lower()
+
+
+def match_procedures(splits_a, splits_b):
+    # splits map names of changed modules to their split_module(); returns {(module a, index):
+    # (module b, index)} of the procedures found in both versions: by name within the module
+    # first, then procedures moved to another module by body digest and at last by name, all
+    # with dictionaries, i.e. in linear time
+    matches = {}
+    unmatched_b = []
+    for name, (_, _, chunks_b) in splits_b.items():
+        keys_a = {}
+        if name in splits_a:
+            keys_a = {get_key(procedure): i for i, (procedure, _, _) in enumerate(splits_a[name][2])}
+        for j, (procedure, _, _) in enumerate(chunks_b):
+            i = keys_a.pop(get_key(procedure), None)
+            if i is None:
+                unmatched_b.append(((name, j), procedure))
+            else:
+                matches[(name, i)] = (name, j)
+
+    unmatched_a = [((name, i), procedure) for name, (_, _, chunks_a) in splits_a.items()
+                   for i, (procedure, _, _) in enumerate(chunks_a) if (name, i) not in matches]
+    taken = set()
+    for get in (lambda procedure: procedure.digest, get_key):
+        candidates = {}
+        # reversed, so that popping from the end hands out the candidates in module order
+        for location, procedure in reversed(unmatched_b):
+            candidates.setdefault(get(procedure), []).append(location)
+        for location, procedure in unmatched_a:
+            if location in matches:
+                continue
+            locations = candidates.get(get(procedure), [])
+            while locations and locations[-1] in taken:
+                locations.pop()
+            if locations:
+                matches[location] = locations.pop()
+                taken.add(matches[location])
+    return matches
+
+
+def describe(procedure):
+    return f'{procedure.kind} {procedure.name}'
+
+
+def iter_module_lines(name, splits_a, splits_b, matches, matched_b, numlines, algorithm):
+    import diff
+    lines_a, declarations_a, chunks_a = splits_a.get(name, ([], [], []))
+    lines_b, declarations_b, chunks_b = splits_b.get(name, ([], [], []))
+    if declarations_a != declarations_b:
+        yield from diff.iter_line_diff(declarations_b, declarations_a, numlines, algorithm)
+
+    # of the procedures that stayed in the module, those outside the longest run that kept
+    # its order were moved
+    kept = [(i, matches[(name, i)][1]) for i in range(len(chunks_a)) if matches.get((name, i), ('',))[0] == name]
+    in_order = {kept[k][0] for k in algorithms.increasing_subsequence([j for _, j in kept])}
+
+    for i, (procedure, start, end) in enumerate(chunks_a):
+        if (name, i) not in matches:
+            yield from diff.offset_hunks(diff.iter_line_diff([], lines_a[start - 1:end], numlines, algorithm),
+                                         0, start - 1)
+            continue
+        name_b, j = matches[(name, i)]
+        source_b, _, module_chunks_b = splits_b[name_b]
+        procedure_b, start_b, end_b = module_chunks_b[j]
+        if name_b != name:
+            yield f'@@ {describe(procedure)} moved from {name_b} @@'
+        elif i not in in_order:
+            yield f'@@ {describe(procedure)} moved from line {procedure_b.start} @@'
+        if source_b[start_b - 1:end_b] != lines_a[start - 1:end]:
+            yield from diff.offset_hunks(diff.iter_line_diff(source_b[start_b - 1:end_b], lines_a[start - 1:end],
+                                                             numlines, algorithm), start_b - 1, start - 1)
+
+    for j, (procedure, start, end) in enumerate(chunks_b):
+        if (name, j) not in matched_b:
+            yield from diff.offset_hunks(diff.iter_line_diff(lines_b[start - 1:end], [], numlines, algorithm),
+                                         start - 1, 0)
+        elif matched_b[(name, j)][0] != name:
+            yield f'@@ {describe(procedure)} moved to {matched_b[(name, j)][0]} @@'
+
+
+def iter_diffs(workbook_name, workbook_a_modules, workbook_b_modules, numlines,
+               algorithm=algorithms.DEFAULT_ALGORITHM):
+    # like diff.iter_diffs, but changed modules are compared procedure by procedure: only
+    # procedures whose code changed are diffed, procedures moved within or between modules
+    # are reported with a note
+    import diff
+    changes = list(diff.iter_changes(workbook_a_modules, workbook_b_modules))
+    splits_a = {module_a.name: split_module(module_a) for module_a, _ in changes if module_a is not None}
+    splits_b = {module_b.name: split_module(module_b) for _, module_b in changes if module_b is not None}
+    matches = match_procedures(splits_a, splits_b)
+    matched_b = {location_b: location_a for location_a, location_b in matches.items()}
+    for module_a, module_b in changes:
+        name = (module_a or module_b).name
+        lines = iter_module_lines(name, splits_a, splits_b, matches, matched_b, numlines, algorithm)
+        # modules that only differ in the blank lines between chunks (see split_module) are left out
+        first = next(lines, None)
+        if first is not None:
+            header_a, header_b = diff.get_headers(workbook_name, module_a, module_b)
+            yield header_a, header_b, chain([first], lines)
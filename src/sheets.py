@@ -0,0 +1,349 @@
+import re
+import posixpath
+import zipfile
+from itertools import chain
+from xml.etree.ElementTree import iterparse, parse
+
+import tracing
+
+WORKBOOK_PART = 'xl/workbook.xml'
+WORKBOOK_RELS_PART = 'xl/_rels/workbook.xml.rels'
+# relationship types end like this in both transitional and strict OOXML
+WORKSHEET_TYPE = '/worksheet'
+SHARED_STRINGS_TYPE = '/sharedStrings'
+
+# a string literal or quoted sheet name (left as they are), or a cell reference of a formula
+FORMULA_TOKEN = re.compile(r'''("[^"]*"|'[^']*')|(?<![\w.$])(\$?)([A-Z]{1,3})(\$?)(\d+)(?![\w(])''')
+SHEET_NAME = re.compile(r'[A-Za-z_][\w.]*')
+
+
+def local_name(tag):
+    # elements are matched without their namespace, which differs between transitional and
+    # strict OOXML
+    return tag.rsplit('}', 1)[-1]
+
+
+def get_attribute(element, name):
+    # attribute in any namespace, e.g. r:id
+    for key, value in element.attrib.items():
+        if local_name(key) == name:
+            return value
+    return None
+
+
+def column_number(letters):
+    number = 0
+    for letter in letters:
+        number = number * 26 + ord(letter) - ord('A') + 1
+    return number
+
+
+def column_name(number):
+    letters = ''
+    while number:
+        number, remainder = divmod(number - 1, 26)
+        letters = chr(ord('A') + remainder) + letters
+    return letters
+
+
+def quote_sheet_name(name):
+    return name if SHEET_NAME.fullmatch(name) else "'" + name.replace("'", "''") + "'"
+
+
+def shift_formula(formula, rows, columns):
+    # the formula of a cell that shares the formula of another cell, rows and columns away:
+    # relative references move along, absolute ones ($A$1) stay
+    def shift(match):
+        if match.group(1):
+            return match.group(1)
+        column_absolute, letters, row_absolute, row = match.group(2, 3, 4, 5)
+        if not column_absolute:
+            letters = column_name(column_number(letters) + columns)
+        if not row_absolute:
+            row = str(int(row) + rows)
+        return column_absolute + letters + row_absolute + row
+    return FORMULA_TOKEN.sub(shift, formula)
+
+
+def get_text(element):
+    # text of a shared or inline string: plain or in rich text runs, without phonetic runs
+    parts = []
+    for child in element:
+        name = local_name(child.tag)
+        if name == 't':
+            parts.append(child.text or '')
+        elif name == 'r':
+            parts.extend(run.text or '' for run in child if local_name(run.tag) == 't')
+    return ''.join(parts)
+
+
+def read_strings(archive, info):
+    # the shared strings table; like the sheets it is streamed and every string is dropped
+    # from the tree once its text is taken
+    strings = []
+    if info is None:
+        return strings
+    root = None
+    with archive.open(info) as f:
+        for event, element in iterparse(f, ('start', 'end')):
+            if root is None:
+                root = element
+            elif event == 'end' and local_name(element.tag) == 'si':
+                strings.append(get_text(element))
+                root.clear()
+    return strings
+
+
+def get_namespace(tag):
+    return tag[:tag.index('}') + 1] if tag.startswith('{') else ''
+
+
+def read_cell(element, row, column, shared, names):
+    # (type, value, formula) of a c element, None for an empty (e.g. formatted only) cell;
+    # shared maps shared formula indexes to (row, column, formula) of the cell that holds it,
+    # names maps the qualified tags of the cell's children to their local names
+    kind = element.get('t', 'n')
+    value = formula = None
+    for child in element:
+        name = names.get(child.tag)
+        if name == 'v':
+            value = child.text or ''
+        elif name == 'is':
+            value = get_text(child)
+        elif name == 'f':
+            formula = child.text
+            if child.get('t') == 'shared':
+                index = child.get('si')
+                if formula:
+                    shared[index] = row, column, formula
+                elif index in shared:
+                    shared_row, shared_column, shared_formula = shared[index]
+                    formula = shift_formula(shared_formula, row - shared_row, column - shared_column)
+    if value is None and not formula:
+        return None
+    return kind, value, formula
+
+
+def iter_rows(archive, info):
+    # (row number, {column: cell}) per row of a worksheet part, streamed: a row is read when its
+    # end tag is parsed and then removed from the tree, so memory does not grow with the size of
+    # the sheet; tags are compared with their namespace, this loop runs for every element
+    shared = {}
+    # column letters -> number, a sheet only uses a few distinct columns
+    columns = {}
+    container = None
+    number = 0
+    with archive.open(info) as f:
+        events = iterparse(f, ('start', 'end'))
+        _, root = next(events)
+        namespace = get_namespace(root.tag)
+        sheet_data_tag, row_tag = namespace + 'sheetData', namespace + 'row'
+        names = {namespace + name: name for name in ('v', 'is', 'f')}
+        for event, element in events:
+            if element.tag != row_tag:
+                if element.tag == sheet_data_tag:
+                    container = element
+                continue
+            if event == 'start':
+                continue
+            # r is optional, rows and cells without it follow the previous one
+            number = int(element.get('r') or number + 1)
+            column = 0
+            cells = {}
+            for cell_element in element:
+                reference = cell_element.get('r')
+                if reference:
+                    letters = reference.rstrip('0123456789')
+                    column = columns.get(letters) or columns.setdefault(letters, column_number(letters))
+                else:
+                    column += 1
+                cell = read_cell(cell_element, number, column, shared, names)
+                if cell is not None:
+                    cells[column] = cell
+            yield number, cells
+            if container is not None:
+                container.clear()
+
+
+def get_content(cell, strings):
+    # what the cell shows in the formula bar: its formula, or its value for other cells; the
+    # cached results of formulas are left out, they change with every recalculation
+    if cell is None:
+        return None
+    kind, value, formula = cell
+    if formula:
+        return '=' + formula
+    if kind == 's':
+        try:
+            return strings[int(value)]
+        except (ValueError, IndexError):
+            return value
+    if kind == 'b':
+        return 'TRUE' if value == '1' else 'FALSE'
+    return value
+
+
+def iter_row_changes(number, cells_a, cells_b, strings_a, strings_b):
+    # (row, column, old content, new content) per changed cell of a row
+    for column in sorted(cells_a.keys() | cells_b.keys()):
+        content_a = get_content(cells_a.get(column), strings_a)
+        content_b = get_content(cells_b.get(column), strings_b)
+        if content_a != content_b:
+            yield number, column, content_b, content_a
+
+
+def merge_rows(rows_a, rows_b, strings_a, strings_b):
+    # rows come in ascending order on both sides, so they are merged like two sorted lists with
+    # a single row of each side in memory
+    rows_a, rows_b = iter(rows_a), iter(rows_b)
+    row_a, row_b = next(rows_a, None), next(rows_b, None)
+    while row_a is not None or row_b is not None:
+        if row_b is None or (row_a is not None and row_a[0] < row_b[0]):
+            yield from iter_row_changes(row_a[0], row_a[1], {}, strings_a, strings_b)
+            row_a = next(rows_a, None)
+        elif row_a is None or row_b[0] < row_a[0]:
+            yield from iter_row_changes(row_b[0], {}, row_b[1], strings_a, strings_b)
+            row_b = next(rows_b, None)
+        else:
+            yield from iter_row_changes(row_a[0], row_a[1], row_b[1], strings_a, strings_b)
+            row_a, row_b = next(rows_a, None), next(rows_b, None)
+
+
+def is_unchanged(info_a, info_b):
+    # zip entries with the same CRC-32 and size are taken as equal, without decompressing them
+    if info_a is None or info_b is None:
+        return info_a is info_b
+    return info_a.CRC == info_b.CRC and info_a.file_size == info_b.file_size
+
+
+class Workbook:
+    # the worksheets of an OOXML workbook; xls and xlsb workbooks (binary sheets) have none
+
+    def __init__(self, path):
+        self.archive = None
+        # sheet name -> zip entry, in workbook order
+        self.sheets = {}
+        self.strings_info = None
+        self.strings = None
+        if path is None:
+            return
+        try:
+            self.archive = zipfile.ZipFile(path)
+        except (zipfile.BadZipFile, OSError):
+            return
+        parts = {info.filename.lower(): info for info in self.archive.infolist()}
+        if WORKBOOK_PART not in parts or WORKBOOK_RELS_PART not in parts:
+            return
+        targets = {}
+        with self.archive.open(parts[WORKBOOK_RELS_PART]) as f:
+            for relationship in parse(f).getroot():
+                target = relationship.get('Target', '')
+                # targets are relative to the workbook part, or absolute within the package
+                part = target.lstrip('/') if target.startswith('/') else posixpath.normpath(
+                    posixpath.join(posixpath.dirname(WORKBOOK_PART), target))
+                targets[relationship.get('Id')] = relationship.get('Type', ''), parts.get(part.lower())
+                if relationship.get('Type', '').endswith(SHARED_STRINGS_TYPE):
+                    self.strings_info = parts.get(part.lower())
+        with self.archive.open(parts[WORKBOOK_PART]) as f:
+            for element in parse(f).getroot().iter():
+                if local_name(element.tag) != 'sheet':
+                    continue
+                kind, info = targets.get(get_attribute(element, 'id'), ('', None))
+                # chart sheets have no cells
+                if kind.endswith(WORKSHEET_TYPE) and info is not None:
+                    self.sheets[element.get('name')] = info
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self.archive is not None:
+            self.archive.close()
+
+    def get_strings(self):
+        # read when the first changed sheet needs it
+        if self.strings is None:
+            self.strings = read_strings(self.archive, self.strings_info)
+        return self.strings
+
+    def iter_rows(self, name):
+        info = self.sheets.get(name)
+        return iter_rows(self.archive, info) if info is not None else ()
+
+
+def iter_cell_changes(workbook_a, workbook_b, name):
+    # (row, column, old content, new content) per changed cell of the sheet, a workbook without
+    # the sheet has no cells; unchanged sheets are skipped by their CRC-32
+    strings_unchanged = is_unchanged(workbook_a.strings_info, workbook_b.strings_info)
+    if is_unchanged(workbook_a.sheets.get(name), workbook_b.sheets.get(name)):
+        if strings_unchanged:
+            tracing.count('sheets_skipped')
+            return
+        # same cells, but their shared strings may differ
+        strings_a, strings_b = workbook_a.get_strings(), workbook_b.get_strings()
+        if strings_a == strings_b:
+            tracing.count('sheets_skipped')
+            return
+        tracing.count('sheets')
+        for number, cells in workbook_a.iter_rows(name):
+            yield from iter_row_changes(number, cells, cells, strings_a, strings_b)
+        return
+    tracing.count('sheets')
+    strings_a = workbook_a.get_strings()
+    strings_b = strings_a if strings_unchanged else workbook_b.get_strings()
+    yield from merge_rows(workbook_a.iter_rows(name), workbook_b.iter_rows(name), strings_a, strings_b)
+
+
+def get_sheet_names(workbook_a, workbook_b):
+    return list(workbook_a.sheets) + [name for name in workbook_b.sheets if name not in workbook_a.sheets]
+
+
+def escape(content):
+    # a line per cell, whatever the cell holds
+    return content.replace('\\', '\\\\').replace('\r', '\\r').replace('\n', '\\n')
+
+
+def iter_lines(name, changes):
+    sheet = quote_sheet_name(name)
+    for row, column, old, new in changes:
+        reference = f'{sheet}!{column_name(column)}{row}'
+        if old is not None:
+            yield f'-{reference}: {escape(old)}'
+        if new is not None:
+            yield f'+{reference}: {escape(new)}'
+
+
+def get_headers(workbook_name, name, workbook_a, workbook_b):
+    path = workbook_name + '/Sheets/' + name
+    if name not in workbook_b.sheets:
+        return '--- /dev/null', '+++ b/' + path
+    if name not in workbook_a.sheets:
+        return '--- b/' + path, '+++ /dev/null'
+    return '--- a/' + path, '+++ b/' + path
+
+
+def iter_diffs(workbook_name, workbook_a, workbook_b):
+    # like diff.iter_diffs, for the cells of the sheets of two workbook files (a is the new
+    # side); yields (header a, header b, lines) per changed sheet, a line per changed cell
+    # such as -Sheet1!A1: =SUM(B1:B3)
+    with Workbook(workbook_a) as sheets_a, Workbook(workbook_b) as sheets_b:
+        for name in get_sheet_names(sheets_a, sheets_b):
+            lines = iter_lines(name, iter_cell_changes(sheets_a, sheets_b, name))
+            first = next(lines, None)
+            if first is not None:
+                header_a, header_b = get_headers(workbook_name, name, sheets_a, sheets_b)
+                yield header_a, header_b, chain([first], lines)
+
+
+def write_records(writer, workbook_name, workbook_a, workbook_b, **fields):
+    # a record per changed cell for the json formats, content is null where the cell is empty
+    with Workbook(workbook_a) as sheets_a, Workbook(workbook_b) as sheets_b:
+        for name in get_sheet_names(sheets_a, sheets_b):
+            for row, column, old, new in iter_cell_changes(sheets_a, sheets_b, name):
+                record = dict(fields)
+                record.update({'workbook': workbook_name, 'sheet': name, 'cell': f'{column_name(column)}{row}',
+                               'old': old, 'new': new})
+                writer.write(record)
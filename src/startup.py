@@ -0,0 +1,50 @@
+import sys
+import time
+import builtins
+
+
+OPTION = '--startup-profile'
+
+
+class ImportProfile:
+    # times every module imported while installed, like python -X importtime, but without
+    # having to change the command line git runs
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.imports = []
+        self.depth = 0
+        self.original_import = builtins.__import__
+        builtins.__import__ = self.timed_import
+
+    def timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level or name in sys.modules:
+            return self.original_import(name, globals, locals, fromlist, level)
+        self.depth += 1
+        start = time.perf_counter()
+        try:
+            return self.original_import(name, globals, locals, fromlist, level)
+        finally:
+            self.depth -= 1
+            # nested imports are recorded before the module importing them, as with -X importtime
+            self.imports.append((self.depth, name, time.perf_counter() - start))
+
+    def uninstall(self):
+        builtins.__import__ = self.original_import
+
+    def report(self, out=None):
+        self.uninstall()
+        out = out or sys.stderr
+        for depth, name, elapsed in self.imports:
+            out.write(f'import time: {elapsed * 1000:8.1f} ms | {"  " * depth}{name}\n')
+        out.write(f'total time:  {(time.perf_counter() - self.started) * 1000:8.1f} ms\n')
+        out.flush()
+
+
+def enable(args):
+    # removes the option from args and starts profiling, the returned profile (None without
+    # the option) is reported once the command is done
+    if OPTION not in args:
+        return None
+    args.remove(OPTION)
+    return ImportProfile()
@@ -0,0 +1,271 @@
+import io
+import os
+import struct
+import random
+import zipfile
+
+from compound import compound_file
+
+
+# Synthetic workbooks of controlled size, for the benchmarks and for tests that need more than
+# Book1.xlsb. The VBA project is written as Excel writes it (MS-OVBA, in an MS-CFB compound
+# file); sheets are filler of the requested size, so the files are meant for git-xl, not Excel.
+
+FORMATS = ('xls', 'xlsm', 'xlsb')
+DOCUMENT_MODULES = ('ThisWorkbook', 'Sheet1')
+CODE_PAGE = 'cp1252'
+
+DOCUMENT_ATTRIBUTES = [
+    'Attribute VB_Base = "0{00020819-0000-0000-C000-000000000046}"',
+    'Attribute VB_GlobalNameSpace = False',
+    'Attribute VB_Creatable = False',
+    'Attribute VB_PredeclaredId = True',
+    'Attribute VB_Exposed = True',
+    'Attribute VB_TemplateDerived = False',
+    'Attribute VB_Customizable = True',
+]
+CLASS_ATTRIBUTES = [
+    'Attribute VB_GlobalNameSpace = False',
+    'Attribute VB_Creatable = False',
+    'Attribute VB_PredeclaredId = False',
+    'Attribute VB_Exposed = False',
+]
+
+
+def module_kind(name):
+    if name in DOCUMENT_MODULES:
+        return 'document'
+    if name.startswith('Class'):
+        return 'class'
+    return 'module'
+
+
+def procedure_lines(name, index, generator):
+    # a function around a long Select Case block, the kind of code that makes diffs slow
+    cases = generator.randint(5, 30)
+    lines = [f'Public Function {name}Value{index}(ByVal value As Long) As Double',
+             f"    ' value {index} of {name}",
+             '    Dim result As Double',
+             '    Select Case value']
+    for case in range(cases):
+        lines.append(f'        Case {case}: result = value * {generator.randint(1, 99)}.{generator.randint(0, 9)}')
+    lines += ['        Case Else: result = 0',
+              '    End Select',
+              f'    {name}Value{index} = result',
+              'End Function',
+              '']
+    return lines
+
+
+def make_source(name, line_count, seed=0):
+    generator = random.Random(f'{name}:{seed}')
+    lines = ['Option Explicit', '']
+    index = 0
+    while len(lines) < line_count:
+        index += 1
+        lines += procedure_lines(name, index, generator)
+    return '\n'.join(lines[:line_count])
+
+
+def make_modules(module_count, line_count, seed=0):
+    # the document modules of a one-sheet workbook plus module_count standard and class modules
+    names = list(DOCUMENT_MODULES) + [f'Class{i}' if i % 5 == 0 else f'Module{i}' for i in range(1, module_count + 1)]
+    return {name: make_source(name, min(line_count, 20) if module_kind(name) == 'document' else line_count, seed)
+            for name in names}
+
+
+def change_modules(modules, every_module=3, every_line=50, seed=1):
+    # a later version of the modules: every n-th line of every n-th module is modified
+    generator = random.Random(seed)
+    changed = {}
+    for i, (name, source) in enumerate(modules.items()):
+        if i % every_module:
+            changed[name] = source
+            continue
+        lines = source.split('\n')
+        for j in range(every_line - 1, len(lines), every_line):
+            lines[j] = lines[j] + f" ' changed {generator.randint(0, 9999)}"
+        changed[name] = '\n'.join(lines)
+    return changed
+
+
+def compress(data):
+    # MS-OVBA 2.4.1.3.6, a signature byte followed by one chunk per 4096 bytes of data
+    out = bytearray(b'\x01')
+    for start in range(0, len(data), 4096):
+        out += compress_chunk(data[start:start + 4096])
+    return bytes(out)
+
+
+def compress_chunk(chunk):
+    tokens = bytearray()
+    positions = {}
+    n = len(chunk)
+    i = 0
+    while i < n:
+        flag_index = len(tokens)
+        tokens.append(0)
+        flags = 0
+        for bit in range(8):
+            if i >= n:
+                break
+            length = offset = 0
+            if i and i + 3 <= n:
+                bit_count = max((i - 1).bit_length(), 4)
+                maximum_length = (0xFFFF >> bit_count) + 3
+                for candidate in reversed(positions.get(chunk[i:i + 3], [])[-8:]):
+                    size = 3
+                    while i + size < n and size < maximum_length and chunk[candidate + size] == chunk[i + size]:
+                        size += 1
+                    if size > length:
+                        length, offset = size, i - candidate
+            if length:
+                tokens += struct.pack('<H', ((offset - 1) << (16 - bit_count)) | (length - 3))
+                flags |= 1 << bit
+            else:
+                length = 1
+                tokens.append(chunk[i])
+            for k in range(i, min(i + length, n - 2)):
+                positions.setdefault(chunk[k:k + 3], []).append(k)
+            i += length
+        tokens[flag_index] = flags
+    if len(tokens) > 4096:
+        # incompressible data is stored as a raw chunk
+        return struct.pack('<H', 0x3FFF) + chunk.ljust(4096, b'\0')
+    return struct.pack('<H', 0xB000 | (len(tokens) - 1)) + tokens
+
+
+def record(record_id, data):
+    return struct.pack('<HI', record_id, len(data)) + data
+
+
+def dir_stream(names):
+    # MS-OVBA 2.3.4.2, project information without references followed by the module records
+    data = record(0x0001, struct.pack('<I', 1))
+    data += record(0x0002, struct.pack('<I', 0x409))
+    data += record(0x0014, struct.pack('<I', 0x409))
+    data += record(0x0003, struct.pack('<H', 1252))
+    data += record(0x0004, b'VBAProject')
+    data += record(0x0005, b'') + record(0x0040, b'')
+    data += record(0x0006, b'') + record(0x003D, b'')
+    data += record(0x0007, struct.pack('<I', 0))
+    data += record(0x0008, struct.pack('<I', 0))
+    data += struct.pack('<HIIH', 0x0009, 4, 1, 0)
+    data += record(0x000C, b'') + record(0x003C, b'')
+    data += struct.pack('<HIH', 0x000F, 2, len(names))
+    data += struct.pack('<HIH', 0x0013, 2, 0xFFFF)
+    for name in names:
+        encoded = name.encode(CODE_PAGE)
+        data += record(0x0019, encoded)
+        data += record(0x0047, name.encode('utf-16-le'))
+        data += record(0x001A, encoded) + record(0x0032, name.encode('utf-16-le'))
+        data += record(0x001C, b'') + record(0x0048, b'')
+        data += record(0x0031, struct.pack('<I', 0))
+        data += record(0x001E, struct.pack('<I', 0))
+        data += record(0x002C, struct.pack('<H', 0xFFFF))
+        data += record(0x0021 if module_kind(name) == 'module' else 0x0022, b'')
+        data += record(0x002B, b'')
+    data += record(0x0010, b'')
+    return compress(data)
+
+
+def module_text(name, source):
+    kind = module_kind(name)
+    lines = [f'Attribute VB_Name = "{name}"']
+    lines += DOCUMENT_ATTRIBUTES if kind == 'document' else CLASS_ATTRIBUTES if kind == 'class' else []
+    lines += source.split('\n')
+    return '\r\n'.join(lines) + '\r\n'
+
+
+def project_stream(names):
+    lines = ['ID="{00000000-0000-0000-0000-000000000000}"']
+    for name in names:
+        kind = module_kind(name)
+        lines.append(f'Document={name}/&H00000000' if kind == 'document' else
+                     f'Class={name}' if kind == 'class' else f'Module={name}')
+    lines += ['Name="VBAProject"', 'HelpContextID="0"', 'VersionCompatible32="393222000"', '',
+              '[Host Extender Info]', '&H00000001={3832D640-CF90-11CF-8E43-00A0C911005A};VBE;&H00000000', '']
+    return '\r\n'.join(lines).encode(CODE_PAGE)
+
+
+def vba_streams(modules, prefix=''):
+    names = list(modules)
+    streams = {
+        prefix + 'PROJECT': project_stream(names),
+        prefix + 'PROJECTwm': b''.join(name.encode(CODE_PAGE) + b'\0' + name.encode('utf-16-le') + b'\0\0'
+                                       for name in names) + b'\0\0',
+        prefix + 'VBA/_VBA_PROJECT': b'\xcc\x61\xff\xff\x00\x00\x00',
+        prefix + 'VBA/dir': dir_stream(names),
+    }
+    for name, source in modules.items():
+        streams[prefix + 'VBA/' + name] = compress(module_text(name, source).encode(CODE_PAGE))
+    return streams
+
+
+def sheet_payload(size, seed, binary):
+    # whole rows of random numbers (at least size bytes), about as compressible as real sheet data
+    generator = random.Random(seed)
+    out = io.BytesIO()
+    row = 0
+    while out.tell() < size:
+        row += 1
+        if binary:
+            out.write(b''.join(struct.pack('<IHd', row, column, generator.random() * 1000) for column in range(8)))
+        else:
+            cells = ''.join(f'<c r="{column}{row}"><v>{generator.random() * 1000:.4f}</v></c>' for column in 'ABCDEFGH')
+            out.write(f'<row r="{row}">{cells}</row>'.encode('ascii'))
+    return out.getvalue()
+
+
+def write_workbook(path, modules, payload_size=0, seed=0):
+    # the format is taken from the extension of path
+    extension = os.path.splitext(path)[1].lower()[1:]
+    if extension == 'xls':
+        streams = {'Workbook': sheet_payload(payload_size, seed, binary=True)}
+        streams.update(vba_streams(modules, prefix='_VBA_PROJECT_CUR/'))
+        with open(path, 'wb') as f:
+            f.write(compound_file(streams))
+        return
+    if extension not in ('xlsm', 'xlsb'):
+        raise ValueError(f'unsupported workbook format "{extension}"')
+    binary = extension == 'xlsb'
+    suffix = 'bin' if binary else 'xml'
+    main_type = ('application/vnd.ms-excel.sheet.binary.macroEnabled.main' if binary else
+                 'application/vnd.ms-excel.sheet.macroEnabled.main+xml')
+    sheet_type = ('application/vnd.ms-excel.worksheet' if binary else
+                  'application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml')
+    parts = {
+        '[Content_Types].xml': (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="bin" ContentType="application/vnd.ms-office.vbaProject"/>'
+            f'<Override PartName="/xl/workbook.{suffix}" ContentType="{main_type}"/>'
+            f'<Override PartName="/xl/worksheets/sheet1.{suffix}" ContentType="{sheet_type}"/>'
+            '</Types>'),
+        '_rels/.rels': (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/'
+            f'officeDocument" Target="xl/workbook.{suffix}"/></Relationships>'),
+        'xl/_rels/workbook.{suffix}.rels'.format(suffix=suffix): (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/'
+            f'worksheet" Target="worksheets/sheet1.{suffix}"/>'
+            '<Relationship Id="rId2" Type="http://schemas.microsoft.com/office/2006/relationships/vbaProject" '
+            'Target="vbaProject.bin"/></Relationships>'),
+        f'xl/workbook.{suffix}': b'\0' * 64 if binary else (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+            '<sheets><sheet name="Sheet1" sheetId="1" r:id="rId1"/></sheets></workbook>'),
+        f'xl/worksheets/sheet1.{suffix}': sheet_payload(payload_size, seed, binary) if binary else (
+            b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>' +
+            sheet_payload(payload_size, seed, binary) + b'</sheetData></worksheet>'),
+        'xl/vbaProject.bin': compound_file(vba_streams(modules)),
+    }
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, data in parts.items():
+            archive.writestr(name, data)
@@ -0,0 +1,77 @@
+import unittest
+import sys
+import os
+import random
+from difflib import unified_diff, SequenceMatcher
+
+# Add src directory to path for importing algorithms module
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import algorithms
+
+
+def lcs_length(a, b):
+    previous = [0] * (len(b) + 1)
+    for line in a:
+        current = [0]
+        for j, other in enumerate(b):
+            current.append(previous[j] + 1 if line == other else max(previous[j + 1], current[j]))
+        previous = current
+    return previous[-1]
+
+
+class TestAlgorithms(unittest.TestCase):
+    """Test the alternative diff algorithms"""
+
+    def random_pairs(self, count=300):
+        generator = random.Random(8)
+        for _ in range(count):
+            alphabet = 'abcdefghij'[:generator.randint(1, 10)]
+            a = [generator.choice(alphabet) for _ in range(generator.randint(0, 30))]
+            b = [generator.choice(alphabet) for _ in range(generator.randint(0, 30))]
+            yield a, b
+
+    def test_opcodes_transform_a_into_b(self):
+        for a, b in self.random_pairs():
+            for algorithm in algorithms.ALGORITHMS:
+                result = []
+                for tag, i1, i2, j1, j2 in algorithms.get_opcodes(a, b, algorithm):
+                    if tag == 'equal':
+                        self.assertEqual(a[i1:i2], b[j1:j2])
+                        result += a[i1:i2]
+                    else:
+                        result += b[j1:j2]
+                self.assertEqual(result, b)
+
+    def test_myers_is_minimal(self):
+        for a, b in self.random_pairs():
+            matched = sum(size for _, _, size in algorithms.get_matching_blocks(a, b, 'myers'))
+            self.assertEqual(matched, lcs_length(a, b))
+
+    def test_unified_diff_format(self):
+        """Test the hunks have the format of difflib.unified_diff"""
+        for a, b in self.random_pairs():
+            expected = list(unified_diff(a, b, n=2, lineterm=''))[2:]
+            self.assertEqual(list(algorithms.unified_diff(a, b, 2, 'difflib')), expected)
+            # hunks of the other algorithms agree wherever their opcodes do
+            opcodes = algorithms.get_opcodes(a, b, 'histogram')
+            if opcodes == SequenceMatcher(None, a, b).get_opcodes():
+                self.assertEqual(list(algorithms.unified_diff(a, b, 2, 'histogram')), expected)
+
+    def test_histogram_anchors_on_unique_lines(self):
+        a = ['Sub A()', '    x = 1', 'End Sub', 'Sub B()', '    y = 1', 'End Sub']
+        b = ['Sub A()', '    x = 1', 'End Sub', 'Sub C()', '    x = 1', 'End Sub', 'Sub B()', '    y = 1', 'End Sub']
+        self.assertEqual(list(algorithms.unified_diff(a, b, 1, 'histogram')), [
+            '@@ -3,2 +3,5 @@', ' End Sub', '+Sub C()', '+    x = 1', '+End Sub', ' Sub B()'])
+
+    def test_repetitive_module(self):
+        """Test long Case blocks with rewritten lines are diffed quickly and correctly"""
+        a = [f'    Case {i % 50}: x = {i % 7}' for i in range(5000)]
+        b = [line if i % 97 else 'changed' for i, line in enumerate(a)]
+        for algorithm in ('myers', 'histogram'):
+            lines = list(algorithms.unified_diff(a, b, 0, algorithm))
+            self.assertEqual(len([line for line in lines if line.startswith('-')]), 52)
+            self.assertEqual(len([line for line in lines if line.startswith('+')]), 52)
+
+
+if __name__ == '__main__':
+    unittest.main()
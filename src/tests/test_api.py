@@ -0,0 +1,131 @@
+import unittest
+import sys
+import os
+import shutil
+import tempfile
+import zipfile
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+
+# Add src directory to path for importing modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import api
+import diff
+import synthetic
+
+
+class TestBufferReader(unittest.TestCase):
+    """Test the file object over in-memory workbooks"""
+
+    def test_read_and_seek(self):
+        reader = diff.BufferReader(memoryview(b'0123456789'))
+        self.assertEqual(reader.read(3), b'012')
+        self.assertEqual(reader.seek(-2, 2), 8)
+        self.assertEqual(reader.read(), b'89')
+        self.assertEqual(reader.read(1), b'')
+        reader.seek(4)
+        reader.seek(1, 1)
+        self.assertEqual(reader.tell(), 5)
+        self.assertEqual(reader.read(2), b'56')
+
+
+class TestExtract(unittest.TestCase):
+    """Test extraction from paths, buffers and file objects"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.temp_dir = tempfile.mkdtemp()
+        cls.modules = synthetic.make_modules(3, 40)
+        cls.workbooks = {}
+        for workbook_format in synthetic.FORMATS:
+            path = os.path.join(cls.temp_dir, 'Book1.' + workbook_format)
+            synthetic.write_workbook(path, cls.modules)
+            cls.workbooks[workbook_format] = path
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.temp_dir, ignore_errors=True)
+
+    def read(self, workbook_format):
+        with open(self.workbooks[workbook_format], 'rb') as f:
+            return f.read()
+
+    def assert_modules(self, module_set):
+        self.assertIsInstance(module_set, api.ModuleSet)
+        self.assertEqual(module_set.sources(), {name: source + '\n'
+                                                for name, source in self.modules.items()})
+
+    def test_sources(self):
+        for workbook_format in synthetic.FORMATS:
+            with self.subTest(workbook_format):
+                data = self.read(workbook_format)
+                self.assert_modules(api.extract(self.workbooks[workbook_format]))
+                self.assert_modules(api.extract(data))
+                self.assert_modules(api.extract(bytearray(data)))
+                self.assert_modules(api.extract(memoryview(data)))
+                self.assert_modules(api.extract(BytesIO(data)))
+                with open(self.workbooks[workbook_format], 'rb') as f:
+                    self.assert_modules(api.extract(f))
+
+    def test_name(self):
+        self.assertEqual(api.extract(self.workbooks['xlsm']).name, 'Book1.xlsm')
+        self.assertEqual(api.extract(self.read('xlsm'), name='upload.xlsm').name, 'upload.xlsm')
+        self.assertEqual(api.extract(self.read('xlsm')).name, 'workbook')
+
+    def test_workbook_without_macros(self):
+        data = BytesIO()
+        with zipfile.ZipFile(data, 'w') as archive:
+            archive.writestr('xl/workbook.xml', '<workbook/>')
+        self.assertEqual(api.extract(data.getvalue()), {})
+
+    def test_threads(self):
+        data = [self.read(workbook_format) for workbook_format in synthetic.FORMATS] * 4
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            for module_set in executor.map(api.extract, data):
+                self.assert_modules(module_set)
+
+
+class TestCompare(unittest.TestCase):
+    """Test comparing the modules of two workbooks"""
+
+    def setUp(self):
+        self.old = api.ModuleSet({name: diff.Module(name, source) for name, source in
+                                  (('Module1', 'Sub A()\nEnd Sub'), ('Module2', 'Sub B()\nEnd Sub'),
+                                   ('Module3', 'Sub C()\nEnd Sub'))})
+        self.new = api.ModuleSet({name: diff.Module(name, source) for name, source in
+                                  (('Module1', 'Sub A()\n    Beep\nEnd Sub'), ('Module2', 'Sub B()\nEnd Sub'),
+                                   ('Module4', 'Sub D()\nEnd Sub'))})
+
+    def test_compare(self):
+        diffs = [(module_diff.name, module_diff.status, list(module_diff.lines))
+                 for module_diff in api.compare(self.old, self.new)]
+        self.assertEqual(diffs, [
+            ('Module1', 'modified', ['@@ -1,2 +1,3 @@', ' Sub A()', '+    Beep', ' End Sub']),
+            ('Module4', 'added', ['+Sub D()', '+End Sub']),
+            ('Module3', 'deleted', ['-Sub C()', '-End Sub']),
+        ])
+
+    def test_algorithm(self):
+        for algorithm in ('myers', 'histogram'):
+            module_diff = next(api.compare(self.old, self.new, numlines=0, algorithm=algorithm))
+            self.assertEqual(list(module_diff.lines), ['@@ -1,0 +2 @@', '+    Beep'])
+        with self.assertRaises(ValueError):
+            api.compare(self.old, self.new, algorithm='patience')
+
+    def test_workbooks(self):
+        modules = synthetic.make_modules(3, 40)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            old_path = os.path.join(temp_dir, 'old.xlsb')
+            new_path = os.path.join(temp_dir, 'new.xlsb')
+            synthetic.write_workbook(old_path, modules)
+            synthetic.write_workbook(new_path, synthetic.change_modules(modules, every_module=1, every_line=7))
+            with open(new_path, 'rb') as f:
+                new = f.read()
+            diffs = list(api.compare(old_path, new))
+        self.assertEqual([module_diff.name for module_diff in diffs], list(modules))
+        self.assertTrue(all(module_diff.status == 'modified' for module_diff in diffs))
+
+
+if __name__ == '__main__':
+    unittest.main()
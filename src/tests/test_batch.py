@@ -0,0 +1,246 @@
+import unittest
+import sys
+import os
+import json
+import shutil
+import tempfile
+import subprocess
+import multiprocessing
+from io import BytesIO
+from unittest.mock import patch
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+# Add src directory to path for importing modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import diff
+import batch
+import plumbing
+import synthetic
+from cache import Cache
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class TestParseArgs(unittest.TestCase):
+    """Test the git xl diff arguments"""
+
+    def test_parse_args(self):
+        options, revisions, paths = batch.parse_args(['--diff-algorithm=myers', '-U5', 'main..HEAD', '--', 'a.xlsm'])
+        self.assertEqual(options, {'diff-algorithm': 'myers', 'unified': 5})
+        self.assertEqual(revisions, ['main..HEAD'])
+        self.assertEqual(paths, ['a.xlsm'])
+        self.assertEqual(batch.parse_args([]), ({}, [], []))
+        options, revisions, _ = batch.parse_args(['--diff-granularity=procedure', '-L', 'Module1.Total', 'HEAD'])
+        self.assertEqual(options, {'diff-granularity': 'procedure', 'procedure': 'Module1.Total'})
+        self.assertEqual(revisions, ['HEAD'])
+
+
+class RepositoryTestCase(unittest.TestCase):
+    """Base class for tests on a repository with workbooks diffed by the xl diff driver"""
+
+    def git(self, *args):
+        return subprocess.run(['git'] + list(args), cwd=self.repository, env=self.env, check=True,
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE).stdout
+
+    def commit(self, workbooks, message):
+        for name, modules in workbooks.items():
+            path = os.path.join(self.repository, name)
+            if modules is None:
+                os.remove(path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                synthetic.write_workbook(path, modules)
+        with open(os.path.join(self.repository, 'notes.txt'), 'a') as f:
+            f.write(message + '\n')
+        self.git('add', '-A')
+        self.git('commit', '-q', '-m', message)
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.repository = os.path.join(self.temp_dir, 'repository')
+        os.makedirs(self.repository)
+        self.env = dict(os.environ, GIT_XL_CACHE_DIR=os.path.join(self.temp_dir, 'cache'), GIT_XL_CACHE_SIZE='0',
+                        GIT_XL_DAEMON_SOCKET=os.path.join(self.temp_dir, 'daemon.sock'))
+        self.env_patch = patch.dict(os.environ, self.env)
+        self.env_patch.start()
+        self.git('init', '-q')
+        self.git('config', 'user.name', 'git-xl')
+        self.git('config', 'user.email', 'git-xl@example.com')
+        self.git('config', 'diff.xl.command', f'"{sys.executable}" "{os.path.join(SRC_DIR, "diff.py")}"')
+        with open(os.path.join(self.repository, '.gitattributes'), 'w') as f:
+            f.write('*.xls diff=xl\n*.xlsm diff=xl\n*.xlsb diff=xl\n')
+        self.create_history()
+
+    def create_history(self):
+        self.modules = synthetic.make_modules(4, 60)
+        self.commit({'Book1.xlsm': self.modules, 'Reports/Book2.xlsb': self.modules}, 'first')
+        self.commit({'Book1.xlsm': synthetic.change_modules(self.modules, every_line=7),
+                     'Reports/Book2.xlsb': None, 'Book3.xls': self.modules}, 'second')
+
+    def tearDown(self):
+        self.env_patch.stop()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+
+class TestDiffRange(RepositoryTestCase):
+    """Test git xl diff against git diff with the xl diff driver"""
+
+    def diff_range(self, *args):
+        out = BytesIO()
+        batch.diff_range(args, out=out, cache=Cache(max_size=0), cwd=self.repository)
+        return out.getvalue()
+
+    def test_same_output_as_git_diff(self):
+        expected = self.git('diff', 'HEAD~1', 'HEAD', '--', '*.xls', '*.xlsm', '*.xlsb')
+        self.assertIn(b'Book1.xlsm/VBA/Module2', expected)
+        self.assertEqual(self.diff_range('HEAD~1..HEAD'), expected)
+
+    def test_paths(self):
+        output = self.diff_range('HEAD~1', 'HEAD', '--', 'Reports')
+        self.assertEqual(output, self.git('diff', 'HEAD~1', 'HEAD', '--', 'Reports'))
+        self.assertIn(b'+++ /dev/null', output)
+        self.assertNotIn(b'Book1.xlsm', output)
+
+    def test_working_tree(self):
+        synthetic.write_workbook(os.path.join(self.repository, 'Book1.xlsm'), self.modules)
+        self.assertEqual(self.diff_range(), self.git('diff', '--', '*.xlsm'))
+        self.assertEqual(self.diff_range('--cached'), b'')
+
+    def test_sheets(self):
+        synthetic.write_workbook(os.path.join(self.repository, 'Book1.xlsm'), self.modules, payload_size=200)
+        self.git('commit', '-q', '-a', '-m', 'third')
+        synthetic.write_workbook(os.path.join(self.repository, 'Book1.xlsm'), self.modules, payload_size=200, seed=1)
+        expected = self.git('-c', 'diff.xl.sheets=true', 'diff', 'HEAD~2', '--', '*.xls', '*.xlsm', '*.xlsb')
+        self.assertIn(b'+++ b/Book1.xlsm/Sheets/Sheet1', expected)
+        self.assertEqual(self.diff_range('--sheets=true', 'HEAD~2'), expected)
+        with patch('diff.get_git_config', return_value={'diff.xl.sheets': 'true'}):
+            self.assertEqual(self.diff_range('HEAD~2'), expected)
+
+    def test_parallel_threshold(self):
+        expected = self.diff_range('HEAD~1..HEAD')
+        with ProcessPoolExecutor(max_workers=2, mp_context=multiprocessing.get_context('spawn')) as executor, \
+                patch.object(executor, 'submit', wraps=executor.submit) as mock_submit:
+            out = BytesIO()
+            batch.diff_range(['HEAD~1..HEAD'], out=out, cache=Cache(max_size=0), executor=executor,
+                             cwd=self.repository)
+            self.assertEqual(out.getvalue(), expected)
+            # small workbooks are extracted in-process
+            mock_submit.assert_not_called()
+            with patch.dict(os.environ, {'GIT_XL_PARALLEL_THRESHOLD': '1'}):
+                out = BytesIO()
+                batch.diff_range(['HEAD~1..HEAD'], out=out, cache=Cache(max_size=0), executor=executor,
+                                 cwd=self.repository)
+        self.assertEqual(out.getvalue(), expected)
+        # four blobs, the first one is extracted in-process while the pool works on the others
+        self.assertEqual(mock_submit.call_count, 3)
+
+    def test_invalid_revision(self):
+        with self.assertRaises(plumbing.GitError):
+            self.diff_range('no-such-branch..HEAD')
+
+    def test_entries_pruned_by_another_process(self):
+        cache = Cache(path=os.path.join(self.temp_dir, 'diff-cache'), max_size=10 ** 8)
+        batch.diff_range(['HEAD~1..HEAD'], out=BytesIO(), cache=cache, cwd=self.repository)
+        # the entries are gone by the time they are read, their blobs are fetched after all
+        out = BytesIO()
+        with patch.object(cache, 'get', return_value=None):
+            batch.diff_range(['HEAD~1..HEAD'], out=out, cache=cache, cwd=self.repository)
+        self.assertEqual(out.getvalue(), self.diff_range('HEAD~1..HEAD'))
+
+    def test_json_formats(self):
+        records = [json.loads(line) for line in self.diff_range('--format=ndjson', 'HEAD~1..HEAD').splitlines()]
+        self.assertEqual(len(records), self.diff_range('HEAD~1..HEAD').count(b'+++ '))
+        self.assertEqual({(record['workbook'], record['status']) for record in records},
+                         {('Book1.xlsm', 'modified'), ('Book3.xls', 'added'), ('Reports/Book2.xlsb', 'removed')})
+        self.assertEqual(json.loads(self.diff_range('--format=json', 'HEAD~1..HEAD')), records)
+        self.assertEqual(json.loads(self.diff_range('--format=json', 'HEAD..HEAD')), [])
+        with self.assertRaises(ValueError):
+            self.diff_range('--format=yaml')
+
+
+class TestLogRange(RepositoryTestCase):
+    """Test git xl log against git log -p with the xl diff driver"""
+
+    def create_history(self):
+        super().create_history()
+        self.commit({'Book1.xlsm': synthetic.change_modules(self.modules, every_line=5, seed=2)}, 'third')
+
+    def log_range(self, *args, executor=None):
+        out = BytesIO()
+        batch.log_range(args, out=out, cache=Cache(max_size=0), executor=executor, cwd=self.repository)
+        return out.getvalue().replace(diff.COMMIT_COLOR, b'').replace(diff.RESET, b'')
+
+    def test_same_output_as_git_log(self):
+        expected = self.git('log', '-p', '--ext-diff', '--', '*.xls', '*.xlsm', '*.xlsb')
+        self.assertEqual(expected.count(b'diff --xl'), 6)
+        self.assertEqual(self.log_range(), expected)
+
+    def test_options_and_paths(self):
+        self.assertEqual(self.log_range('--diff-algorithm=histogram', 'HEAD~1', 'Book1.xlsm'),
+                         self.git('-c', 'diff.xl.vbaAlgorithm=histogram', 'log', '-p', '--ext-diff', 'HEAD~1', 'Book1.xlsm'))
+        self.assertIn(b'@@ -13,4 +13,4 @@', self.log_range('-U1', '-n', '1'))
+
+    def test_each_blob_is_extracted_once(self):
+        # Book1.xlsm in three versions, Book2.xlsb and Book3.xls in one
+        with ThreadPoolExecutor(max_workers=2) as executor, \
+                patch('diff.get_modules', wraps=diff.get_modules) as mock_get_modules:
+            self.log_range(executor=executor)
+        self.assertEqual(mock_get_modules.call_count, 5)
+
+    def test_broken_pipe(self):
+        for command in ('diff', 'log'):
+            # the reader is gone before anything is written
+            process = subprocess.Popen([sys.executable, os.path.join(SRC_DIR, 'cli.py'), command, 'HEAD~2..HEAD'],
+                                       cwd=self.repository, env=self.env, stdout=subprocess.PIPE,
+                                       stderr=subprocess.PIPE)
+            process.stdout.close()
+            stderr = process.stderr.read()
+            self.assertEqual((process.wait(), stderr), (1, b''))
+
+    def test_one_process_pool_per_walk(self):
+        expected = self.log_range()
+        # every workbook counts as large, all but one of every commit are extracted by the pool
+        with patch.dict(os.environ, {'GIT_XL_PARALLEL_THRESHOLD': '1'}), \
+                patch('diff.ProcessPoolExecutor', wraps=diff.ProcessPoolExecutor) as mock_process_pool_executor:
+            self.assertEqual(self.log_range(), expected)
+        self.assertEqual(mock_process_pool_executor.call_count, 1)
+
+    def test_process_pool_executor(self):
+        expected = self.log_range()
+        with patch.dict(os.environ, {'GIT_XL_PARALLEL_THRESHOLD': '1'}), \
+                ProcessPoolExecutor(max_workers=2, mp_context=multiprocessing.get_context('spawn')) as executor:
+            self.assertEqual(self.log_range(executor=executor), expected)
+            output = self.log_range('-L', 'Module1.Module1Value1', executor=executor)
+        self.assertIn(b'Module1Value1', output)
+        self.assertEqual(output, self.log_range('-L', 'Module1.Module1Value1'))
+
+    def test_json_formats(self):
+        records = [json.loads(line) for line in self.log_range('--format=ndjson').splitlines()]
+        self.assertEqual(len(records), self.log_range().count(b'+++ '))
+        commits = self.git('log', '--format=%H').decode().split()
+        self.assertEqual(list(dict.fromkeys(record['commit'] for record in records)), commits)
+        self.assertEqual({record['status'] for record in records if record['commit'] == commits[-1]}, {'added'})
+        self.assertEqual(json.loads(self.log_range('--format=json')), records)
+
+    def test_sheets(self):
+        for seed in (1, 2):
+            synthetic.write_workbook(os.path.join(self.repository, 'Book1.xlsm'), self.modules, payload_size=200,
+                                     seed=seed)
+            self.git('commit', '-q', '-a', '-m', f'sheets {seed}')
+        expected = self.git('-c', 'diff.xl.sheets=true', 'log', '-p', '--ext-diff', '--', '*.xls', '*.xlsm', '*.xlsb')
+        self.assertEqual(expected.count(b'+++ b/Book1.xlsm/Sheets/Sheet1'), 2)
+        self.assertEqual(self.log_range('--sheets=true'), expected)
+        records = [json.loads(line) for line in self.log_range('--sheets=true', '--format=ndjson', '-n', '1')
+                   .splitlines()]
+        self.assertEqual({record['sheet'] for record in records}, {'Sheet1'})
+
+    def test_commits_without_workbooks_are_skipped(self):
+        with open(os.path.join(self.repository, 'notes.txt'), 'a') as f:
+            f.write('fourth\n')
+        self.git('commit', '-q', '-a', '-m', 'fourth')
+        self.assertNotIn(b'fourth', self.log_range())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+import unittest
+import sys
+import os
+import shutil
+import tempfile
+import hashlib
+from unittest import mock
+from unittest.mock import patch
+
+# Add src directory to path for importing cache module
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import cache
+
+
+class TestHelpers(unittest.TestCase):
+    """Test cache helper functions"""
+
+    def test_parse_size(self):
+        self.assertEqual(cache.parse_size('100'), 100)
+        self.assertEqual(cache.parse_size('4K'), 4096)
+        self.assertEqual(cache.parse_size('2M'), 2 * 1024 ** 2)
+        self.assertEqual(cache.parse_size('1gb'), 1024 ** 3)
+        with self.assertRaises(ValueError):
+            cache.parse_size('lots')
+
+    def test_is_object_id(self):
+        self.assertTrue(cache.is_object_id('a' * 40))
+        self.assertTrue(cache.is_object_id('0123456789abcdef' * 4))
+        self.assertFalse(cache.is_object_id('0' * 40))
+        self.assertFalse(cache.is_object_id('.'))
+        self.assertFalse(cache.is_object_id(None))
+
+    def test_blob_sha_matches_git(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(temp_dir, 'Book1.xlsm')
+            with open(path, 'wb') as f:
+                f.write(b'workbook')
+            expected = hashlib.sha1(b'blob 8\0workbook').hexdigest()
+            self.assertEqual(cache.blob_sha(path), expected)
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    @patch.dict(os.environ, {'GIT_XL_CACHE_DIR': '/tmp/git-xl-cache'})
+    def test_cache_dir_from_environment(self):
+        self.assertEqual(cache.get_cache_dir(), '/tmp/git-xl-cache')
+
+
+class TestCache(unittest.TestCase):
+    """Test the on-disk module cache"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_put_and_get(self):
+        c = cache.Cache(path=self.temp_dir, max_size=1024 * 1024)
+        modules = {'Module2': 'Sub B()\nEnd Sub', 'Module1': 'Sub A()\nEnd Sub'}
+        self.assertIsNone(c.get('a' * 40))
+        c.put('a' * 40, modules)
+        result = c.get('a' * 40)
+        self.assertEqual(result, modules)
+        # module order is preserved, it determines the order of the diff output
+        self.assertEqual(list(result), ['Module2', 'Module1'])
+
+    def test_disabled_cache(self):
+        c = cache.Cache(path=self.temp_dir, max_size=0)
+        c.put('a' * 40, {'Module1': ''})
+        self.assertIsNone(c.get('a' * 40))
+        self.assertEqual(c.entries(), [])
+
+    def test_prune_evicts_least_recently_used(self):
+        c = cache.Cache(path=self.temp_dir, max_size=1024 * 1024)
+        for i, key in enumerate(['a' * 40, 'b' * 40, 'c' * 40]):
+            c.put(key, {'Module1': 'x' * 100})
+            os.utime(c.entry_path(key), (1000 + i, 1000 + i))
+        # reading an entry makes it the most recently used one
+        c.get('a' * 40)
+        entry_size = os.path.getsize(c.entry_path('a' * 40))
+        removed = c.prune(max_size=2 * entry_size)
+        self.assertEqual(removed, 1)
+        self.assertIsNone(c.get('b' * 40))
+        self.assertIsNotNone(c.get('a' * 40))
+        self.assertIsNotNone(c.get('c' * 40))
+
+    def test_put_enforces_max_size(self):
+        c = cache.Cache(path=self.temp_dir, max_size=150)
+        c.put('a' * 40, {'Module1': 'x' * 100})
+        os.utime(c.entry_path('a' * 40), (1000, 1000))
+        c.put('b' * 40, {'Module1': 'y' * 100})
+        self.assertEqual([key for key, _, _, _ in c.entries()], ['b' * 40])
+
+    def test_put_walks_entries_only_when_full(self):
+        c = cache.Cache(path=self.temp_dir, max_size=1000)
+        c.put('a' * 40, {'Module1': 'x' * 100})
+        with patch.object(c, 'entries', wraps=c.entries) as mock_entries:
+            for i in range(5):
+                c.put(str(i) * 40, {'Module1': 'x' * 100})
+            mock_entries.assert_not_called()
+            for i in range(5, 9):
+                c.put(str(i) * 40, {'Module1': 'x' * 100})
+            self.assertEqual(mock_entries.call_count, 1)
+        # pruned to 90% of the limit, two entries were evicted and the next one fits again
+        self.assertEqual(len(c.entries()), 8)
+        with open(os.path.join(c.path, cache.SIZE_FILE)) as f:
+            self.assertEqual(int(f.read()), c.size())
+
+    def test_clear(self):
+        c = cache.Cache(path=self.temp_dir, max_size=1024 * 1024)
+        c.put('a' * 40, {'Module1': ''})
+        c.put('b' * 40, {'Module1': ''})
+        self.assertEqual(c.clear(), 2)
+        self.assertEqual(c.size(), 0)
+
+    def test_corrupt_entry_is_a_miss(self):
+        c = cache.Cache(path=self.temp_dir, max_size=1024 * 1024)
+        path = c.entry_path('a' * 40)
+        os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write('{not json')
+        self.assertIsNone(c.get('a' * 40))
+
+
+if __name__ == '__main__':
+    unittest.main()
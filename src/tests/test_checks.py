@@ -0,0 +1,160 @@
+import unittest
+import sys
+import os
+import subprocess
+from io import StringIO
+from unittest.mock import patch
+
+# Add src directory to path for importing modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import cli
+import diff
+import checks
+import synthetic
+from cache import Cache
+from test_batch import RepositoryTestCase
+
+MODULE1 = """Option Explicit
+
+Public Sub Report()
+    Stop
+    MsgBox "Report"
+End Sub"""
+
+MODULE2 = """Public Sub Run()
+    Debug.Print "Run"
+    Stop ' until it works
+End Sub"""
+
+
+class TestRules(unittest.TestCase):
+    """Test the built-in and configured rules"""
+
+    def test_option_explicit(self):
+        rule = checks.RULES['option-explicit']
+        self.assertEqual(rule(MODULE1.split('\n')), [])
+        self.assertEqual(rule(MODULE2.split('\n')), [(1, 'Option Explicit is missing')])
+        # after the first procedure it does not count, empty modules need none
+        self.assertEqual(rule(['Sub A()', 'End Sub', 'Option Explicit']), [(1, 'Option Explicit is missing')])
+        self.assertEqual(rule(['', '']), [])
+
+    def test_line_rules(self):
+        self.assertEqual(checks.RULES['stop'](MODULE2.split('\n')), [(3, 'Stop statement')])
+        self.assertEqual(checks.RULES['stop'](['    StopWatch.Start', "    ' Stop here"]), [])
+        self.assertEqual(checks.RULES['debug-print'](MODULE2.split('\n')), [(2, 'Debug.Print statement')])
+
+    @patch('diff.get_git_config', return_value={'diff.xl.rule.no-msgbox': r'\bMsgBox\b'})
+    def test_get_rules(self, mock_get_git_config):
+        self.assertEqual(list(checks.get_rules()), ['option-explicit', 'stop', 'no-msgbox'])
+        self.assertEqual(list(checks.get_rules('stop, debug-print')), ['stop', 'debug-print'])
+        self.assertEqual(checks.get_rules('no-msgbox')['no-msgbox'](MODULE1.split('\n')), [(5, 'matches no-msgbox')])
+        with self.assertRaisesRegex(ValueError, 'unknown rule "stops"'):
+            checks.get_rules('stops')
+        mock_get_git_config.return_value = {'diff.xl.checks': 'debug-assert'}
+        self.assertEqual(list(checks.get_rules()), ['debug-assert'])
+        mock_get_git_config.return_value = {'diff.xl.rule.broken': '(('}
+        with self.assertRaisesRegex(ValueError, 'invalid pattern for rule "broken"'):
+            checks.get_rules()
+
+
+class TestCheckStaged(RepositoryTestCase):
+    """Test checking the staged workbooks"""
+
+    def create_history(self):
+        self.commit({'Book1.xlsm': {'Module1': MODULE1}}, 'first')
+
+    def stage(self, workbooks, **kwargs):
+        for name, modules in workbooks.items():
+            synthetic.write_workbook(os.path.join(self.repository, name), modules, **kwargs)
+        self.git('add', '-A')
+
+    def check(self, *args):
+        return checks.check_staged(*args, rules=checks.get_rules(), cache=Cache(max_size=0), cwd=self.repository)
+
+    def test_only_changed_modules_are_checked(self):
+        self.stage({'Book1.xlsm': {'Module1': MODULE1, 'Module2': MODULE2}, 'Book2.xlsb': {'Module1': MODULE1}})
+        self.assertEqual([checks.format_problem(problem) for problem in self.check()], [
+            'Book1.xlsm/VBA/Module2:1: Option Explicit is missing (option-explicit)',
+            'Book1.xlsm/VBA/Module2:3: Stop statement (stop)',
+            # a new workbook, all of its modules are new
+            'Book2.xlsb/VBA/Module1:4: Stop statement (stop)'])
+        self.assertEqual([problem.workbook for problem in self.check(['Book2.xlsb'])], ['Book2.xlsb'])
+
+    @patch('diff.get_vba_all')
+    def test_unchanged_vba_project_is_skipped(self, mock_get_vba_all):
+        # only the sheet changes
+        self.stage({'Book1.xlsm': {'Module1': MODULE1}}, payload_size=1000)
+        self.assertNotEqual(self.git('diff', '--cached', '--name-only'), b'')
+        self.assertEqual(self.check(), [])
+        mock_get_vba_all.assert_not_called()
+
+    def test_nothing_staged(self):
+        self.assertEqual(self.check(), [])
+
+    def test_cached_blobs_are_not_read(self):
+        self.stage({'Book1.xlsm': {'Module1': MODULE1, 'Module2': MODULE2}})
+        cache = Cache(path=os.path.join(self.temp_dir, 'check-cache'), max_size=10 ** 8)
+        checks.check_staged(rules=checks.get_rules(), cache=cache, cwd=self.repository)
+        with patch('plumbing.CatFile.write') as mock_write:
+            problems = checks.check_staged(rules=checks.get_rules(), cache=cache, cwd=self.repository)
+        mock_write.assert_not_called()
+        self.assertEqual(len(problems), 2)
+        # pruned by another process after the blobs were found in the cache
+        with patch.object(cache, 'get', return_value=None):
+            self.assertEqual(checks.check_staged(rules=checks.get_rules(), cache=cache, cwd=self.repository),
+                             problems)
+
+
+class TestHook(RepositoryTestCase):
+    """Test the pre-commit hook stops commits with problems"""
+
+    def create_history(self):
+        self.commit({'Book1.xlsm': {'Module1': MODULE1}}, 'first')
+
+    def test_hook(self):
+        hook = os.path.join(self.repository, '.git', 'hooks', 'pre-commit')
+        self.assertEqual(checks.install_hook(cli.get_git_xl_command(), cwd=self.repository), hook)
+        synthetic.write_workbook(os.path.join(self.repository, 'Book1.xlsm'), {'Module1': MODULE1, 'Module2': MODULE2})
+        self.git('add', '-A')
+        commit = subprocess.run(['git', 'commit', '-q', '-m', 'second'], cwd=self.repository, env=self.env,
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        self.assertEqual(commit.returncode, 1)
+        # git shows the output of hooks on stderr
+        self.assertIn(b'Book1.xlsm/VBA/Module2:3: Stop statement (stop)', commit.stderr)
+        self.git('commit', '-q', '--no-verify', '-m', 'second')
+
+        self.assertEqual(checks.uninstall_hook(cwd=self.repository), hook)
+        self.assertFalse(os.path.exists(hook))
+        self.assertIsNone(checks.uninstall_hook(cwd=self.repository))
+
+    def test_other_hooks_are_kept(self):
+        hook = os.path.join(self.repository, '.git', 'hooks', 'pre-commit')
+        with open(hook, 'w') as f:
+            f.write('#!/bin/sh\nexit 0\n')
+        with self.assertRaisesRegex(ValueError, 'already exists'):
+            checks.install_hook(cli.get_git_xl_command(), cwd=self.repository)
+        self.assertIsNone(checks.uninstall_hook(cwd=self.repository))
+        checks.install_hook(cli.get_git_xl_command(), force=True, cwd=self.repository)
+        self.assertTrue(checks.is_own_hook(hook))
+
+    @patch('sys.stdout', new_callable=StringIO)
+    def test_check_command(self, mock_stdout):
+        os.chdir(self.repository)
+        try:
+            cli.CommandParser(['check', '--staged']).execute()
+            synthetic.write_workbook(os.path.join(self.repository, 'Book1.xlsm'), {'Module2': MODULE2})
+            self.git('add', '-A')
+            with self.assertRaises(SystemExit) as context:
+                cli.CommandParser(['check', '--staged', '--rules=debug-print']).execute()
+            self.assertEqual(context.exception.code, 1)
+            cli.CommandParser(['check']).execute()
+        finally:
+            os.chdir(os.path.dirname(os.path.abspath(__file__)))
+        output = mock_stdout.getvalue()
+        self.assertIn('Book1.xlsm/VBA/Module2:2: Debug.Print statement (debug-print)\n1 problems found', output)
+        self.assertIn('Usage: git xl check --staged', output)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,5 @@
 import cli
+import cache
 from io import StringIO
 from unittest import TestCase, mock
 from unittest.mock import call
@@ -65,6 +66,24 @@ class TestLocalInstaller(TestCase):
         mock_file_open.assert_any_call(gitignore_path, 'r')
         mock_file_open.assert_any_call(gitignore_path, 'w')
 
+    @mock.patch('cli.subprocess.run')
+    @mock.patch('cli.is_frozen', return_value=False)
+    @mock.patch('cli.is_git_repository', return_value=True)
+    @mock.patch('cli.os.path.exists', return_value=False)
+    @mock.patch('builtins.open', new_callable=mock.mock_open)
+    def test_can_install_textconv(self, mock_file_open, mock_path_exists, mock_is_git_repository, mock_is_frozen,
+                                  mock_run):
+        test_path = os.path.join('path', 'to', 'repository')
+        mock_run.return_value.stdout = 'file:.git/config\0diff.xl.command\ngit-xl-diff\0'
+        installer = cli.Installer(mode='local', path=test_path)
+        installer.install(textconv=True)
+
+        commands = [c[0][0] for c in mock_run.call_args_list]
+        self.assertIn(['git', 'config', '--unset', 'diff.xl.command'], commands)
+        self.assertIn(['git', 'config', 'diff.xl.textconv', installer.GIT_XL_TEXTCONV], commands)
+        self.assertIn(['git', 'config', 'diff.xl.cachetextconv', 'true'], commands)
+        self.assertTrue(installer.GIT_XL_TEXTCONV.endswith('cli.py textconv'))
+
     @mock.patch('cli.subprocess.run')
     @mock.patch('cli.is_git_repository', return_value=True)
     @mock.patch('cli.os.path.exists', return_value=False)
@@ -74,19 +93,19 @@ class TestLocalInstaller(TestCase):
         test_path = os.path.join('path', 'to', 'repository')
         installer = cli.Installer(mode='local', path=test_path)
         installer.uninstall()
-        mock_run.assert_called_once_with(['git', 'config', '--list'], cwd=test_path, stderr=-1, stdout=-1, universal_newlines=True, encoding='utf-8')
+        mock_run.assert_called_once_with(['git', 'config', '--local', '--list', '--show-origin', '-z'], cwd=test_path, stderr=-1, stdout=-1, universal_newlines=True, encoding='utf-8')
         mock_os_remove.assert_has_calls([])
 
     @mock.patch('cli.subprocess.run')
     @mock.patch('cli.is_git_repository', return_value=True)
     @mock.patch('cli.os.path.exists', return_value=True)
     @mock.patch('cli.os.remove')
-    @mock.patch('builtins.open', new_callable=mock.mock_open, read_data='something')
+    @mock.patch('builtins.open', new_callable=mock.mock_open, read_data='something\n*.xlsm diff=xl\n~$*.xlsm')
     def test_can_uninstall_when_files_exist(self, mock_file_open, mock_os_remove,  mock_path_exists, mock_is_git_repository, mock_run):
         test_path = os.path.join('path', 'to', 'repository')
         installer = cli.Installer(mode='local', path=test_path)
         installer.uninstall()
-        mock_run.assert_called_once_with(['git', 'config', '--list'], cwd=test_path, stderr=-1, stdout=-1, universal_newlines=True, encoding='utf-8')
+        mock_run.assert_called_once_with(['git', 'config', '--local', '--list', '--show-origin', '-z'], cwd=test_path, stderr=-1, stdout=-1, universal_newlines=True, encoding='utf-8')
         self.assertEqual(mock_os_remove.call_count, 0)
         
         gitattributes_path = os.path.join(test_path, '.gitattributes')
@@ -107,23 +126,70 @@ class TestGlobalInstaller(TestCase):
     @mock.patch('cli.Installer.get_git_attributes_path')
     @mock.patch('cli.Installer.get_git_ignore_path')
     def test_global_gitconfig_dir(self, mock_get_git_ignore_path, mock_get_git_attributes_path, mock_run):
+        home = os.path.join(os.sep, 'home', 'user')
+        mock_run.return_value.stdout = f'file:{home}/.gitconfig\0user.name\nUser\0'
         installer = cli.Installer(mode='global')
-        self.assertEqual(mock_run.call_count, 2)
-        mock_run.assert_has_calls([
-            mock.call(['git', 'config', '--global', '--list', '--show-origin'], cwd=None, stderr=-1, stdout=-1, universal_newlines=True, encoding='utf-8'),
-            mock.call(['git', 'config', '--global', '--list'], cwd=None, stderr=-1, stdout=-1, universal_newlines=True, encoding='utf-8')
-        ])
+        mock_run.assert_called_once_with(['git', 'config', '--global', '--list', '--show-origin', '-z'], cwd=None, stderr=-1, stdout=-1, universal_newlines=True, encoding='utf-8')
+        self.assertEqual(installer.git_global_config_dir, home)
+
+    @mock.patch('cli.subprocess.run')
+    @mock.patch('cli.Installer.get_git_attributes_path')
+    @mock.patch('cli.Installer.get_git_ignore_path')
+    def test_global_gitconfig_dir_without_global_config(self, mock_get_git_ignore_path, mock_get_git_attributes_path,
+                                                       mock_run):
+        mock_run.return_value.stdout = ''
+        installer = cli.Installer(mode='global')
+        self.assertEqual(installer.git_global_config_dir, os.path.expanduser('~'))
 
     @mock.patch('cli.subprocess.run')
     @mock.patch('cli.Installer.get_global_gitconfig_dir')
     @mock.patch('cli.Installer.get_git_ignore_path')
     def test_global_gitattributes_path(self, mock_get_git_ignore_path, get_global_gitconfig_dir, mock_run):
         mock_completed_process = mock.Mock()
-        mock_completed_process.configure_mock(**{'stdout': '.gitconfig'})
+        mock_completed_process.configure_mock(**{'stdout': 'file:.gitconfig\0core.attributesfile\n~/.gitattributes\0'})
         mock_run.return_value = mock_completed_process
         installer = cli.Installer(mode='global')
         self.assertEqual(mock_run.call_count, 1)
-        mock_run.assert_called_once_with(['git', 'config', '--global', '--get', 'core.attributesfile'], cwd=None, stderr=-1, stdout=-1, universal_newlines=True, encoding='utf-8')
+        self.assertEqual(installer.git_attributes_path, os.path.expanduser('~/.gitattributes'))
+
+    @mock.patch('cli.subprocess.run')
+    @mock.patch('cli.os.path.exists', return_value=False)
+    @mock.patch('builtins.open', new_callable=mock.mock_open)
+    def test_install_only_writes_changes(self, mock_file_open, mock_path_exists, mock_run):
+        home = os.path.join(os.sep, 'home', 'user')
+        mock_run.return_value.stdout = f'file:{home}/.gitconfig\0user.name\nUser\0'
+        installer = cli.Installer(mode='global')
+        installer.install()
+        commands = [c[0][0] for c in mock_run.call_args_list]
+        self.assertEqual(commands, [
+            ['git', 'config', '--global', '--list', '--show-origin', '-z'],
+            ['git', 'config', '--global', 'diff.xl.command', installer.GIT_XL_DIFF],
+            ['git', 'config', '--global', 'core.attributesfile', os.path.join(home, '.gitattributes')],
+            ['git', 'config', '--global', 'core.excludesfile', os.path.join(home, '.gitignore')],
+        ])
+
+        # installing again finds everything in place
+        mock_run.reset_mock()
+        mock_run.return_value.stdout = '\0'.join([
+            f'file:{home}/.gitconfig', 'diff.xl.command\n' + installer.GIT_XL_DIFF,
+            f'file:{home}/.gitconfig', 'core.attributesfile\n' + os.path.join(home, '.gitattributes'),
+            f'file:{home}/.gitconfig', 'core.excludesfile\n' + os.path.join(home, '.gitignore'), ''])
+        cli.Installer(mode='global').install()
+        self.assertEqual(mock_run.call_count, 1)
+
+    @mock.patch('cli.subprocess.run')
+    @mock.patch('cli.os.path.exists', return_value=False)
+    @mock.patch('cli.os.remove')
+    def test_uninstall_only_writes_changes(self, mock_os_remove, mock_path_exists, mock_run):
+        mock_run.return_value.stdout = 'file:/home/user/.gitconfig\0diff.xl.command\ngit-xl-diff\0' \
+                                       'file:/home/user/.gitconfig\0core.attributesfile\n/home/user/.gitattributes\0'
+        cli.Installer(mode='global').uninstall()
+        commands = [c[0][0] for c in mock_run.call_args_list]
+        self.assertEqual(commands, [
+            ['git', 'config', '--global', '--list', '--show-origin', '-z'],
+            ['git', 'config', '--global', '--remove-section', 'diff.xl'],
+            ['git', 'config', '--global', '--unset', 'core.attributesfile'],
+        ])
 
 
 class TestHelp(TestCase):
@@ -161,6 +227,13 @@ class TestCommandParser(TestCase):
         command_parser.execute()
         self.assertTrue(mock_stdout.getvalue())
 
+    @mock.patch('cli.is_git_repository', return_value=True)
+    @mock.patch('sys.stdout', new_callable=StringIO)
+    def test_env_checks_repository_once(self, mock_stdout, mock_is_git_repository):
+        cli.CommandParser(['env']).execute()
+        mock_is_git_repository.assert_called_once_with(os.getcwd())
+        self.assertIn('LocalGitIgnore=' + os.path.join(os.getcwd(), '.gitignore'), mock_stdout.getvalue())
+
     @mock.patch('sys.stdout', new_callable=StringIO)
     def test_unknown_command(self, mock_stdout):
         command_parser = cli.CommandParser(['unknown_command'])
@@ -192,6 +265,24 @@ class TestCommandParser(TestCase):
             mock_installer_class.assert_called_once_with(mode='global')
             mock_installer.install.assert_called_once()
 
+    @mock.patch('sys.stdout', new_callable=StringIO)
+    def test_install_command_textconv(self, mock_stdout):
+        with mock.patch('cli.Installer') as mock_installer_class:
+            mock_installer = mock.Mock()
+            mock_installer_class.return_value = mock_installer
+
+            command_parser = cli.CommandParser(['install', '--local', '--textconv'])
+            command_parser.execute()
+
+            mock_installer_class.assert_called_once_with(mode='local', path=os.getcwd())
+            mock_installer.install.assert_called_once_with(textconv=True)
+
+    @mock.patch('sys.stdout', new_callable=StringIO)
+    def test_textconv_command(self, mock_stdout):
+        with mock.patch('diff.print_textconv') as mock_print_textconv:
+            cli.CommandParser(['textconv', 'Book1.xlsb']).execute()
+            mock_print_textconv.assert_called_once_with('Book1.xlsb')
+
     @mock.patch('sys.stdout', new_callable=StringIO)
     def test_uninstall_command_local(self, mock_stdout):
         with mock.patch('cli.Installer') as mock_installer_class:
@@ -217,6 +308,126 @@ class TestCommandParser(TestCase):
             mock_installer.uninstall.assert_called_once()
 
 
+class TestCacheCommand(TestCase):
+
+    def setUp(self):
+        import tempfile
+        self.temp_dir = tempfile.mkdtemp()
+        self.env = mock.patch.dict(os.environ, {'GIT_XL_CACHE_DIR': self.temp_dir})
+        self.env.start()
+
+    def tearDown(self):
+        import shutil
+        self.env.stop()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    @mock.patch('sys.stdout', new_callable=StringIO)
+    def test_cache_info(self, mock_stdout):
+        cache.Cache().put('a' * 40, {'Module1': 'Sub Test()\nEnd Sub'})
+        cli.CommandParser(['cache']).execute()
+        output = mock_stdout.getvalue()
+        self.assertIn('CacheDir=' + cache.Cache().path, output)
+        self.assertTrue(cache.Cache().path.startswith(self.temp_dir))
+        self.assertIn('Entries=1', output)
+
+    @mock.patch('sys.stdout', new_callable=StringIO)
+    def test_cache_prune_and_clear(self, mock_stdout):
+        cache.Cache().put('a' * 40, {'Module1': ''})
+        cli.CommandParser(['cache', 'prune']).execute()
+        self.assertIn('Removed 0 cache entries', mock_stdout.getvalue())
+        cli.CommandParser(['cache', 'prune', '--max-size=0']).execute()
+        self.assertIn('Removed 1 cache entries', mock_stdout.getvalue())
+        cli.CommandParser(['cache', 'clear']).execute()
+        self.assertEqual(cache.Cache().entries(), [])
+
+    @mock.patch('sys.stdout', new_callable=StringIO)
+    def test_cache_invalid_option(self, mock_stdout):
+        cli.CommandParser(['cache', 'purge']).execute()
+        self.assertIn('Invalid option "purge"', mock_stdout.getvalue())
+
+
+class TestDaemonCommand(TestCase):
+
+    @mock.patch('cli.daemon.ping', return_value=False)
+    @mock.patch('sys.stdout', new_callable=StringIO)
+    def test_daemon_status_not_running(self, mock_stdout, mock_ping):
+        cli.CommandParser(['daemon']).execute()
+        if cli.daemon.is_supported():
+            self.assertIn('git xl daemon is not running', mock_stdout.getvalue())
+
+    @mock.patch('cli.daemon.ping', return_value=True)
+    @mock.patch('cli.subprocess.Popen')
+    @mock.patch('sys.stdout', new_callable=StringIO)
+    def test_daemon_start_when_running(self, mock_stdout, mock_popen, mock_ping):
+        cli.CommandParser(['daemon', 'start']).execute()
+        mock_popen.assert_not_called()
+
+    @mock.patch('sys.stdout', new_callable=StringIO)
+    def test_daemon_invalid_option(self, mock_stdout):
+        cli.CommandParser(['daemon', 'restart']).execute()
+        if cli.daemon.is_supported():
+            self.assertIn('Invalid option "restart"', mock_stdout.getvalue())
+
+
+class TestRecursiveInstall(TestCase):
+    """Test installing into all repositories below a directory"""
+
+    def setUp(self):
+        import tempfile
+        import subprocess
+        self.temp_dir = tempfile.mkdtemp()
+        self.repositories = [os.path.join(self.temp_dir, name) for name in ('a', os.path.join('team', 'b'))]
+        for path in self.repositories + [os.path.join(self.repositories[0], 'nested')]:
+            os.makedirs(path)
+            subprocess.run(['git', 'init', '-q', path], check=True)
+        os.makedirs(os.path.join(self.temp_dir, 'not-a-repository'))
+        # a .git file that points nowhere
+        self.broken = os.path.join(self.temp_dir, 'broken')
+        os.makedirs(self.broken)
+        with open(os.path.join(self.broken, '.git'), 'w') as f:
+            f.write('gitdir: missing')
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_find_repositories(self):
+        self.assertEqual(cli.find_repositories(self.temp_dir),
+                         [self.temp_dir + os.sep + 'a', self.broken, self.repositories[1]])
+
+    @mock.patch('sys.stdout', new_callable=StringIO)
+    def test_install_uninstall_verify(self, mock_stdout):
+        cli.CommandParser(['install', '--local', '--recursive', self.temp_dir]).execute()
+        output = mock_stdout.getvalue()
+        self.assertIn(f'Error: {self.broken}: not a Git repository', output)
+        self.assertIn(f'Installed 2 of 3 repositories under {self.temp_dir}, 1 failed', output)
+        for path in self.repositories:
+            installer = cli.Installer(mode='local', path=path)
+            self.assertEqual(installer.verify(), [])
+            self.assertEqual(installer.get_config()['diff.xl.command'], installer.GIT_XL_DIFF)
+
+        os.remove(os.path.join(self.repositories[1], '.gitignore'))
+        cli.CommandParser(['verify', '--recursive', self.temp_dir]).execute()
+        output = mock_stdout.getvalue()
+        self.assertIn(f'Not installed: {self.repositories[1]} (missing .gitignore)', output)
+        self.assertIn(f'Verified 1 of 3 repositories under {self.temp_dir}, 1 failed, 1 without Git xl', output)
+
+        cli.CommandParser(['uninstall', '--local', '--recursive', self.temp_dir]).execute()
+        self.assertIn(f'Uninstalled 2 of 3 repositories under {self.temp_dir}, 1 failed', mock_stdout.getvalue())
+        self.assertEqual(cli.Installer(mode='local', path=self.repositories[0]).verify(),
+                         ['diff.xl.command', '.gitattributes', '.gitignore'])
+
+    @mock.patch('sys.stdout', new_callable=StringIO)
+    def test_invalid_options(self, mock_stdout):
+        cli.CommandParser(['install', 'somewhere']).execute()
+        cli.CommandParser(['uninstall', '--recursive', 'a', 'b']).execute()
+        cli.CommandParser(['install', '--recursive', os.path.join(self.temp_dir, 'missing')]).execute()
+        output = mock_stdout.getvalue()
+        self.assertIn('Invalid option "somewhere" for "git-xl install"', output)
+        self.assertIn('Invalid option "b" for "git-xl uninstall"', output)
+        self.assertIn('is not a directory', output)
+
+
 class TestInstallerValidation(TestCase):
     """Test installer validation logic"""
 
@@ -0,0 +1,64 @@
+import unittest
+import sys
+import os
+import struct
+
+# Add src directory to path for importing modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import compound
+
+
+class TestCompoundFile(unittest.TestCase):
+    """Test reading compound files written by compound_file"""
+
+    def test_round_trip(self):
+        """Test mini streams, regular streams and nested storages read back as written"""
+        streams = {
+            'Workbook': os.urandom(compound.MINI_STREAM_CUTOFF * 3 + 1),
+            'Empty': b'',
+            '_VBA_PROJECT_CUR/PROJECT': b'Name="VBAProject"',
+            '_VBA_PROJECT_CUR/VBA/dir': os.urandom(compound.MINI_STREAM_CUTOFF - 1),
+            '_VBA_PROJECT_CUR/VBA/Module1': os.urandom(compound.MINI_STREAM_CUTOFF),
+        }
+        container = compound.CompoundFile(compound.compound_file(streams))
+        self.assertEqual(container.read_storage(container.entries[0]), streams)
+        storage = container.find('_vba_project_cur')
+        self.assertEqual(storage.type, compound.STORAGE)
+        self.assertEqual(container.read_stream(container.find('_VBA_PROJECT_CUR/VBA/dir')),
+                         streams['_VBA_PROJECT_CUR/VBA/dir'])
+        self.assertIsNone(container.find('_VBA_PROJECT_CUR/VBA/Module2'))
+        self.assertIsNone(container.find('Macros/VBA'))
+
+    def test_fat_beyond_the_header(self):
+        """Test FAT sectors listed in DIFAT sectors are found"""
+        # more than 109 FAT sectors, so some are only listed in the DIFAT chain
+        size = (compound.HEADER_DIFAT_ENTRIES + 20) * compound.FAT_ENTRIES_PER_SECTOR * compound.SECTOR_SIZE
+        streams = {'Workbook': os.urandom(size), 'Module1': b'Sub A()'}
+        data = compound.compound_file(streams)
+        self.assertNotEqual(struct.unpack_from('<I', data, 0x44)[0], compound.ENDOFCHAIN)
+        container = compound.CompoundFile(data)
+        self.assertEqual(container.read_storage(container.entries[0]), streams)
+
+    def test_broken_files(self):
+        """Test malformed containers raise FormatError instead of hanging or reading garbage"""
+        data = bytearray(compound.compound_file({'Workbook': b'\1' * 10000}))
+        with self.assertRaises(compound.FormatError):
+            compound.CompoundFile(b'PK\3\4' + bytes(1000))
+        with self.assertRaises(compound.FormatError):
+            compound.CompoundFile(data[:600])
+        with self.assertRaises(compound.FormatError):
+            compound.CompoundFile(data[:4000])
+        container = compound.CompoundFile(data)
+        with self.assertRaises(compound.FormatError):
+            container.read_stream(container.find('Workbook')._replace(size=20000))
+        # a chain that loops back to its first sector
+        start = compound.CompoundFile(data).find('Workbook').start
+        fat_sector = struct.unpack_from('<I', data, 0x4C)[0]
+        struct.pack_into('<I', data, (fat_sector + 1) * compound.SECTOR_SIZE + (start + 19) * 4, start)
+        container = compound.CompoundFile(data)
+        with self.assertRaises(compound.FormatError):
+            container.read_chain(start)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import unittest
+import sys
+import os
+import shutil
+import tempfile
+import threading
+from unittest import mock
+from unittest.mock import patch
+from io import BytesIO, TextIOWrapper
+
+# Add src directory to path for importing modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import daemon
+import diff
+
+
+class TestClientHelpers(unittest.TestCase):
+    """Test client side helpers"""
+
+    def test_resolve_args_7(self):
+        args = ['Book1.xlsb', '/tmp/old.xlsb', 'a' * 40, '100644', 'Book1.xlsb', 'b' * 40, '100644']
+        resolved = daemon.resolve_args(args)
+        self.assertEqual(resolved[1], '/tmp/old.xlsb')
+        self.assertEqual(resolved[4], os.path.abspath('Book1.xlsb'))
+        self.assertEqual(resolved[0], 'Book1.xlsb')
+
+    def test_resolve_args_8(self):
+        args = ['5', 'Book1.xlsb', 'nul', '.', '.', 'Book1.xlsb', 'b' * 40, '100644']
+        resolved = daemon.resolve_args(args)
+        self.assertEqual(resolved[2], 'nul')
+        self.assertEqual(resolved[5], os.path.abspath('Book1.xlsb'))
+
+    def test_resolve_args_with_options(self):
+        args = ['--diff-algorithm=myers', 'Book1.xlsb', '/dev/null', '.', '.', 'Book1.xlsb', 'b' * 40, '100644']
+        resolved = daemon.resolve_args(args)
+        self.assertEqual(resolved[0], '--diff-algorithm=myers')
+        self.assertEqual(resolved[5], os.path.abspath('Book1.xlsb'))
+
+    @patch.dict(os.environ, {'GIT_XL_DAEMON_SOCKET': '/nonexistent/daemon.sock'})
+    def test_client_falls_back_without_daemon(self):
+        args = ['Book1.xlsb', '/dev/null', '.', '.', 'Book1.xlsb', '.', '100644']
+        self.assertFalse(daemon.run_client(args))
+        self.assertFalse(daemon.ping())
+
+    def test_client_ignores_invalid_args(self):
+        self.assertFalse(daemon.run_client(['only', 'three', 'args']))
+
+
+class TestMemoryCache(unittest.TestCase):
+    """Test the in-memory layer of the daemon cache"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.env = patch.dict(os.environ, {'GIT_XL_CACHE_DIR': self.temp_dir})
+        self.env.start()
+
+    def tearDown(self):
+        self.env.stop()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_entries_are_bounded(self):
+        cache = daemon.MemoryCache(max_entries=2)
+        for key in ('a' * 40, 'b' * 40, 'c' * 40):
+            cache.put(key, {'Module1': key})
+        self.assertEqual(list(cache.memory), ['b' * 40, 'c' * 40])
+        # evicted entries are still served from disk
+        self.assertEqual(cache.get('a' * 40), {'Module1': 'a' * 40})
+        self.assertEqual(list(cache.memory), ['c' * 40, 'a' * 40])
+
+
+@unittest.skipUnless(daemon.is_supported(), 'Unix domain sockets are not available')
+class TestDaemon(unittest.TestCase):
+    """Test diffs served by a running daemon"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.env = patch.dict(os.environ, {
+            'GIT_XL_CACHE_DIR': self.temp_dir,
+            'GIT_XL_DAEMON_SOCKET': os.path.join(self.temp_dir, 'daemon.sock'),
+        })
+        self.env.start()
+        self.thread = threading.Thread(target=daemon.serve, kwargs={'idle_timeout': 0})
+        self.thread.start()
+        for _ in range(100):
+            if daemon.ping():
+                break
+            threading.Event().wait(0.05)
+        self.workbook = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Book1.xlsb')
+
+    def tearDown(self):
+        daemon.stop()
+        self.thread.join(timeout=10)
+        self.env.stop()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_daemon_output_matches_in_process_diff(self):
+        args = ['Book1.xlsb', '/dev/null', '.', '.', self.workbook, '.', '100644']
+        expected = BytesIO()
+        diff.main(args, out=expected, cache=diff.Cache(max_size=0))
+        stdout = TextIOWrapper(BytesIO())
+        with patch('sys.stdout', stdout):
+            self.assertTrue(daemon.run_client(args))
+        self.assertEqual(stdout.buffer.getvalue(), expected.getvalue())
+
+    def test_daemon_already_running(self):
+        with self.assertRaises(RuntimeError):
+            daemon.serve()
+
+    def test_stop_removes_socket(self):
+        self.assertTrue(daemon.stop())
+        self.thread.join(timeout=10)
+        self.assertFalse(os.path.exists(daemon.get_socket_path()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,9 +1,10 @@
 import unittest
 import sys
 import os
+import subprocess
 from unittest import mock
 from unittest.mock import patch, MagicMock, mock_open
-from io import StringIO
+from io import StringIO, BytesIO
 
 # Add src directory to path for importing diff module
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -114,6 +115,253 @@ class TestGetVBA(unittest.TestCase):
         self.assertEqual(result, expected)
 
 
+class TestGetVBAProject(unittest.TestCase):
+    """Test the OOXML fast path"""
+
+    def setUp(self):
+        import tempfile
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def create_workbook(self, parts):
+        import zipfile
+        path = os.path.join(self.temp_dir, 'Book1.xlsm')
+        with zipfile.ZipFile(path, 'w') as archive:
+            for name, data in parts.items():
+                archive.writestr(name, data)
+        return path
+
+    def test_vba_project_part_is_read(self):
+        """Test only the vbaProject.bin part is returned"""
+        workbook = self.create_workbook({'xl/worksheets/sheet1.xml': b'<worksheet/>', 'xl/vbaProject.bin': b'OLE'})
+        self.assertEqual(diff.get_vba_project(workbook), b'OLE')
+
+    def test_workbook_without_vba_project(self):
+        """Test zip containers without macros yield an empty project"""
+        workbook = self.create_workbook({'xl/worksheets/sheet1.xml': b'<worksheet/>'})
+        self.assertEqual(diff.get_vba_project(workbook), b'')
+
+    def test_non_zip_workbook(self):
+        """Test non-zip workbooks (e.g. xls) are left to VBA_Parser"""
+        workbook = os.path.join(self.temp_dir, 'Book1.xls')
+        with open(workbook, 'wb') as f:
+            f.write(b'\xd0\xcf\x11\xe0')
+        self.assertIsNone(diff.get_vba_project(workbook))
+        self.assertIsNone(diff.get_vba_project(os.path.join(self.temp_dir, 'missing.xls')))
+
+    @patch('diff.VBA_Parser')
+    def test_get_vba_skips_parser_without_vba_project(self, mock_vba_parser_class):
+        """Test VBA_Parser is never invoked for workbooks without macros"""
+        workbook = self.create_workbook({'xl/worksheets/sheet1.xml': b'<worksheet/>'})
+        self.assertEqual(diff.get_vba(workbook), {})
+        mock_vba_parser_class.assert_not_called()
+
+    @patch('diff.VBA_Parser')
+    def test_get_vba_parses_vba_project_only(self, mock_vba_parser_class):
+        """Test VBA_Parser receives the vbaProject.bin buffer"""
+        mock_vba_parser_class.return_value.detect_vba_macros.return_value = False
+        workbook = self.create_workbook({'xl/vbaProject.bin': b'OLE'})
+        diff.get_vba(workbook)
+        mock_vba_parser_class.assert_called_once_with(workbook, data=b'OLE')
+
+    def test_vba_project_entry(self):
+        """Test the CRC and size of the VBA project are compared without extracting it"""
+        import zlib
+        workbook = self.create_workbook({'xl/vbaProject.bin': b'OLE'})
+        self.assertEqual(diff.get_vba_project_entry(workbook), (zlib.crc32(b'OLE'), 3))
+        os.rename(workbook, os.path.join(self.temp_dir, 'Book2.xlsm'))
+        other = os.path.join(self.temp_dir, 'Book2.xlsm')
+        workbook = self.create_workbook({'xl/worksheets/sheet1.xml': b'<worksheet/>', 'xl/vbaProject.bin': b'OLE'})
+        self.assertTrue(diff.is_vba_project_unchanged(workbook, other))
+        self.assertFalse(diff.is_vba_project_unchanged(workbook, None))
+        workbook = self.create_workbook({'xl/vbaProject.bin': b'OLE2'})
+        self.assertFalse(diff.is_vba_project_unchanged(workbook, other))
+        workbook = self.create_workbook({'xl/worksheets/sheet1.xml': b'<worksheet/>'})
+        self.assertEqual(diff.get_vba_project_entry(workbook), ())
+        self.assertFalse(diff.is_vba_project_unchanged(workbook, other))
+        xls = os.path.join(self.temp_dir, 'Book1.xls')
+        with open(xls, 'wb') as f:
+            f.write(b'\xd0\xcf\x11\xe0')
+        self.assertIsNone(diff.get_vba_project_entry(xls))
+        self.assertFalse(diff.is_vba_project_unchanged(xls, xls))
+
+
+class TestGetOLEVBAProject(unittest.TestCase):
+    """Test the xls fast path"""
+
+    def setUp(self):
+        import tempfile
+        self.temp_dir = tempfile.mkdtemp()
+        self.vba_streams = {'PROJECT': b'ID="{0}"\r\n' * 50, 'VBA/dir': b'\x01' * 300, 'VBA/Module1': b'\x02' * 5000}
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def create_workbook(self, streams):
+        import compound
+        path = os.path.join(self.temp_dir, 'Book1.xls')
+        with open(path, 'wb') as f:
+            f.write(compound.compound_file(streams))
+        return path
+
+    def test_vba_project_storage_is_copied(self):
+        """Test the streams of _VBA_PROJECT_CUR end up at the root of a container of their own"""
+        import compound
+        streams = {'Workbook': os.urandom(100000)}
+        streams.update({'_VBA_PROJECT_CUR/' + path: data for path, data in self.vba_streams.items()})
+        vba_project = diff.map_vba_project(self.create_workbook(streams))
+        self.assertLess(len(vba_project), 20000)
+        container = compound.CompoundFile(vba_project)
+        self.assertEqual(container.read_storage(container.entries[0]), self.vba_streams)
+
+    def test_workbook_without_vba_project(self):
+        """Test xls workbooks without macros yield an empty project"""
+        self.assertEqual(diff.map_vba_project(self.create_workbook({'Workbook': b'\0' * 5000})), b'')
+
+    def test_other_files_are_left_to_vba_parser(self):
+        """Test other compound files, other and broken files are left to VBA_Parser"""
+        self.assertIsNone(diff.map_vba_project(self.create_workbook({'WordDocument': b'\0' * 5000})))
+        path = self.create_workbook({'Workbook': b'\0' * 5000})
+        with open(path, 'r+b') as f:
+            f.truncate(1024)
+        self.assertIsNone(diff.map_vba_project(path))
+        for data in (b'', b'\xd0\xcf\x11\xe0'):
+            with open(path, 'wb') as f:
+                f.write(data)
+            self.assertIsNone(diff.map_vba_project(path))
+        self.assertIsNone(diff.map_vba_project(os.path.join(self.temp_dir, 'missing.xls')))
+
+    @patch('diff.VBA_Parser')
+    def test_get_vba_parses_vba_project_only(self, mock_vba_parser_class):
+        """Test VBA_Parser receives the VBA project, not the workbook, for paths and buffers"""
+        mock_vba_parser_class.return_value.detect_vba_macros.return_value = False
+        streams = {'Workbook': os.urandom(100000)}
+        streams.update({'_VBA_PROJECT_CUR/' + path: data for path, data in self.vba_streams.items()})
+        workbook = self.create_workbook(streams)
+        with open(workbook, 'rb') as f:
+            data = f.read()
+        vba_project = diff.map_vba_project(workbook)
+        diff.get_vba(workbook)
+        diff.get_vba('Book1.xls', bytearray(data))
+        diff.get_vba('Book1.xls', BytesIO(data))
+        self.assertEqual(mock_vba_parser_class.call_args_list, [mock.call(workbook, data=vba_project),
+                                                                mock.call('Book1.xls', data=vba_project),
+                                                                mock.call('Book1.xls', data=vba_project)])
+
+
+class TestGetVBACached(unittest.TestCase):
+    """Test cached VBA extraction"""
+
+    def setUp(self):
+        import tempfile
+        self.temp_dir = tempfile.mkdtemp()
+        self.cache = diff.Cache(path=self.temp_dir, max_size=1024 * 1024)
+        self.workbook = os.path.join(self.temp_dir, 'Book1.xlsm')
+        with open(self.workbook, 'wb') as f:
+            f.write(b'workbook')
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    @patch('diff.iter_vba_modules')
+    def test_second_extraction_is_served_from_cache(self, mock_iter_vba_modules):
+        """Test the same blob is only parsed once"""
+        mock_iter_vba_modules.return_value = [('Module1', 'class', 'Sub Test()\nEnd Sub')]
+        first = diff.get_vba_cached(self.workbook, cache=self.cache)
+        second = diff.get_vba_cached(self.workbook, cache=self.cache)
+        mock_iter_vba_modules.assert_called_once_with(self.workbook, None)
+        self.assertEqual(second['Module1'].source, first['Module1'].source)
+        self.assertEqual(second['Module1'].digest, first['Module1'].digest)
+        self.assertEqual(second['Module1'].line_count, 2)
+        self.assertEqual(second['Module1'].type, 'class')
+
+    @patch('diff.iter_vba_modules')
+    def test_git_object_id_is_used_as_key(self, mock_iter_vba_modules):
+        """Test the blob id passed by git is used instead of hashing the file"""
+        mock_iter_vba_modules.return_value = [('Module1', 'module', '')]
+        with patch('diff.blob_sha') as mock_blob_sha:
+            diff.get_vba_cached(self.workbook, 'a' * 40, cache=self.cache)
+            mock_blob_sha.assert_not_called()
+        self.assertEqual(self.cache.get('a' * 40), {'Module1': ['', diff.get_digest(''), 1, 'module']})
+
+    @patch('diff.iter_vba_modules')
+    def test_null_object_id_hashes_the_file(self, mock_iter_vba_modules):
+        """Test an all-zero blob id falls back to hashing the file content"""
+        mock_iter_vba_modules.return_value = []
+        diff.get_vba_cached(self.workbook, '0' * 40, cache=self.cache)
+        self.assertEqual(self.cache.get(diff.blob_sha(self.workbook)), {})
+
+    @patch('diff.iter_vba_modules')
+    def test_missing_workbook(self, mock_iter_vba_modules):
+        """Test /dev/null sides yield no modules"""
+        self.assertEqual(diff.get_vba_cached(None, cache=self.cache), {})
+        mock_iter_vba_modules.assert_not_called()
+
+
+class TestGetVBAAll(unittest.TestCase):
+    """Test parallel extraction of several workbooks"""
+
+    def setUp(self):
+        import tempfile
+        self.temp_dir = tempfile.mkdtemp()
+        self.cache = diff.Cache(path=self.temp_dir, max_size=0)
+        self.workbooks = []
+        for name, size in (('small.xlsm', 10), ('large_a.xlsm', 1000), ('large_b.xlsm', 2000)):
+            path = os.path.join(self.temp_dir, name)
+            with open(path, 'wb') as f:
+                f.write(b'x' * size)
+            self.workbooks.append(path)
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    @patch.dict(os.environ, {'GIT_XL_PARALLEL_THRESHOLD': '100'})
+    @patch('diff.iter_vba_modules', side_effect=lambda workbook, data: [('Module1', 'module', os.path.basename(workbook))])
+    @patch('diff.ProcessPoolExecutor')
+    def test_large_workbooks_are_offloaded(self, mock_executor_class, mock_iter_vba_modules):
+        """Test all but one large workbook are extracted in worker processes"""
+        from concurrent.futures import Future
+
+        def submit(fn, *args):
+            future = Future()
+            future.set_result(fn(*args))
+            return future
+
+        mock_executor_class.return_value.submit.side_effect = submit
+        results = diff.get_vba_all([(path, None) for path in self.workbooks] + [(None, None)], self.cache)
+
+        self.assertEqual([{name: module.source for name, module in modules.items()} for modules in results],
+                         [{'Module1': 'small.xlsm'}, {'Module1': 'large_a.xlsm'}, {'Module1': 'large_b.xlsm'}, {}])
+        mock_executor_class.return_value.submit.assert_called_once_with(diff.get_modules, self.workbooks[2])
+        mock_executor_class.return_value.shutdown.assert_called_once()
+
+    @patch('diff.iter_vba_modules', return_value=[])
+    @patch('diff.ProcessPoolExecutor')
+    def test_small_workbooks_stay_in_process(self, mock_executor_class, mock_iter_vba_modules):
+        """Test no worker process is started below the threshold"""
+        diff.get_vba_all([(path, None) for path in self.workbooks], self.cache)
+        mock_executor_class.assert_not_called()
+        self.assertEqual(mock_iter_vba_modules.call_count, 3)
+
+    @patch.dict(os.environ, {'GIT_XL_PARALLEL_THRESHOLD': '0'})
+    def test_parallel_extraction_of_real_workbooks(self):
+        """Test worker processes return the same modules as in-process extraction"""
+        import shutil
+        book = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Book1.xlsb')
+        copy = os.path.join(self.temp_dir, 'Book1.xlsb')
+        shutil.copy(book, copy)
+        results = diff.get_vba_all([(book, None), (copy, None)], self.cache)
+        sources = [{name: module.source for name, module in modules.items()} for modules in results]
+        self.assertEqual(sources[0], diff.get_vba(book))
+        self.assertEqual(sources[1], sources[0])
+
+
 class TestDiffMain(unittest.TestCase):
     """Test the main diff functionality"""
 
@@ -185,6 +433,336 @@ class TestDiffMain(unittest.TestCase):
         # We'll test the argument parsing logic separately since main is in if __name__ block
 
 
+class TestMain(unittest.TestCase):
+    """Test main() end-to-end on the real test workbook"""
+
+    def setUp(self):
+        self.workbook = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Book1.xlsb')
+        self.cache = diff.Cache(max_size=0)
+
+    def test_new_workbook(self):
+        """Test all modules of an added workbook are reported as new"""
+        out = BytesIO()
+        diff.main(['Book1.xlsb', '/dev/null', '.', '.', self.workbook, '.', '100644'], out=out, cache=self.cache)
+        output = out.getvalue().decode('utf-8')
+        self.assertIn('diff --xl a/Book1.xlsb b/Book1.xlsb', output)
+        self.assertIn('+++ b/Book1.xlsb/VBA/Module1', output)
+
+    def test_deleted_workbook(self):
+        """Test all modules of a deleted workbook are reported as removed"""
+        out = BytesIO()
+        diff.main(['Book1.xlsb', self.workbook, '.', '100644', '/dev/null', '.', '.'], out=out, cache=self.cache)
+        self.assertIn('--- b/Book1.xlsb/VBA/Module1', out.getvalue().decode('utf-8'))
+
+    @patch('diff.get_vba_all')
+    def test_unchanged_workbook(self, mock_get_vba_all):
+        """Test a workbook with an unchanged VBA project prints nothing, without extracting it"""
+        out = BytesIO()
+        diff.main(['3', 'Book1.xlsb', self.workbook, '.', '100644', self.workbook, '.', '100644'], out=out,
+                  cache=self.cache)
+        self.assertEqual(out.getvalue(), b'')
+        mock_get_vba_all.assert_not_called()
+
+    def test_unexpected_number_of_arguments(self):
+        """Test invalid argument counts are reported"""
+        out = BytesIO()
+        diff.main(['only', 'three', 'args'], out=out)
+        self.assertEqual(out.getvalue().decode('utf-8'), 'Unexpected number of arguments\n')
+
+    @patch('diff.get_git_config', return_value={})
+    def test_diff_algorithm_option(self, mock_get_git_config):
+        """Test every diff algorithm produces the same output for the test workbook"""
+        args = ['Book1.xlsb', '/dev/null', '.', '.', self.workbook, '.', '100644']
+        expected = BytesIO()
+        diff.main(args, out=expected, cache=self.cache)
+        for algorithm in ('myers', 'histogram'):
+            out = BytesIO()
+            diff.main(['--diff-algorithm=' + algorithm] + args, out=out, cache=self.cache)
+            self.assertEqual(out.getvalue(), expected.getvalue())
+
+    @patch('diff.get_git_config', return_value={'diff.xl.vbaalgorithm': 'fastest'})
+    def test_unknown_diff_algorithm(self, mock_get_git_config):
+        """Test an unknown algorithm from the git config is reported"""
+        with self.assertRaisesRegex(ValueError, r'unknown diff algorithm "fastest" \(--diff-algorithm or '
+                                                r'diff.xl.vbaAlgorithm\)'):
+            diff.main(['Book1.xlsb', '/dev/null', '.', '.', self.workbook, '.', '100644'], out=BytesIO(),
+                      cache=self.cache)
+        # git's own diff.xl.algorithm, e.g. patience, is left to git
+        mock_get_git_config.return_value = {'diff.xl.algorithm': 'patience'}
+        self.assertEqual(diff.get_algorithm({}), 'difflib')
+
+    def test_unknown_diff_algorithm_exits(self):
+        """Test git is told about an unknown algorithm instead of getting it as the diff"""
+        process = subprocess.run([sys.executable, diff.__file__, '--diff-algorithm=patience',
+                                  'Book1.xlsb', '/dev/null', '.', '.', self.workbook, '.', '100644'],
+                                 stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        self.assertEqual((process.returncode, process.stdout), (1, b''))
+        self.assertIn(b'Error: unknown diff algorithm "patience"', process.stderr)
+
+    def test_git_config_is_read_once(self):
+        """Test the git config is only read for options that are not given, and once per process"""
+        args = ['Book1.xlsb', '/dev/null', '.', '.', 'Book1.xlsb', '.', '100644']
+        diff.read_git_config.cache_clear()
+        with patch('subprocess.run', wraps=subprocess.run) as mock_run:
+            diff.resolve_options(['--diff-algorithm=', '--diff-granularity=', '--format=', '--sheets=', '--trace='] +
+                                 args)
+            mock_run.assert_not_called()
+            diff.resolve_options(args)
+            diff.resolve_options(args)
+        self.assertEqual(mock_run.call_count, 1)
+
+    @patch('diff.get_git_config', return_value={'diff.xl.vbaalgorithm': 'histogram'})
+    def test_resolve_options(self, mock_get_git_config):
+        """Test the configured algorithm is passed on explicitly, unless given as option"""
+        args = ['Book1.xlsb', '/dev/null', '.', '.', 'Book1.xlsb', '.', '100644']
+        self.assertEqual(diff.resolve_options(args), ['--diff-algorithm=histogram', '--diff-granularity=', '--format=',
+                                                      '--sheets=', '--trace='] + args)
+        self.assertEqual(diff.split_options(diff.resolve_options(['--diff-algorithm=myers'] + args)),
+                         ({'diff-algorithm': 'myers', 'diff-granularity': '', 'format': '', 'sheets': '', 'trace': ''},
+                          args))
+
+    @patch('diff.get_git_config', return_value={'diff.xl.format': 'ndjson', 'diff.xl.granularity': 'statement'})
+    def test_given_options_are_final(self, mock_get_git_config):
+        """Test options resolved by the caller, even empty ones, win over the settings of a daemon"""
+        args = ['Book1.xlsb', '/dev/null', '.', '.', self.workbook, '.', '100644']
+        expected = BytesIO()
+        diff.main(['--diff-granularity=module', '--format=text'] + args, out=expected, cache=self.cache)
+        out = BytesIO()
+        options = ['--diff-algorithm=', '--diff-granularity=', '--format=', '--sheets=', '--trace=']
+        with patch.dict(os.environ, {'GIT_XL_TRACE': '1'}):
+            self.assertIsNone(diff.get_trace_path(diff.split_options(options)[0]))
+            diff.main(options + args, out=out, cache=self.cache)
+        self.assertEqual(out.getvalue(), expected.getvalue())
+
+    @patch('diff.get_git_config', return_value={'diff.xl.granularity': 'procedure'})
+    def test_diff_granularity_option(self, mock_get_git_config):
+        """Test the configured granularity is resolved and used by main"""
+        args = ['Book1.xlsb', '/dev/null', '.', '.', self.workbook, '.', '100644']
+        self.assertEqual(diff.split_options(diff.resolve_options(args))[0]['diff-granularity'], 'procedure')
+        out = BytesIO()
+        diff.main(args, out=out, cache=self.cache)
+        self.assertIn('@@ -0,0 +', out.getvalue().decode('utf-8'))
+        with self.assertRaisesRegex(ValueError, 'unknown diff granularity "statement"'):
+            diff.main(['--diff-granularity=statement'] + args, out=BytesIO(), cache=self.cache)
+
+
+    @patch('diff.get_git_config', return_value={})
+    def test_format_option(self, mock_get_git_config):
+        """Test the json formats write records without colour codes"""
+        import json
+        args = ['Book1.xlsb', '/dev/null', '.', '.', self.workbook, '.', '100644']
+        out = BytesIO()
+        diff.main(['--format=ndjson'] + args, out=out, cache=self.cache)
+        self.assertNotIn(b'\x1b', out.getvalue())
+        records = [json.loads(line) for line in out.getvalue().decode('utf-8').splitlines()]
+        self.assertIn('Module1', [record['module'] for record in records])
+        self.assertEqual({record['status'] for record in records}, {'added'})
+        out = BytesIO()
+        diff.main(['--format=json'] + args, out=out, cache=self.cache)
+        self.assertEqual(json.loads(out.getvalue()), records)
+        with self.assertRaisesRegex(ValueError, r'unknown format "xml" \(--format or diff.xl.format\), expected one '
+                                                r'of: text, json, ndjson'):
+            diff.main(['--format=xml'] + args, out=BytesIO(), cache=self.cache)
+
+
+class TestRecords(unittest.TestCase):
+    """Test the records of the json formats"""
+
+    def setUp(self):
+        self.old = {'Module1': diff.Module('Module1', 'Sub A()\nEnd Sub'), 'Module2': diff.Module('Module2', 'Sub B()')}
+        self.new = {'Module1': diff.Module('Module1', 'Sub A()\n    Beep\nEnd Sub'),
+                    'Module3': diff.Module('Module3', 'Sub C()\nEnd Sub')}
+
+    def get_records(self, diffs, new, old):
+        return [diff.get_record('Book1.xlsm', header_a, header_b, lines, new, old) for header_a, header_b, lines in diffs]
+
+    def test_statuses_and_hunks(self):
+        records = self.get_records(diff.iter_diffs('Book1.xlsm', self.new, self.old, 3), self.new, self.old)
+        self.assertEqual(records, [
+            {'workbook': 'Book1.xlsm', 'module': 'Module1', 'status': 'modified',
+             'old': {'digest': self.old['Module1'].digest, 'line_count': 2},
+             'new': {'digest': self.new['Module1'].digest, 'line_count': 3}, 'notes': [],
+             'hunks': [{'old_start': 1, 'old_lines': 2, 'new_start': 1, 'new_lines': 3,
+                        'lines': [' Sub A()', '+    Beep', ' End Sub']}]},
+            {'workbook': 'Book1.xlsm', 'module': 'Module3', 'status': 'added', 'old': None,
+             'new': {'digest': self.new['Module3'].digest, 'line_count': 2}, 'notes': [],
+             'hunks': [{'old_start': 0, 'old_lines': 0, 'new_start': 1, 'new_lines': 2,
+                        'lines': ['+Sub C()', '+End Sub']}]},
+            {'workbook': 'Book1.xlsm', 'module': 'Module2', 'status': 'removed',
+             'old': {'digest': self.old['Module2'].digest, 'line_count': 1}, 'new': None, 'notes': [],
+             'hunks': [{'old_start': 1, 'old_lines': 1, 'new_start': 0, 'new_lines': 0, 'lines': ['-Sub B()']}]},
+        ])
+
+    def test_notes(self):
+        old = {'Module1': diff.Module('Module1', 'Sub A()\nEnd Sub\n\nSub B()\nEnd Sub')}
+        new = {'Module1': diff.Module('Module1', 'Sub B()\nEnd Sub\n\nSub A()\n    Beep\nEnd Sub')}
+        record, = self.get_records(diff.get_diffs('Book1.xlsm', new, old, 0, granularity='procedure'), new, old)
+        self.assertEqual(record['notes'], ['Sub B moved from line 4'])
+        self.assertEqual([(hunk['old_start'], hunk['new_start'], hunk['lines']) for hunk in record['hunks']],
+                         [(1, 5, ['+    Beep'])])
+
+    def test_record_writer(self):
+        import json
+        for output_format, expected in (('ndjson', b'{"a": 1}\n{"a": 2}\n'), ('json', b'[{"a": 1}\n,{"a": 2}\n]\n')):
+            out = BytesIO()
+            writer = diff.RecordWriter(out, output_format)
+            writer.write({'a': 1})
+            writer.write({'a': 2})
+            writer.close()
+            self.assertEqual(out.getvalue(), expected)
+        out = BytesIO()
+        diff.RecordWriter(out, 'json').close()
+        self.assertEqual(json.loads(out.getvalue()), [])
+
+class TestModule(unittest.TestCase):
+    """Test module records"""
+
+    def test_digest_and_line_count(self):
+        module = diff.Module('Module1', 'Sub Test()\nEnd Sub\n')
+        self.assertEqual(module.line_count, 3)
+        self.assertEqual(module.digest, diff.get_digest('Sub Test()\nEnd Sub\n'))
+        self.assertNotEqual(module.digest, diff.Module('Module1', 'Sub Test()\nEnd Sub').digest)
+
+    def test_record_round_trip(self):
+        module = diff.Module('Module1', 'Sub Test()\nEnd Sub')
+        copy = diff.Module.from_record('Module1', module.to_record())
+        self.assertEqual((copy.name, copy.source, copy.digest, copy.line_count, copy.type),
+                         (module.name, module.source, module.digest, module.line_count, module.type))
+
+    def test_lines(self):
+        module = diff.Module('Module1', 'Sub Test()\n    Beep\nEnd Sub\n', module_type='module')
+        # only computed on first access to a line
+        self.assertIsNone(module.offsets)
+        self.assertEqual(module.line(2), '    Beep')
+        self.assertEqual(list(module.offsets), [0, 11, 20, 28, 29])
+        self.assertEqual(list(module.iter_lines()), module.lines())
+        self.assertEqual(module.text(1, 2), 'Sub Test()\n    Beep')
+        self.assertEqual(module.text(3, 10), 'End Sub\n')
+        self.assertEqual(list(diff.Module('Module1', '').iter_lines()), [''])
+        # no per-instance dict
+        self.assertFalse(hasattr(module, '__dict__'))
+
+    def test_hidden_attributes_are_removed(self):
+        code = ('Attribute VB_Name = "Class1"\r\nAttribute VB_PredeclaredId = False\r\nOption Explicit\r\n'
+                'Public Property Get Value()\r\nAttribute Value.VB_UserMemId = 0\r\nEnd Property\r\n'
+                'Attribute VB_Exposed = False')
+        with patch('diff.VBA_Parser') as mock_vba_parser, patch('diff.get_vba_project', return_value=None), \
+                patch('diff.map_vba_project', return_value=None):
+            mock_vba_parser.return_value.extract_all_macros.return_value = [('', '', 'Class1.cls', code)]
+            self.assertEqual(list(diff.iter_vba_modules('Book1.xlsm')), [
+                ('Class1', 'class', 'Option Explicit\nPublic Property Get Value()\nEnd Property')])
+
+
+class TestIterDiffs(unittest.TestCase):
+    """Test the lazy per-module diff generation"""
+
+    def modules(self, **sources):
+        return {name: diff.Module(name, source) for name, source in sources.items()}
+
+    @patch('diff.unified_diff')
+    def test_unchanged_modules_are_skipped_by_digest(self, mock_unified_diff):
+        """Test identical modules never reach unified_diff"""
+        a = self.modules(Module1='Sub A()\nEnd Sub', Module2='Sub B()\nEnd Sub')
+        b = self.modules(Module1='Sub A()\nEnd Sub', Module2='Sub B()\nEnd Sub')
+        self.assertEqual(list(diff.iter_diffs('Book1.xlsm', a, b, 3)), [])
+        mock_unified_diff.assert_not_called()
+
+    def test_changed_module_is_diffed_lazily(self):
+        """Test hunks are only computed when the lines are consumed"""
+        a = self.modules(Module1='Sub A()\n    x = 2\nEnd Sub')
+        b = self.modules(Module1='Sub A()\n    x = 1\nEnd Sub')
+        with patch('diff.unified_diff', wraps=diff.unified_diff) as mock_unified_diff:
+            (header_a, header_b, lines), = list(diff.iter_diffs('Book1.xlsm', a, b, 3))
+            mock_unified_diff.assert_not_called()
+            lines = list(lines)
+        self.assertEqual(header_a, '--- a/Book1.xlsm/VBA/Module1')
+        self.assertEqual(header_b, '+++ b/Book1.xlsm/VBA/Module1')
+        self.assertEqual(lines, ['@@ -1,3 +1,3 @@', ' Sub A()', '-    x = 1', '+    x = 2', ' End Sub'])
+
+    @patch('diff.unified_diff')
+    def test_other_algorithm(self, mock_unified_diff):
+        """Test a non-default algorithm replaces difflib"""
+        a = self.modules(Module1='Sub A()\n    x = 2\nEnd Sub')
+        b = self.modules(Module1='Sub A()\n    x = 1\nEnd Sub')
+        (_, _, lines), = list(diff.iter_diffs('Book1.xlsm', a, b, 3, 'histogram'))
+        self.assertEqual(list(lines), ['@@ -1,3 +1,3 @@', ' Sub A()', '-    x = 1', '+    x = 2', ' End Sub'])
+        mock_unified_diff.assert_not_called()
+
+    def test_added_and_removed_modules(self):
+        """Test added and removed modules are printed in full"""
+        a = self.modules(Module2='Sub B()')
+        b = self.modules(Module1='Sub A()')
+        diffs = [(header_a, header_b, list(lines)) for header_a, header_b, lines in
+                 diff.iter_diffs('Book1.xlsm', a, b, 3)]
+        self.assertEqual(diffs, [
+            ('--- /dev/null', '+++ b/Book1.xlsm/VBA/Module2', ['+Sub B()']),
+            ('--- b/Book1.xlsm/VBA/Module1', '+++ /dev/null', ['-Sub A()']),
+        ])
+
+
+class TestDiffWriter(unittest.TestCase):
+    """Test the buffered diff output"""
+
+    def test_lines_are_coloured_by_prefix(self):
+        out = BytesIO()
+        writer = diff.DiffWriter(out)
+        writer.header('diff --xl a/Book1.xlsm b/Book1.xlsm')
+        for line in ('@@ -1 +1 @@', '-old', '+new', ' same', ''):
+            writer.diff_line(line)
+        writer.flush()
+        self.assertEqual(out.getvalue().decode('utf-8').split('\n'), [
+            diff.Style.BRIGHT + 'diff --xl a/Book1.xlsm b/Book1.xlsm',
+            diff.Fore.CYAN + '@@ -1 +1 @@',
+            diff.Fore.RED + '-old',
+            diff.Fore.GREEN + '+new',
+            ' same',
+            '',
+            '',
+        ])
+
+    def test_output_is_flushed_in_chunks(self):
+        """Test full buffers reach the output before the diff is complete"""
+        out = BytesIO()
+        writer = diff.DiffWriter(out, buffer_size=10)
+        writer.write('short')
+        self.assertEqual(out.getvalue(), b'')
+        writer.write('longer line')
+        self.assertEqual(out.getvalue(), b'short\nlonger line\n')
+
+    def test_print_diff_streams_module_diffs(self):
+        """Test module diffs are written with their headers and a blank separator"""
+        out = BytesIO()
+        diff.print_diff('Book1.xlsm', iter([('--- a/x', '+++ b/x', iter(['+new']))]), out)
+        self.assertEqual(out.getvalue().decode('utf-8'), (
+            diff.Style.BRIGHT + 'diff --xl a/Book1.xlsm b/Book1.xlsm\n' +
+            diff.Style.BRIGHT + '--- a/x\n' +
+            diff.Style.BRIGHT + '+++ b/x\n' +
+            diff.Fore.GREEN + '+new\n\n'))
+
+
+class TestTextconv(unittest.TestCase):
+    """Test the textconv output"""
+
+    @patch('diff.get_vba_cached')
+    def test_modules_are_sorted_and_terminated(self, mock_get_vba_cached):
+        """Test modules are printed by name, each ending with a newline"""
+        mock_get_vba_cached.return_value = {name: diff.Module(name, source) for name, source in (
+            ('Module2', 'Sub B()\nEnd Sub'),
+            ('module1', 'Sub A()\nEnd Sub\n'),
+            ('Empty', ''),
+            ('Übersicht', "' Größe\nSub C()\nEnd Sub"),
+        )}
+        out = BytesIO()
+        diff.print_textconv('Book1.xlsm', out)
+        # UTF-8 with LF line ends, whatever the console's encoding
+        self.assertEqual(out.getvalue().decode('utf-8'), 'Attribute VB_Name = "Empty"\n'
+                                                         'Attribute VB_Name = "module1"\nSub A()\nEnd Sub\n'
+                                                         'Attribute VB_Name = "Module2"\nSub B()\nEnd Sub\n'
+                                                         'Attribute VB_Name = "Übersicht"\n\' Größe\nSub C()\n'
+                                                         'End Sub\n')
+        mock_get_vba_cached.assert_called_once_with(os.path.abspath('Book1.xlsm'))
+
+
 class TestDiffLogic(unittest.TestCase):
     """Test the core diff logic separately"""
 
@@ -0,0 +1,196 @@
+import unittest
+import sys
+import os
+import json
+import shutil
+import tempfile
+from io import StringIO
+from unittest.mock import patch
+
+# Add src directory to path for importing modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import cli
+import diff
+import export
+import synthetic
+from cache import Cache
+
+
+def get_source(number):
+    return f'Option Explicit\n\nPublic Function Version() As String\n    Version = "v{number}"\nEnd Function'
+
+
+class TestExport(unittest.TestCase):
+    """Test the incremental export of VBA modules to files"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.workbooks = os.path.join(self.temp_dir, 'workbooks')
+        self.directory = os.path.join(self.temp_dir, 'vba')
+        os.makedirs(os.path.join(self.workbooks, 'Reports'))
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def write_workbook(self, name, modules):
+        path = os.path.join(self.workbooks, *name.split('/'))
+        synthetic.write_workbook(path, modules)
+        # a new version, even within the resolution of the file system's modification times
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000))
+        return path
+
+    def sync(self):
+        exporter = export.Exporter(self.directory, cache=Cache(max_size=0))
+        return exporter.sync(export.iter_workbooks([self.workbooks], cli.FILE_EXTENSIONS))
+
+    def read_module(self, *parts):
+        with open(os.path.join(self.directory, *parts), 'r', encoding='utf-8') as f:
+            return f.read()
+
+    def test_export(self):
+        self.write_workbook('Book1.xlsm', {'Module1': get_source(1), 'Module2': get_source(2)})
+        self.write_workbook('Reports/Book2.xlsb', {'Module1': get_source(3), 'Class1': get_source(4),
+                                                   'ThisWorkbook': ''})
+        # not a workbook, and a lock file of Excel
+        with open(os.path.join(self.workbooks, 'notes.txt'), 'w') as f:
+            f.write('notes')
+        shutil.copy(os.path.join(self.workbooks, 'Book1.xlsm'), os.path.join(self.workbooks, '~$Book1.xlsm'))
+
+        changes, count = self.sync()
+        self.assertEqual(count, 2)
+        self.assertEqual(changes, [export.Change('Book1.xlsm', ['Module1', 'Module2'], [], None),
+                                   export.Change('Reports/Book2.xlsb', ['Module1', 'Class1', 'ThisWorkbook'], [],
+                                                 None)])
+        # named by module type, document modules are classes
+        self.assertEqual(sorted(os.listdir(os.path.join(self.directory, 'Reports', 'Book2.xlsb'))),
+                         ['Class1.cls', 'Module1.bas', 'ThisWorkbook.cls'])
+        self.assertEqual(self.read_module('Reports', 'Book2.xlsb', 'Module1.bas'),
+                         'Attribute VB_Name = "Module1"\n' + get_source(3) + '\n')
+        with open(os.path.join(self.directory, export.MANIFEST_NAME), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        modules = diff.get_modules(os.path.join(self.workbooks, 'Book1.xlsm'))
+        self.assertEqual(manifest['workbooks']['Book1.xlsm']['modules'],
+                         {'Module1': [modules['Module1'].digest, 'Module1.bas'],
+                          'Module2': [modules['Module2'].digest, 'Module2.bas']})
+
+    def test_only_changed_modules_are_written(self):
+        for i in range(20):
+            self.write_workbook(f'Book{i}.xlsm', {'Module1': get_source(i), 'Module2': get_source(0)})
+        self.sync()
+        self.write_workbook('Book7.xlsm', {'Module1': get_source(7), 'Module2': get_source(1)})
+        with patch('diff.get_vba_all', wraps=diff.get_vba_all) as mock_get_vba_all, \
+                patch('export.write_file', wraps=export.write_file) as mock_write_file:
+            changes, count = self.sync()
+        self.assertEqual((changes, count), ([export.Change('Book7.xlsm', ['Module2'], [], None)], 20))
+        # only the changed workbook is extracted, and only its changed module and the manifest written
+        self.assertEqual([len(args[0]) for args, _ in mock_get_vba_all.call_args_list], [1])
+        self.assertEqual([os.path.relpath(args[0], self.directory) for args, _ in mock_write_file.call_args_list],
+                         [os.path.join('Book7.xlsm', 'Module2.bas'), export.MANIFEST_NAME])
+        self.assertIn('v1', self.read_module('Book7.xlsm', 'Module2.bas'))
+
+        with patch('diff.get_vba_all') as mock_get_vba_all:
+            self.assertEqual(self.sync(), ([], 20))
+        mock_get_vba_all.assert_not_called()
+
+    def test_deleted_modules_and_workbooks(self):
+        self.write_workbook('Book1.xlsm', {'Module1': get_source(1), 'Module2': get_source(2)})
+        path = self.write_workbook('Reports/Book2.xlsm', {'Module1': get_source(3)})
+        self.sync()
+        self.write_workbook('Book1.xlsm', {'Module1': get_source(1)})
+        os.remove(path)
+        self.assertEqual(self.sync()[0], [export.Change('Reports/Book2.xlsm', None, ['Module1'], None),
+                                          export.Change('Book1.xlsm', [], ['Module2'], None)])
+        self.assertEqual(sorted(os.listdir(self.directory)), [export.MANIFEST_NAME, 'Book1.xlsm'])
+        self.assertEqual(os.listdir(os.path.join(self.directory, 'Book1.xlsm')), ['Module1.bas'])
+
+    def test_deleted_files_are_written_again(self):
+        self.write_workbook('Book1.xlsm', {'Module1': get_source(1), 'Module2': get_source(2)})
+        self.sync()
+        os.remove(os.path.join(self.directory, 'Book1.xlsm', 'Module1.bas'))
+        self.write_workbook('Book1.xlsm', {'Module1': get_source(1), 'Module2': get_source(2)})
+        self.assertEqual(self.sync()[0], [export.Change('Book1.xlsm', ['Module1'], [], None)])
+
+    def test_broken_workbook(self):
+        self.write_workbook('Book1.xlsm', {'Module1': get_source(1)})
+        path = self.write_workbook('Book2.xlsm', {'Module1': get_source(2)})
+        iter_vba_modules = diff.iter_vba_modules
+
+        def iter_broken_vba_modules(workbook, data=None):
+            if workbook == path:
+                raise ValueError('truncated workbook')
+            return iter_vba_modules(workbook, data)
+        exporter = export.Exporter(self.directory, cache=Cache(max_size=0))
+        with patch('diff.iter_vba_modules', side_effect=iter_broken_vba_modules):
+            changes, _ = exporter.sync(export.iter_workbooks([self.workbooks], cli.FILE_EXTENSIONS))
+        self.assertEqual([(change.workbook, change.written, bool(change.error)) for change in changes],
+                         [('Book1.xlsm', ['Module1'], False), ('Book2.xlsm', [], True)])
+        self.assertEqual(export.format_change(changes[1]), 'Book2.xlsm: Error: truncated workbook')
+        # only tried again once it changed, e.g. when Excel finished writing it
+        self.assertEqual(exporter.sync(export.iter_workbooks([self.workbooks], cli.FILE_EXTENSIONS)), ([], 2))
+        self.write_workbook('Book2.xlsm', {'Module1': get_source(2)})
+        changes, _ = exporter.sync(export.iter_workbooks([self.workbooks], cli.FILE_EXTENSIONS))
+        self.assertEqual(changes, [export.Change('Book2.xlsm', ['Module1'], [], None)])
+
+    def test_module_names_stay_inside_the_directory(self):
+        self.write_workbook('Book1.xlsm', {'Module1': get_source(1)})
+        exporter = export.Exporter(self.directory, cache=Cache(max_size=0))
+        for module_name in ('../../../escaped', '..', 'Sub\\Module', ''):
+            with patch('diff.iter_vba_modules', return_value=[(module_name, 'module', get_source(1))]):
+                exporter.failed = {}
+                changes, _ = exporter.sync(export.iter_workbooks([self.workbooks], cli.FILE_EXTENSIONS))
+            self.assertEqual(changes, [export.Change('Book1.xlsm', [], [], f'invalid module name "{module_name}"')])
+        self.assertFalse(os.path.exists(self.directory))
+        # localised names are identifiers as well
+        with patch('diff.iter_vba_modules', return_value=[('Tabelle1', 'class', ''), ('Übersicht', 'class', '')]):
+            exporter.failed = {}
+            changes, _ = exporter.sync(export.iter_workbooks([self.workbooks], cli.FILE_EXTENSIONS))
+        self.assertEqual(changes, [export.Change('Book1.xlsm', ['Tabelle1', 'Übersicht'], [], None)])
+        with self.assertRaisesRegex(ValueError, 'is outside of'):
+            exporter.module_path('Book1.xlsm', '../../escaped.bas')
+
+    def test_same_name_twice(self):
+        path = self.write_workbook('Reports/Book1.xlsm', {'Module1': get_source(1)})
+        shutil.copy(path, os.path.join(self.workbooks, 'Book1.xlsm'))
+        exporter = export.Exporter(self.directory, cache=Cache(max_size=0))
+        with self.assertRaisesRegex(ValueError, 'would both be exported to Book1.xlsm'):
+            exporter.sync(export.iter_workbooks([path, os.path.join(self.workbooks, 'Book1.xlsm')],
+                                                cli.FILE_EXTENSIONS))
+
+    def test_watch(self):
+        self.write_workbook('Book1.xlsm', {'Module1': get_source(1)})
+        exporter = export.Exporter(self.directory, cache=Cache(max_size=0))
+        exporter.sync(export.iter_workbooks([self.workbooks], cli.FILE_EXTENSIONS))
+        reported = []
+        sleeps = []
+
+        def sleep(seconds):
+            # the workbook is saved during the first interval, the second one ends the test
+            sleeps.append(seconds)
+            if len(sleeps) > 1:
+                raise KeyboardInterrupt
+            self.write_workbook('Book1.xlsm', {'Module1': get_source(2)})
+        with patch('time.sleep', side_effect=sleep), self.assertRaises(KeyboardInterrupt):
+            exporter.watch([self.workbooks], cli.FILE_EXTENSIONS, reported.append, interval=0.5)
+        self.assertEqual(sleeps, [0.5, 0.5])
+        self.assertEqual(reported, [export.Change('Book1.xlsm', ['Module1'], [], None)])
+
+    @patch('sys.stdout', new_callable=StringIO)
+    def test_export_command(self, mock_stdout):
+        path = self.write_workbook('Book1.xlsm', {'Module1': get_source(1)})
+        with patch.dict(os.environ, {'GIT_XL_CACHE_SIZE': '0'}):
+            cli.CommandParser(['export', path, self.directory]).execute()
+            cli.CommandParser(['export', path, self.directory]).execute()
+            cli.CommandParser(['export', path]).execute()
+            cli.CommandParser(['export', os.path.join(self.workbooks, 'Book2.xlsm'), self.directory]).execute()
+        self.assertEqual(mock_stdout.getvalue().splitlines()[:3], [
+            'Book1.xlsm: wrote Module1',
+            f'Exported 1 modules of 1 workbooks to {self.directory}',
+            f'Exported 0 modules of 1 workbooks to {self.directory}'])
+        self.assertIn('Usage: git xl export', mock_stdout.getvalue())
+        self.assertIn('Error: no such workbook or directory', mock_stdout.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import unittest
+import sys
+import os
+from io import BytesIO
+from unittest.mock import patch
+
+# Add src directory to path for importing modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import diff
+import batch
+import index
+from cache import Cache
+from test_batch import RepositoryTestCase
+
+MODULE1 = """Option Explicit
+
+Public Function Total(ByVal value As Long) As Long
+    Total = value + 1
+End Function
+
+Public Sub Report()
+    MsgBox Total(1)
+End Sub"""
+
+
+class TestIndex(RepositoryTestCase):
+    """Test the procedure index and the commands answered from it"""
+
+    def create_history(self):
+        self.commit({'Book1.xlsm': {'Module1': MODULE1}}, 'first')
+        # Report changes, Total only moves down
+        self.commit({'Book1.xlsm': {'Module1': MODULE1.replace('Option Explicit\n', 'Option Explicit\n\n\n')
+                                    .replace('MsgBox Total(1)', 'MsgBox Total(2)')}}, 'second')
+        self.commit({'Book1.xlsm': {'Module1': MODULE1.replace('value + 1', 'value + 2'),
+                                    'Module2': 'Sub Run()\n    Application.Run "Total"\nEnd Sub'},
+                     'Book2.xlsb': {'Module1': MODULE1}}, 'third')
+
+    def run_command(self, function, *args):
+        out = BytesIO()
+        function(args, out=out, cache=Cache(max_size=0), cwd=self.repository)
+        return out.getvalue().replace(diff.COMMIT_COLOR, b'').replace(diff.RESET, b'').decode('utf-8')
+
+    def test_index_range(self):
+        self.assertEqual(index.index_range([], cwd=self.repository), (4, 4))
+        self.assertTrue(os.path.exists(os.path.join(self.repository, '.git', 'xl', 'index.sqlite')))
+        with patch('diff.get_modules') as mock_get_modules:
+            self.assertEqual(index.index_range([], cwd=self.repository), (0, 4))
+        mock_get_modules.assert_not_called()
+        self.assertEqual(index.index_range(['--', 'Book2.xlsb'], rebuild=True, cwd=self.repository), (1, 1))
+        with index.Index(index.get_index_path(self.repository)) as idx:
+            blob_id = self.git('rev-parse', 'HEAD:Book2.xlsb').decode('ascii').strip()
+            modules = idx.get_modules(blob_id)
+            self.assertEqual(list(modules), ['Module1'])
+            self.assertEqual(modules['Module1'].source, MODULE1 + '\n')
+            self.assertEqual([(p.name, p.start, p.end) for p in idx.get_procedures(modules['Module1'].digest)],
+                             [('Total', 3, 5), ('Report', 7, 9)])
+
+    def test_grep(self):
+        output = self.run_command(index.grep_range, '-i', 'total')
+        head, second, first = [self.git('rev-parse', '--short=7', revision).decode('ascii').strip()
+                               for revision in ('HEAD', 'HEAD~1', 'HEAD~2')]
+        self.assertEqual(output.split('\n'), [
+            f'{head}:Book1.xlsm/VBA/Module1:4:    Total = value + 2',
+            f'{head}:Book1.xlsm/VBA/Module1:8:    MsgBox Total(1)',
+            f'{head}:Book1.xlsm/VBA/Module2:2:    Application.Run "Total"',
+            f'{head}:Book2.xlsb/VBA/Module1:3:Public Function Total(ByVal value As Long) As Long',
+            f'{head}:Book2.xlsb/VBA/Module1:4:    Total = value + 1',
+            f'{head}:Book2.xlsb/VBA/Module1:8:    MsgBox Total(1)',
+            f'{second}:Book1.xlsm/VBA/Module1:10:    MsgBox Total(2)',
+            f'{first}:Book1.xlsm/VBA/Module1:3:Public Function Total(ByVal value As Long) As Long',
+            f'{first}:Book1.xlsm/VBA/Module1:4:    Total = value + 1',
+            f'{first}:Book1.xlsm/VBA/Module1:8:    MsgBox Total(1)',
+            '',
+        ])
+        self.assertIn('MsgBox Total(2)', self.run_command(index.grep_range, 'Total', 'HEAD~1', '-n', '1'))
+        self.assertEqual(self.run_command(index.grep_range, 'total', '--', 'Book2.xlsb'), '')
+        with self.assertRaises(ValueError):
+            self.run_command(index.grep_range, '(')
+
+    def test_log_procedure(self):
+        output = self.run_command(batch.log_range, '-L', 'Module1.Total', '--', 'Book1.xlsm')
+        self.assertEqual(output.count('commit '), 2)
+        self.assertIn('    third\n', output)
+        self.assertNotIn('    second\n', output)
+        self.assertIn('--- a/Book1.xlsm/VBA/Module1.Total\n', output)
+        # numbered like the lines of the module, Total moved down in the second commit
+        self.assertIn('@@ -5,3 +3,3 @@', output)
+        self.assertIn('--- /dev/null\n\x1b[1m+++ b/Book1.xlsm/VBA/Module1.Total\n', output)
+        self.assertEqual(self.run_command(batch.log_range, '-LReport', '--', 'Book1.xlsm').count('commit '), 3)
+        self.assertEqual(self.run_command(batch.log_range, '-L', 'Module2.Report'), '')
+
+    def test_log_procedure_records(self):
+        import json
+        output = self.run_command(batch.log_range, '--format=json', '-L', 'Module1.Total', '--', 'Book1.xlsm')
+        records = json.loads(output)
+        self.assertEqual([(record['module'], record['status']) for record in records],
+                         [('Module1.Total', 'modified'), ('Module1.Total', 'added')])
+        self.assertEqual(records[0]['hunks'][0]['old_start'], 5)
+        self.assertEqual(len({record['commit'] for record in records}), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+import unittest
+import sys
+import os
+
+# Add src directory to path for importing modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import diff
+import procedures
+
+
+SOURCE = """Option Explicit
+Private Declare PtrSafe Function GetTickCount Lib "kernel32" () As Long
+
+Public Sub Main()
+    ' End Sub in a comment does not count
+    MsgBox Total(1)
+End Sub
+
+Private Static Function Total(ByVal value As Long) As Long
+    Total = value + 1
+End Function
+
+Property Get Value() As Long
+End Property
+Public Property Let Value(ByVal v As Long)
+End Property
+
+Sub Unterminated()
+    Beep"""
+
+
+class TestParseProcedures(unittest.TestCase):
+    """Test finding the procedures of a module"""
+
+    def test_parse_procedures(self):
+        lines = SOURCE.split('\n')
+        found = procedures.parse_procedures(lines)
+        self.assertEqual([(p.name, p.kind, p.start, p.end) for p in found], [
+            ('Main', 'Sub', 4, 7),
+            ('Total', 'Function', 9, 11),
+            ('Value', 'Property Get', 13, 14),
+            ('Value', 'Property Let', 15, 16),
+            ('Unterminated', 'Sub', 18, 19),
+        ])
+        self.assertEqual(found[1].digest, procedures.get_digest(lines[8:11]))
+
+    def test_digest_is_independent_of_position(self):
+        moved = procedures.parse_procedures(['', '', 'Sub A()', 'End Sub'])
+        self.assertEqual(moved[0].digest, procedures.parse_procedures(['Sub A()', 'End Sub'])[0].digest)
+
+
+class TestIterDiffs(unittest.TestCase):
+    """Test the procedure by procedure diff"""
+
+    def iter_diffs(self, new, old):
+        modules_a = {name: diff.Module(name, source) for name, source in new.items()}
+        modules_b = {name: diff.Module(name, source) for name, source in old.items()}
+        return [(header_a, header_b, list(lines))
+                for header_a, header_b, lines in procedures.iter_diffs('Book1.xlsm', modules_a, modules_b, 1)]
+
+    def test_changed_procedure(self):
+        old = 'Option Explicit\n\nSub A()\n    x = 1\nEnd Sub\n\nSub B()\n    y = 1\nEnd Sub'
+        self.assertEqual(self.iter_diffs({'Module1': old.replace('y = 1', 'y = 2')}, {'Module1': old}), [
+            ('--- a/Book1.xlsm/VBA/Module1', '+++ b/Book1.xlsm/VBA/Module1',
+             ['@@ -7,3 +7,3 @@', ' Sub B()', '-    y = 1', '+    y = 2', ' End Sub']),
+        ])
+
+    def test_reordered_procedures(self):
+        old = "Sub A()\nEnd Sub\n\n' the b\nSub B()\nEnd Sub\n\nSub C()\nEnd Sub"
+        new = "' the b\nSub B()\nEnd Sub\n\nSub A()\nEnd Sub\n\n\nSub C()\nEnd Sub"
+        self.assertEqual(self.iter_diffs({'Module1': new}, {'Module1': old}), [
+            ('--- a/Book1.xlsm/VBA/Module1', '+++ b/Book1.xlsm/VBA/Module1', ['@@ Sub B moved from line 5 @@']),
+        ])
+        # blank lines between procedures are no change
+        self.assertEqual(self.iter_diffs({'Module1': old.replace('\n\n', '\n\n\n')}, {'Module1': old}), [])
+
+    def test_changed_comment_between_procedures(self):
+        old = "Sub A()\nEnd Sub\n\n' section: v1\n\nSub B()\nEnd Sub"
+        self.assertEqual(self.iter_diffs({'Module1': old.replace('v1', 'v2')}, {'Module1': old}), [
+            ('--- a/Book1.xlsm/VBA/Module1', '+++ b/Book1.xlsm/VBA/Module1',
+             ['@@ -3,2 +3,2 @@', ' ', "-' section: v1", "+' section: v2"]),
+        ])
+        # it moves with the procedure above it
+        self.assertEqual(self.iter_diffs({'Module1': "Sub B()\nEnd Sub\n\nSub A()\nEnd Sub\n\n' section: v1"},
+                                         {'Module1': old}),
+                         [('--- a/Book1.xlsm/VBA/Module1', '+++ b/Book1.xlsm/VBA/Module1',
+                           ['@@ Sub B moved from line 6 @@'])])
+
+    def test_code_after_last_procedure(self):
+        old = 'Sub A()\nEnd Sub\n'
+        self.assertEqual(self.iter_diffs({'Module1': old + '\nDebug.Print 1\n'}, {'Module1': old}), [
+            ('--- a/Book1.xlsm/VBA/Module1', '+++ b/Book1.xlsm/VBA/Module1',
+             ['@@ -2 +2,3 @@', ' End Sub', '+', '+Debug.Print 1']),
+        ])
+        self.assertEqual(procedures.split_module(diff.Module('Module1', old + '\nDebug.Print 1\n'))[2][0][1:], (1, 4))
+
+    def test_procedure_moved_between_modules(self):
+        old = {'Module1': 'Sub A()\nEnd Sub\n\nSub B()\n    y = 1\nEnd Sub', 'Module2': 'Sub C()\nEnd Sub'}
+        new = {'Module1': 'Sub A()\nEnd Sub', 'Module2': 'Sub C()\nEnd Sub\n\nSub B()\n    y = 2\nEnd Sub',
+               'Module3': 'Option Explicit\n\nSub A()\nEnd Sub\n\nSub D()\nEnd Sub'}
+        old['Module4'] = 'Sub E()\nEnd Sub'
+        new['Module1'] += '\n\nSub E()\nEnd Sub'
+        self.assertEqual(self.iter_diffs(new, old), [
+            ('--- a/Book1.xlsm/VBA/Module1', '+++ b/Book1.xlsm/VBA/Module1',
+             ['@@ Sub E moved from Module4 @@', '@@ Sub B moved to Module2 @@']),
+            ('--- a/Book1.xlsm/VBA/Module2', '+++ b/Book1.xlsm/VBA/Module2',
+             ['@@ Sub B moved from Module1 @@', '@@ -4,3 +4,3 @@', ' Sub B()', '-    y = 1', '+    y = 2',
+              ' End Sub']),
+            ('--- /dev/null', '+++ b/Book1.xlsm/VBA/Module3',
+             ['@@ -0,0 +1,2 @@', '+Option Explicit', '+', '@@ -0,0 +3,2 @@', '+Sub A()', '+End Sub',
+              '@@ -0,0 +6,2 @@', '+Sub D()', '+End Sub']),
+            ('--- b/Book1.xlsm/VBA/Module4', '+++ /dev/null', ['@@ Sub E moved to Module1 @@']),
+        ])
+
+
+if __name__ == '__main__':
+    unittest.main()
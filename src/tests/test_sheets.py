@@ -0,0 +1,196 @@
+import unittest
+import sys
+import os
+import json
+import shutil
+import zipfile
+import tempfile
+from io import BytesIO
+from unittest.mock import patch
+
+# Add src directory to path for importing modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import diff
+import sheets
+
+MAIN_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+RELATIONSHIPS_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+PACKAGE_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+
+
+def sheet_xml(rows):
+    # rows maps row numbers to {reference: inner xml of the c element, or (type, inner xml)}
+    parts = [f'<worksheet xmlns="{MAIN_NS}"><sheetData>']
+    for number in sorted(rows):
+        parts.append(f'<row r="{number}">')
+        for reference, cell in rows[number].items():
+            kind, inner = cell if isinstance(cell, tuple) else ('n', cell)
+            parts.append(f'<c r="{reference}" t="{kind}">{inner}</c>')
+        parts.append('</row>')
+    parts.append('</sheetData></worksheet>')
+    return ''.join(parts)
+
+
+def write_xlsx(path, sheet_rows, strings=()):
+    # a minimal workbook: sheet_rows maps sheet names to the rows of sheet_xml
+    relationships = [f'<Relationship Id="rIdStrings" Type="{RELATIONSHIPS_NS}/sharedStrings" '
+                     f'Target="sharedStrings.xml"/>']
+    entries = []
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for i, (name, rows) in enumerate(sheet_rows.items(), 1):
+            archive.writestr(f'xl/worksheets/sheet{i}.xml', sheet_xml(rows))
+            relationships.append(f'<Relationship Id="rId{i}" Type="{RELATIONSHIPS_NS}/worksheet" '
+                                 f'Target="worksheets/sheet{i}.xml"/>')
+            entries.append(f'<sheet name="{name}" sheetId="{i}" r:id="rId{i}"/>')
+        archive.writestr('xl/workbook.xml', f'<workbook xmlns="{MAIN_NS}" xmlns:r="{RELATIONSHIPS_NS}"><sheets>'
+                                            f'{"".join(entries)}</sheets></workbook>')
+        archive.writestr('xl/_rels/workbook.xml.rels',
+                         f'<Relationships xmlns="{PACKAGE_NS}">{"".join(relationships)}</Relationships>')
+        archive.writestr('xl/sharedStrings.xml', f'<sst xmlns="{MAIN_NS}">' +
+                         ''.join(f'<si><t>{string}</t></si>' for string in strings) + '</sst>')
+
+
+class TestFormulas(unittest.TestCase):
+    """Test cell references and shared formulas"""
+
+    def test_columns(self):
+        for number, name in ((1, 'A'), (26, 'Z'), (27, 'AA'), (16384, 'XFD')):
+            self.assertEqual(sheets.column_name(number), name)
+            self.assertEqual(sheets.column_number(name), number)
+
+    def test_shift_formula(self):
+        self.assertEqual(sheets.shift_formula('SUM(A1:B2)*$C$1+$D1+E$1', 2, 1), 'SUM(B3:C4)*$C$1+$D3+F$1')
+        # string literals, quoted sheet names and function names stay as they are
+        self.assertEqual(sheets.shift_formula('IF(A1="B1",LOG10(A1),\'C1\'!C1)', 1, 0),
+                         'IF(A2="B1",LOG10(A2),\'C1\'!C2)')
+
+    def test_quote_sheet_name(self):
+        self.assertEqual(sheets.quote_sheet_name('Sheet1'), 'Sheet1')
+        self.assertEqual(sheets.quote_sheet_name("Bob's data"), "'Bob''s data'")
+
+
+class TestSheetDiff(unittest.TestCase):
+    """Test the cell diff of the sheets of two workbooks"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.old = os.path.join(self.temp_dir, 'old.xlsx')
+        self.new = os.path.join(self.temp_dir, 'new.xlsx')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def get_lines(self):
+        return [(header_a, header_b, list(lines)) for header_a, header_b, lines in
+                sheets.iter_diffs('Book1.xlsx', self.new, self.old)]
+
+    def test_changed_cells(self):
+        write_xlsx(self.old, {'Data': {1: {'A1': '<v>1</v>', 'B1': ('s', '<v>0</v>')},
+                                       2: {'A2': '<f>A1*2</f><v>2</v>'}}}, ['old'])
+        write_xlsx(self.new, {'Data': {1: {'A1': '<v>1</v>', 'B1': ('s', '<v>1</v>')},
+                                       2: {'A2': '<f>A1*3</f><v>3</v>'},
+                                       4: {'C4': ('inlineStr', '<is><t>line 1\nline 2</t></is>')}}},
+                   ['old', 'new'])
+        self.assertEqual(self.get_lines(), [
+            ('--- a/Book1.xlsx/Sheets/Data', '+++ b/Book1.xlsx/Sheets/Data',
+             ['-Data!B1: old', '+Data!B1: new', '-Data!A2: =A1*2', '+Data!A2: =A1*3', '+Data!C4: line 1\\nline 2'])])
+
+    def test_cached_values_and_formats_are_ignored(self):
+        write_xlsx(self.old, {'Data': {1: {'A1': '<f>NOW()</f><v>1</v>', 'B1': ''}}})
+        write_xlsx(self.new, {'Data': {1: {'A1': '<f>NOW()</f><v>2</v>'}}})
+        self.assertEqual(self.get_lines(), [])
+
+    def test_shared_formulas(self):
+        write_xlsx(self.old, {'Data': {1: {'B1': '<f t="shared" ref="B1:B3" si="0">A1*2</f><v>0</v>'},
+                                       2: {'B2': '<f t="shared" si="0"/><v>0</v>'},
+                                       3: {'B3': '<f t="shared" si="0"/><v>0</v>'}}})
+        write_xlsx(self.new, {'Data': {1: {'B1': '<f>A1*2</f><v>0</v>'},
+                                       2: {'B2': '<f>A2*2</f><v>0</v>'},
+                                       3: {'B3': '<f>A3*4</f><v>0</v>'}}})
+        _, _, lines = self.get_lines()[0]
+        self.assertEqual(lines, ['-Data!B3: =A3*2', '+Data!B3: =A3*4'])
+
+    def test_added_and_deleted_sheets(self):
+        write_xlsx(self.old, {'Old': {1: {'A1': '<v>1</v>'}}, 'Same': {}})
+        write_xlsx(self.new, {'Same': {}, 'New Sheet': {2: {'B2': '<v>2</v>'}}})
+        self.assertEqual(self.get_lines(), [
+            ('--- /dev/null', '+++ b/Book1.xlsx/Sheets/New Sheet', ["+'New Sheet'!B2: 2"]),
+            ('--- b/Book1.xlsx/Sheets/Old', '+++ /dev/null', ['-Old!A1: 1'])])
+        # a new workbook, its empty sheet has no cells to show
+        self.assertEqual([header_b for _, header_b, _ in sheets.iter_diffs('Book1.xlsx', self.new, None)],
+                         ['+++ b/Book1.xlsx/Sheets/New Sheet'])
+
+    @patch('sheets.iter_rows')
+    def test_unchanged_sheets_are_not_read(self, mock_iter_rows):
+        rows = {'Data': {1: {'A1': ('s', '<v>0</v>')}}}
+        write_xlsx(self.old, rows, ['same'])
+        write_xlsx(self.new, rows, ['same'])
+        self.assertEqual(self.get_lines(), [])
+        mock_iter_rows.assert_not_called()
+
+    def test_unchanged_sheet_with_changed_strings(self):
+        rows = {'Data': {1: {'A1': ('s', '<v>0</v>'), 'B1': ('s', '<v>1</v>')}}}
+        write_xlsx(self.old, rows, ['same', 'old'])
+        write_xlsx(self.new, rows, ['same', 'new'])
+        _, _, lines = self.get_lines()[0]
+        self.assertEqual(lines, ['-Data!B1: old', '+Data!B1: new'])
+
+    def test_workbooks_without_sheets(self):
+        with open(self.old, 'wb') as f:
+            f.write(b'not a zip file')
+        self.assertEqual(sheets.Workbook(self.old).sheets, {})
+        with zipfile.ZipFile(self.new, 'w') as archive:
+            archive.writestr('xl/workbook.bin', b'')
+        self.assertEqual(self.get_lines(), [])
+
+    def test_rows_are_streamed(self):
+        write_xlsx(self.old, {'Data': {number: {f'A{number}': f'<v>{number}</v>'} for number in range(1, 2001)}})
+        with sheets.Workbook(self.old) as workbook:
+            rows = workbook.iter_rows('Data')
+            self.assertEqual(next(rows), (1, {1: ('n', '1', None)}))
+            for number, cells in rows:
+                pass
+        self.assertEqual((number, cells), (2000, {1: ('n', '2000', None)}))
+
+
+class TestSheetsOption(unittest.TestCase):
+    """Test the sheets option of the diff driver"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.old = os.path.join(self.temp_dir, 'old.xlsx')
+        self.new = os.path.join(self.temp_dir, 'new.xlsx')
+        write_xlsx(self.old, {'Data': {1: {'A1': '<v>1</v>'}}})
+        write_xlsx(self.new, {'Data': {1: {'A1': '<v>2</v>'}}})
+        self.args = ['Book1.xlsx', self.old, '.', '.', self.new, '.', '100644']
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    @patch('diff.get_git_config', return_value={'diff.xl.sheets': 'true'})
+    def test_text(self, mock_get_git_config):
+        self.assertEqual(diff.split_options(diff.resolve_options(self.args)),
+                         ({'diff-algorithm': '', 'diff-granularity': '', 'format': '', 'sheets': 'true', 'trace': ''},
+                          self.args))
+        out = BytesIO()
+        diff.main(self.args, out=out, cache=diff.Cache(max_size=0))
+        output = out.getvalue().decode('utf-8')
+        self.assertIn('--- a/Book1.xlsx/Sheets/Data', output)
+        self.assertIn('\x1b[31m-Data!A1: 1\n\x1b[32m+Data!A1: 2\n', output)
+
+    @patch('diff.get_git_config', return_value={})
+    def test_off_by_default(self, mock_get_git_config):
+        out = BytesIO()
+        diff.main(self.args, out=out, cache=diff.Cache(max_size=0))
+        self.assertNotIn('Sheets', out.getvalue().decode('utf-8'))
+
+    @patch('diff.get_git_config', return_value={})
+    def test_ndjson(self, mock_get_git_config):
+        out = BytesIO()
+        diff.main(['--sheets=yes', '--format=ndjson'] + self.args, out=out, cache=diff.Cache(max_size=0))
+        self.assertEqual([json.loads(line) for line in out.getvalue().decode('utf-8').splitlines()],
+                         [{'workbook': 'Book1.xlsx', 'sheet': 'Data', 'cell': 'A1', 'old': '1', 'new': '2'}])
+
+
+if __name__ == '__main__':
+    unittest.main()
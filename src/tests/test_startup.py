@@ -0,0 +1,77 @@
+import unittest
+import sys
+import os
+import time
+import subprocess
+from io import StringIO
+
+# Add src directory to path for importing modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import startup
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# seconds a command may take on top of a bare interpreter start-up
+STARTUP_BUDGET = 0.5
+# modules that must not be loaded before a code path actually needs them
+HEAVY_MODULES = ('oletools', 'colorama', 'zipfile', 'concurrent.futures', 'multiprocessing')
+
+
+class TestImportProfile(unittest.TestCase):
+    """Test the import profile behind --startup-profile"""
+
+    def test_enable(self):
+        self.assertIsNone(startup.enable(['git-xl', 'version']))
+        args = ['git-xl', '--startup-profile', 'version']
+        sys.modules.pop('colorsys', None)
+        profile = startup.enable(args)
+        try:
+            import colorsys
+        finally:
+            profile.uninstall()
+        self.assertEqual(args, ['git-xl', 'version'])
+        self.assertEqual([name for _, name, _ in profile.imports], ['colorsys'])
+        out = StringIO()
+        profile.report(out)
+        self.assertRegex(out.getvalue(), r'^import time: +[\d.]+ ms \| colorsys\ntotal time: +[\d.]+ ms\n$')
+
+
+class TestStartupBudget(unittest.TestCase):
+    """Test the entry points stay quick for commands that need no heavy modules"""
+
+    def run_command(self, args):
+        # best of three, to be robust against a busy machine
+        env = dict(os.environ, GIT_XL_DAEMON_SOCKET=os.path.join(SRC_DIR, 'nonexistent', 'daemon.sock'))
+        best = None
+        for _ in range(3):
+            start = time.perf_counter()
+            cmd = subprocess.run([sys.executable] + args, cwd=SRC_DIR, env=env, stdout=subprocess.PIPE,
+                                 stderr=subprocess.PIPE, universal_newlines=True, encoding='utf-8')
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        self.assertEqual(cmd.returncode, 0, cmd.stderr)
+        return best, cmd
+
+    def imported_modules(self, profile):
+        return [line.split('|')[1].strip() for line in profile.split('\n') if line.startswith('import time:')]
+
+    def assert_startup(self, args):
+        baseline, _ = self.run_command(['-c', 'pass'])
+        elapsed, cmd = self.run_command(args)
+        modules = self.imported_modules(cmd.stderr)
+        for module in modules:
+            self.assertFalse(module.startswith(HEAVY_MODULES), f'{module} imported by {args}')
+        self.assertLess(elapsed - baseline, STARTUP_BUDGET)
+        return cmd
+
+    def test_version(self):
+        cmd = self.assert_startup(['cli.py', '--startup-profile', 'version'])
+        self.assertTrue(cmd.stdout.startswith('git-xl/'))
+
+    def test_empty_diff(self):
+        cmd = self.assert_startup(['diff.py', '--startup-profile', 'Book1.xlsb', '/dev/null', '.', '.',
+                                   '/dev/null', '.', '.'])
+        self.assertIn('diff --xl a/Book1.xlsb b/Book1.xlsb', cmd.stdout)
+
+
+if __name__ == '__main__':
+    unittest.main()
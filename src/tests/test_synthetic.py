@@ -0,0 +1,53 @@
+import unittest
+import sys
+import os
+import shutil
+import tempfile
+
+# Add src directory to path for importing modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import diff
+import synthetic
+from oletools.olevba import decompress_stream
+
+
+class TestSynthetic(unittest.TestCase):
+    """Test the synthetic workbooks used by the benchmarks"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_compress(self):
+        """Test the compression round trips through the oletools decompression"""
+        source = synthetic.module_text('Module1', synthetic.make_source('Module1', 500)).encode('cp1252')
+        for data in (b'a', b'abcabcabcabc', source, os.urandom(5000)):
+            self.assertEqual(decompress_stream(bytearray(synthetic.compress(data))), data)
+        self.assertLess(len(synthetic.compress(source)), len(source) / 2)
+
+    def test_workbooks(self):
+        """Test the modules of every format are extracted as generated"""
+        modules = synthetic.make_modules(6, 300)
+        self.assertEqual(list(modules)[:3], ['ThisWorkbook', 'Sheet1', 'Module1'])
+        for workbook_format in synthetic.FORMATS:
+            path = os.path.join(self.temp_dir, 'Book1.' + workbook_format)
+            synthetic.write_workbook(path, modules, payload_size=64 * 1024)
+            extracted = diff.get_vba(path)
+            self.assertEqual(extracted, {name: source + '\n' for name, source in modules.items()}, workbook_format)
+            self.assertEqual({name: module.type for name, module in diff.get_modules(path).items()},
+                             {name: 'module' if synthetic.module_kind(name) == 'module' else 'class'
+                              for name in modules}, workbook_format)
+
+    def test_change_modules(self):
+        modules = synthetic.make_modules(3, 100)
+        changed = synthetic.change_modules(modules, every_module=2, every_line=10)
+        self.assertEqual([name for name in modules if modules[name] != changed[name]], ['ThisWorkbook', 'Module1',
+                                                                                         'Module3'])
+        self.assertEqual(len(changed['Module1'].split('\n')), 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
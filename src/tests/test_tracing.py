@@ -0,0 +1,143 @@
+import unittest
+import sys
+import os
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+from unittest.mock import patch
+
+# Add src directory to path for importing modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import cli
+import diff
+import tracing
+
+
+class TestTracer(unittest.TestCase):
+    """Test the trace records"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, 'trace', 'trace.ndjson')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_get_trace_path(self):
+        with patch.dict(os.environ, {'GIT_XL_CACHE_DIR': self.temp_dir}):
+            self.assertEqual(tracing.get_trace_path('1'), os.path.join(self.temp_dir, 'trace.ndjson'))
+        for value in (None, '', '0', 'off'):
+            self.assertIsNone(tracing.get_trace_path(value))
+        self.assertEqual(tracing.get_trace_path('trace.ndjson'), os.path.abspath('trace.ndjson'))
+
+    def test_phases_are_exclusive(self):
+        with patch('time.perf_counter', side_effect=[0, 1, 2, 5, 6, 10]):
+            tracer = tracing.Tracer(self.path, 'diff')
+            with tracer.phase('extract'):
+                with tracer.phase('parse'):
+                    pass
+            record = tracer.get_record()
+        self.assertEqual(record['wall'], 10)
+        self.assertEqual({name: times['wall'] for name, times in record['phases'].items()},
+                         {'parse': 3, 'extract': 2, 'other': 5})
+
+    def test_session(self):
+        with tracing.session(self.path, 'diff', ['a.xlsm']) as tracer:
+            self.assertIs(tracing.current(), tracer)
+            tracing.count('cache_hits')
+            tracing.count('cache_hits', 2)
+            tracing.set_name('abc', 'Book1.xlsm')
+            tracing.add_workbook('/tmp/abc', 'abc', 100, 3, 0.5)
+        with self.assertRaises(KeyError):
+            with tracing.session(self.path, 'log'):
+                raise KeyError('no such commit')
+        self.assertIsNone(tracing.current())
+        first, second = tracing.read_records(self.path)
+        self.assertEqual(first['command'], 'diff')
+        self.assertEqual(first['args'], ['a.xlsm'])
+        self.assertEqual(first['counters'], {'cache_hits': 3})
+        self.assertEqual(first['workbooks'], [{'path': '/tmp/abc', 'object_id': 'abc', 'size': 100, 'modules': 3,
+                                               'seconds': 0.5, 'offloaded': False, 'name': 'Book1.xlsm'}])
+        self.assertEqual(second['error'], 'KeyError')
+
+    def test_tracing_off(self):
+        with tracing.session(None, 'diff') as tracer:
+            self.assertIsNone(tracer)
+            tracing.count('cache_hits')
+            with tracing.phase('parse'):
+                pass
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_format_stats(self):
+        records = [
+            {'command': 'diff', 'workbook': 'Book1.xlsm', 'wall': 2.0, 'cpu': 1.0,
+             'phases': {'parse': {'wall': 1.5, 'cpu': 0.8}, 'other': {'wall': 0.5, 'cpu': 0.2}},
+             'counters': {'cache_hits': 1, 'cache_misses': 3},
+             'workbooks': [{'path': '/tmp/x', 'object_id': 'abc', 'size': 100, 'modules': 2, 'seconds': 1.5}]},
+            {'command': 'log', 'wall': 0.5, 'cpu': 0.5, 'phases': {'git': {'wall': 0.5, 'cpu': 0.1}},
+             'counters': {}, 'workbooks': [{'path': '/tmp/y', 'object_id': 'def', 'name': 'Book2.xls', 'size': 10,
+                                            'modules': 1, 'seconds': 0.25}]},
+        ]
+        output = '\n'.join(tracing.format_stats(records))
+        self.assertIn('2 traced commands, 2.50 s in total', output)
+        self.assertRegex(output, r'diff +1 runs +2\.00 s wall')
+        self.assertRegex(output, r'parse +1\.50 s wall +800 ms cpu +60\.0%')
+        self.assertIn('cache hit rate       25.0%', output)
+        self.assertLess(output.index('Book1.xlsm'), output.index('Book2.xls'))
+        self.assertNotIn('Book2.xls', '\n'.join(tracing.format_stats(records, top=1)))
+
+
+class TestTracedDiff(unittest.TestCase):
+    """Test diffs and commands write trace records when tracing is on"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, 'trace.ndjson')
+        self.workbook = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Book1.xlsb')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    @patch('diff.get_git_config', return_value={})
+    def test_main(self, mock_get_git_config):
+        args = ['Book1.xlsb', '/dev/null', '.', '.', self.workbook, '.', '100644']
+        diff.main(args, out=BytesIO(), cache=diff.Cache(max_size=0))
+        self.assertFalse(os.path.exists(self.path))
+        with patch.dict(os.environ, {'GIT_XL_TRACE': self.path}):
+            self.assertEqual(diff.split_options(diff.resolve_options(args))[0]['trace'], self.path)
+            diff.main(args, out=BytesIO(), cache=diff.Cache(max_size=0))
+        record, = tracing.read_records(self.path)
+        self.assertEqual(record['workbook'], 'Book1.xlsb')
+        self.assertTrue({'read', 'parse', 'decompress', 'extract', 'diff', 'output'} <= set(record['phases']))
+        self.assertEqual(record['counters']['workbooks'], 1)
+        self.assertGreater(record['counters']['output_bytes'], 0)
+        workbook, = record['workbooks']
+        self.assertEqual((workbook['path'], workbook['size']), (self.workbook, os.path.getsize(self.workbook)))
+
+    @patch('diff.get_git_config', return_value={'diff.xl.trace': 'trace.ndjson'})
+    def test_config(self, mock_get_git_config):
+        args = ['Book1.xlsb', '/dev/null', '.', '.', self.workbook, '.', '100644']
+        with patch.dict(os.environ, {'GIT_XL_TRACE': ''}):
+            self.assertEqual(diff.split_options(diff.resolve_options(args))[0]['trace'],
+                             os.path.abspath('trace.ndjson'))
+        with patch.dict(os.environ, {'GIT_XL_TRACE': '0'}):
+            self.assertEqual(diff.split_options(diff.resolve_options(args))[0]['trace'], '')
+
+    @patch('diff.get_git_config', return_value={})
+    @patch('sys.stdout', new_callable=StringIO)
+    def test_stats_command(self, mock_stdout, mock_get_git_config):
+        with patch.dict(os.environ, {'GIT_XL_TRACE': self.path}):
+            with patch('diff.get_stdout', return_value=BytesIO()):
+                cli.CommandParser(['textconv', self.workbook]).execute()
+            record, = tracing.read_records(self.path)
+            self.assertEqual(record['command'], 'textconv')
+            cli.CommandParser(['stats', '--top=1']).execute()
+            self.assertIn('textconv          1 runs', mock_stdout.getvalue())
+            cli.CommandParser(['stats', '--clear']).execute()
+        self.assertFalse(os.path.exists(self.path))
+        cli.CommandParser(['stats', self.path]).execute()
+        self.assertIn(f'No trace file at {self.path}', mock_stdout.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
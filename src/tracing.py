@@ -0,0 +1,208 @@
+import os
+import time
+import threading
+from contextlib import contextmanager, nullcontext
+
+# GIT_XL_TRACE (or diff.xl.trace) is a file name, or one of these for the default file in the cache
+# directory; every traced command appends a JSON record per line to it
+ENABLED_VALUES = ('1', 'true', 'yes', 'on')
+DISABLED_VALUES = ('', '0', 'false', 'no', 'off')
+DEFAULT_TRACE_FILE = 'trace.ndjson'
+DEFAULT_TOP = 10
+
+# the daemon diffs in several threads at once, each traces its own command
+local = threading.local()
+
+
+def get_trace_path(value):
+    # None when tracing is off, the trace file made absolute otherwise (a daemon running in
+    # another directory has to write the same file)
+    if value is None or value.lower() in DISABLED_VALUES:
+        return None
+    if value.lower() in ENABLED_VALUES:
+        from cache import get_cache_dir
+        return os.path.join(get_cache_dir(), DEFAULT_TRACE_FILE)
+    return os.path.abspath(value)
+
+
+class Tracer:
+    # phase times are exclusive, i.e. without the time of the phases nested in them, so they add
+    # up to the time of the whole command; CPU time is that of the tracing thread
+
+    def __init__(self, path, command, args=()):
+        self.path = path
+        self.record = {'time': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()), 'pid': os.getpid(),
+                       'command': command, 'args': list(args)}
+        self.phases = {}
+        self.counters = {}
+        self.workbooks = []
+        # object id -> name of the workbook (its path in the repository)
+        self.names = {}
+        # [wall, cpu] of the nested phases, per open phase
+        self.stack = [[0.0, 0.0]]
+        self.started = time.perf_counter(), time.thread_time()
+
+    @contextmanager
+    def phase(self, name):
+        wall, cpu = time.perf_counter(), time.thread_time()
+        self.stack.append([0.0, 0.0])
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.thread_time() - cpu
+            nested_wall, nested_cpu = self.stack.pop()
+            totals = self.phases.setdefault(name, [0.0, 0.0])
+            totals[0] += wall - nested_wall
+            totals[1] += cpu - nested_cpu
+            self.stack[-1][0] += wall
+            self.stack[-1][1] += cpu
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def add_workbook(self, path, object_id, size, modules, seconds, offloaded=False):
+        self.workbooks.append({'path': path, 'object_id': object_id, 'size': size, 'modules': modules,
+                               'seconds': round(seconds, 6), 'offloaded': offloaded})
+
+    def get_record(self):
+        record = dict(self.record)
+        for workbook in self.workbooks:
+            name = self.names.get(workbook['object_id'])
+            if name:
+                workbook['name'] = name
+        wall, cpu = time.perf_counter() - self.started[0], time.thread_time() - self.started[1]
+        record['wall'] = round(wall, 6)
+        record['cpu'] = round(cpu, 6)
+        phases = dict(self.phases)
+        # the time outside of any phase
+        phases['other'] = [wall - self.stack[0][0], cpu - self.stack[0][1]]
+        record['phases'] = {name: {'wall': round(phase_wall, 6), 'cpu': round(phase_cpu, 6)}
+                            for name, (phase_wall, phase_cpu) in phases.items()}
+        record['counters'] = self.counters
+        record['workbooks'] = self.workbooks
+        return record
+
+    def write(self):
+        import json
+        line = json.dumps(self.get_record(), ensure_ascii=False) + '\n'
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            # a single append, so that records of concurrent commands do not interleave
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line)
+        except OSError:
+            # tracing never gets in the way of a diff
+            pass
+
+
+def current():
+    return getattr(local, 'tracer', None)
+
+
+@contextmanager
+def session(path, command, args=()):
+    # traces the command run in the block when path is set, the record is written at its end
+    if not path:
+        yield None
+        return
+    tracer = local.tracer = Tracer(path, command, args)
+    try:
+        yield tracer
+    except BaseException as e:
+        tracer.record['error'] = type(e).__name__
+        raise
+    finally:
+        local.tracer = None
+        tracer.write()
+
+
+def phase(name):
+    tracer = current()
+    return tracer.phase(name) if tracer else nullcontext()
+
+
+def count(name, value=1):
+    tracer = current()
+    if tracer:
+        tracer.count(name, value)
+
+
+def add_workbook(*args, **kwargs):
+    tracer = current()
+    if tracer:
+        tracer.add_workbook(*args, **kwargs)
+
+
+def set_name(object_id, name):
+    tracer = current()
+    if tracer:
+        tracer.names[object_id] = name
+
+
+def read_records(path):
+    # records of a trace file, lines cut short (e.g. by a full disk) are skipped
+    import json
+    records = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+    return records
+
+
+def format_seconds(seconds):
+    return f'{seconds * 1000:.0f} ms' if seconds < 1 else f'{seconds:.2f} s'
+
+
+def format_stats(records, top=DEFAULT_TOP):
+    # a summary of trace records: totals per command and phase, cache hits and the workbooks
+    # that took longest to extract
+    lines = []
+    commands = {}
+    phases = {}
+    counters = {}
+    workbooks = []
+    for record in records:
+        totals = commands.setdefault(record.get('command', '?'), [0, 0.0, 0.0])
+        totals[0] += 1
+        totals[1] += record.get('wall', 0)
+        totals[2] += record.get('cpu', 0)
+        for name, times in record.get('phases', {}).items():
+            totals = phases.setdefault(name, [0.0, 0.0])
+            totals[0] += times.get('wall', 0)
+            totals[1] += times.get('cpu', 0)
+        for name, value in record.get('counters', {}).items():
+            counters[name] = counters.get(name, 0) + value
+        for workbook in record.get('workbooks', []):
+            name = workbook.get('name') or record.get('workbook') or workbook.get('object_id') or workbook.get('path')
+            workbooks.append((workbook.get('seconds', 0), name, workbook))
+
+    total_wall = sum(wall for _, wall, _ in commands.values())
+    lines.append(f'{len(records)} traced commands, {format_seconds(total_wall)} in total')
+    lines.append('')
+    lines.append('Commands:')
+    for name, (runs, wall, cpu) in sorted(commands.items(), key=lambda item: -item[1][1]):
+        lines.append(f'  {name:<12} {runs:>6} runs  {format_seconds(wall):>10} wall  {format_seconds(cpu):>10} cpu')
+    if phases:
+        lines.append('')
+        lines.append('Phases:')
+        for name, (wall, cpu) in sorted(phases.items(), key=lambda item: -item[1][0]):
+            share = wall / total_wall * 100 if total_wall else 0
+            lines.append(f'  {name:<12} {format_seconds(wall):>10} wall  {format_seconds(cpu):>10} cpu  {share:5.1f}%')
+    if counters:
+        lines.append('')
+        lines.append('Counters:')
+        for name, value in sorted(counters.items()):
+            lines.append(f'  {name:<20} {value}')
+        lookups = counters.get('cache_hits', 0) + counters.get('cache_misses', 0)
+        if lookups:
+            lines.append(f'  {"cache hit rate":<20} {counters.get("cache_hits", 0) / lookups * 100:.1f}%')
+    if workbooks and top:
+        lines.append('')
+        lines.append('Slowest workbooks:')
+        for seconds, name, workbook in sorted(workbooks, key=lambda item: -item[0])[:top]:
+            lines.append(f'  {format_seconds(seconds):>10}  {workbook.get("size", 0):>12} bytes  '
+                         f'{workbook.get("modules", 0):>4} modules  {name}')
+    return lines